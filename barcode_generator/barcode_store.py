@@ -0,0 +1,162 @@
+# barcode_generator/barcode_store.py
+import os
+import struct
+
+import numpy as np
+
+from barcode_generator.bloom import BLOOM_FPR, BloomFilter
+from barcode_generator.hamming_index import HammingIndex, decode_array, encode_array
+
+MAGIC = b'BCSTORE1'
+VERSION = 1
+# magic, version, length, min_dist, seed (-1 = unseeded), count
+HEADER = struct.Struct('<8sIIIqQ')
+HEADER_SIZE = 64
+COUNT_OFFSET = HEADER.size - 8
+BASE_LOOKUP = np.full(256, 255, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    BASE_LOOKUP[_base] = _code
+
+
+def record_dtype(length):
+    """One uint32 per barcode up to 16-mers, uint64 up to 32-mers."""
+    if length <= 16:
+        return np.dtype('<u4')
+    if length <= 32:
+        return np.dtype('<u8')
+    raise ValueError(f"❌ Barcodes longer than 32 nt cannot be 2-bit packed into one word (got {length}).")
+
+
+def strings_to_codes(barcodes, length):
+    """List of barcode strings -> (N, length) uint8 code matrix."""
+    raw = np.frombuffer(''.join(barcodes).encode('ascii'), dtype=np.uint8)
+    codes = BASE_LOOKUP[raw].reshape(-1, length)
+    if (codes == 255).any():
+        raise ValueError("❌ Barcodes may only contain A, C, G and T.")
+    return codes
+
+
+class BarcodeStore:
+    """
+    Append-only binary barcode file.
+
+    A 64-byte header (magic, version, length, min_dist, seed, count) is
+    followed by one 2-bit packed record per barcode. Records are appended
+    first and `count` is rewritten afterwards, so a torn append is ignored on
+    the next open. The Hamming index and a Bloom filter over the records are
+    persisted next to the store as `<path>.idx.npz` and `<path>.bloom.npz`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx.npz'
+        self.bloom_path = path + '.bloom.npz'
+        with open(path, 'rb') as f:
+            magic, version, length, min_dist, seed, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"❌ Not a barcode store: {path}")
+        self.length = length
+        self.min_dist = min_dist
+        self.seed = None if seed < 0 else seed
+        self.count = count
+        self.dtype = record_dtype(length)
+
+    @classmethod
+    def create(cls, path, length=14, min_dist=2, seed=None):
+        record_dtype(length)
+        stored_seed = seed if isinstance(seed, int) and 0 <= seed < 2 ** 63 else -1
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, length, min_dist, stored_seed, 0).ljust(HEADER_SIZE, b'\0'))
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def values(self):
+        """Memory-mapped view of the packed records."""
+        if not self.count:
+            return np.empty(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER_SIZE, shape=(self.count,))
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        if not len(values):
+            return
+        with open(self.path, 'r+b') as f:
+            f.seek(HEADER_SIZE + self.count * self.dtype.itemsize)
+            f.write(values.tobytes())
+            f.flush()
+            self.count += len(values)
+            f.seek(COUNT_OFFSET)
+            f.write(struct.pack('<Q', self.count))
+
+    def barcodes(self, start=0, stop=None):
+        values = np.asarray(self.values[start:stop], dtype=np.uint64)
+        letters = np.frombuffer(b'ACGT', dtype=np.uint8)[decode_array(values, self.length)]
+        return [bc.decode() for bc in np.ascontiguousarray(letters).view(f'S{self.length}').ravel()]
+
+    def load_index(self, expected=None):
+        """
+        Load the persisted index, folding in records appended after it was
+        saved; rebuilds it from the records (vectorized) if missing.
+        """
+        values = np.asarray(self.values, dtype=np.uint64)
+        if os.path.exists(self.index_path):
+            index = HammingIndex.load(self.index_path)
+            if index.count <= self.count and index.min_dist == self.min_dist:
+                for value in values[index.count:].tolist():
+                    index.add(value)
+                return index
+        return HammingIndex.from_values(values, self.length, self.min_dist, expected)
+
+    def save_index(self, index):
+        index.save(self.index_path)
+
+    def load_bloom(self, capacity=None, fpr=BLOOM_FPR):
+        """
+        Load the persisted Bloom filter, rebuilding it with one `add_many` if it
+        is missing, out of date, or too small for `capacity`.
+        """
+        capacity = max(capacity or 0, self.count, 1)
+        if os.path.exists(self.bloom_path):
+            bloom = BloomFilter.load(self.bloom_path)
+            if bloom.count == self.count and bloom.capacity >= capacity:
+                return bloom
+        bloom = BloomFilter(capacity, fpr)
+        if self.count:
+            bloom.add_many(self.values)
+        return bloom
+
+    def save_bloom(self, bloom):
+        bloom.save(self.bloom_path)
+
+    def contains_many(self, barcodes):
+        """Probable membership for a list of barcode strings."""
+        if not barcodes:
+            return np.zeros(0, dtype=bool)
+        return self.load_bloom().contains_many(encode_array(strings_to_codes(barcodes, self.length)))
+
+    def export_text(self, path, start=0, stop=None):
+        """Write one barcode per line, the `barcode_list.txt` format."""
+        with open(path, 'w') as f:
+            for bc in self.barcodes(start, stop):
+                f.write(bc + '\n')
+
+    @classmethod
+    def import_text(cls, text_path, path, length=14, min_dist=2, seed=None):
+        """
+        Build a store from a one-barcode-per-line file. Barcodes closer than
+        min_dist to an earlier one are skipped; returns (store, n_skipped).
+        """
+        with open(text_path) as f:
+            barcodes = [line.strip() for line in f if len(line.strip()) == length]
+        values = encode_array(strings_to_codes(barcodes, length)) if barcodes else np.empty(0, np.uint64)
+
+        index = HammingIndex(length, min_dist, expected=max(len(values), 1))
+        keep = [value for value in values.tolist() if index.add_if_far(value)]
+
+        store = cls.create(path, length, min_dist, seed)
+        store.append(keep)
+        store.save_index(index)
+        return store, len(values) - len(keep)
@@ -0,0 +1,91 @@
+# barcode_generator/bloom.py
+import math
+
+import numpy as np
+
+from barcode_generator.hamming_index import encode_barcode
+
+# Default sizing: expected number of items and target false-positive rate
+BLOOM_CAPACITY = 1_000_000
+BLOOM_FPR = 1e-4
+
+_SEED_1 = np.uint64(0x9E3779B97F4A7C15)
+_SEED_2 = np.uint64(0xD1B54A32D192ED03)
+
+
+def optimal_size(capacity, fpr):
+    """(bits, hashes) minimising memory for `capacity` items at `fpr`."""
+    capacity = max(int(capacity), 1)
+    size = math.ceil(-capacity * math.log(fpr) / math.log(2) ** 2)
+    num_hashes = max(1, round(size / capacity * math.log(2)))
+    return size, num_hashes
+
+
+def _mix64(x):
+    """splitmix64 finaliser over a uint64 array (wrapping arithmetic)."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class BloomFilter:
+    """
+    Bloom filter over 2-bit encoded integer keys, sized from a target
+    capacity and false-positive rate.
+
+    The k probe positions come from double hashing, h1 + i*h2, computed for
+    a whole key array at once; bits are packed 8 per byte.
+    """
+
+    def __init__(self, capacity=BLOOM_CAPACITY, fpr=BLOOM_FPR, size=None, num_hashes=None):
+        default_size, default_hashes = optimal_size(capacity, fpr)
+        self.capacity = int(capacity)
+        self.size = int(size or default_size)
+        self.num_hashes = int(num_hashes or default_hashes)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            h1 = _mix64(keys + _SEED_1)
+            h2 = _mix64(keys + _SEED_2) | np.uint64(1)
+            steps = np.arange(self.num_hashes, dtype=np.uint64)
+            return (h1[:, None] + steps * h2[:, None]) % np.uint64(self.size)
+
+    def add_many(self, keys):
+        pos = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, pos >> np.uint64(3), (1 << (pos & np.uint64(7))).astype(np.uint8))
+        self.count += len(keys)
+
+    def contains_many(self, keys):
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        pos = self._positions(keys)
+        hit = (self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1
+        return hit.all(axis=1)
+
+    def add(self, item):
+        self.add_many([encode_barcode(item) if isinstance(item, str) else item])
+
+    def __contains__(self, item):
+        return bool(self.contains_many([encode_barcode(item) if isinstance(item, str) else item])[0])
+
+    def false_positive_rate(self):
+        """Current FPR estimated from the fraction of set bits."""
+        fill = int(np.unpackbits(self.bits)[:self.size].sum()) / self.size
+        return fill ** self.num_hashes
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array([self.capacity, self.size, self.num_hashes, self.count], dtype=np.int64),
+                     bits=self.bits)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            capacity, size, num_hashes, count = (int(x) for x in data['meta'])
+            bloom = cls(capacity, size=size, num_hashes=num_hashes)
+            bloom.bits = data['bits']
+        bloom.count = count
+        return bloom
@@ -0,0 +1,57 @@
+# barcode_generator/filters.py
+import numpy as np
+
+from barcode_generator.hamming_index import encode_barcode
+
+
+def homopolymer_mask(candidates, max_run=4):
+    """True for rows of an (N, length) code matrix with no run longer than max_run."""
+    same = (candidates[:, 1:] == candidates[:, :-1]).astype(np.int16)
+    if same.shape[1] < max_run:
+        return np.ones(len(candidates), dtype=bool)
+    runs = np.cumsum(np.pad(same, ((0, 0), (1, 0))), axis=1)
+    window = runs[:, max_run:] - runs[:, :-max_run]
+    return ~(window == max_run).any(axis=1)
+
+
+def gc_mask(candidates, gc_range):
+    gc = ((candidates == 1) | (candidates == 2)).sum(axis=1) / candidates.shape[1]
+    return (gc >= gc_range[0]) & (gc <= gc_range[1])
+
+
+def exclusion_mask(candidates, exclude):
+    """True for rows that contain none of the `exclude` subsequences."""
+    ok = np.ones(len(candidates), dtype=bool)
+    by_length = {}
+    for seq in exclude:
+        by_length.setdefault(len(seq), []).append(encode_barcode(seq))
+    for k, codes in by_length.items():
+        n_windows = candidates.shape[1] - k + 1
+        if n_windows < 1:
+            continue
+        windows = np.zeros((len(candidates), n_windows), dtype=np.uint64)
+        for j in range(k):
+            windows = (windows << np.uint64(2)) | candidates[:, j:j + n_windows].astype(np.uint64)
+        ok &= ~np.isin(windows, np.array(codes, dtype=np.uint64)).any(axis=1)
+    return ok
+
+
+def filter_batch(batch, max_homopolymer=4, gc_range=(0.0, 1.0), exclude=(), stats=None):
+    """
+    Combined homopolymer / GC-window / exclusion mask for a candidate batch.
+
+    Rejections are tallied into `stats` under 'homopolymer', 'gc' and
+    'excluded' when a stats dict is given.
+    """
+    stats = stats if stats is not None else {}
+    ok = homopolymer_mask(batch, max_homopolymer)
+    stats['homopolymer'] = stats.get('homopolymer', 0) + len(batch) - int(ok.sum())
+    if tuple(gc_range) != (0.0, 1.0):
+        passed = ok & gc_mask(batch, gc_range)
+        stats['gc'] = stats.get('gc', 0) + int(ok.sum() - passed.sum())
+        ok = passed
+    if exclude:
+        passed = ok & exclusion_mask(batch, exclude)
+        stats['excluded'] = stats.get('excluded', 0) + int(ok.sum() - passed.sum())
+        ok = passed
+    return ok
@@ -1,111 +1,279 @@
 import numpy as np
 import os
+import time
 from tqdm import tqdm
-import mmh3  # For hashing (pip install mmh3)
-from bitarray import bitarray  # For efficient bit storage (pip install bitarray)
+
+from barcode_generator.barcode_store import BarcodeStore
+from barcode_generator.bloom import BLOOM_FPR
+from barcode_generator.filters import filter_batch
+from barcode_generator.hamming_index import HammingIndex, encode_array, encode_barcode
+from barcode_generator.sharded import generate_sharded
+from scripts.profiling import phase, stage
 
 # Constants
 BASES = np.array(['A', 'C', 'G', 'T'])
 BASE_TO_INT = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
 INT_TO_BASE = {v: k for k, v in BASE_TO_INT.items()}
-CHECKPOINT_FILE = "barcode_checkpoint.txt"
-
-# Bloom filter parameters
-BLOOM_SIZE = 10_000_000  # size of bit array (adjust as needed)
-NUM_HASHES = 7  # number of hash functions
-
-
-class BloomFilter:
-    def __init__(self, size=BLOOM_SIZE, num_hashes=NUM_HASHES):
-        self.size = size
-        self.num_hashes = num_hashes
-        self.bit_array = bitarray(size)
-        self.bit_array.setall(False)
-
-    def _hashes(self, item):
-        item_bytes = item.encode('utf-8')
-        for i in range(self.num_hashes):
-            yield mmh3.hash(item_bytes, i) % self.size
+CHECKPOINT_FILE = "barcode_checkpoint.txt"  # legacy text checkpoint, imported on first run
+STORE_FILE = "barcode_store.bcs"
+BATCH_SIZE = 100_000  # candidates drawn per vectorized batch
 
-    def add(self, item):
-        for pos in self._hashes(item):
-            self.bit_array[pos] = True
-
-    def __contains__(self, item):
-        return all(self.bit_array[pos] for pos in self._hashes(item))
-
-
-def has_no_4_consecutive_same(bc):
+def has_no_4_consecutive_same(bc, max_run=4):
     run_length = 1
     for i in range(1, len(bc)):
         if bc[i] == bc[i - 1]:
             run_length += 1
-            if run_length > 4:
+            if run_length > max_run:
                 return False
         else:
             run_length = 1
     return True
 
 
-def load_checkpoint(filename):
-    barcodes = []
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            for line in f:
-                bc = line.strip()
-                if len(bc) == 14:
-                    barcodes.append(bc)
-        print(f"[⏩] Resumed from checkpoint with {len(barcodes)} barcodes")
-    return barcodes
-
+def gc_fraction(bc):
+    return (bc.count('G') + bc.count('C')) / len(bc)
 
-def append_to_checkpoint(filename, buffer):
-    with open(filename, 'a') as f:
-        for bc in buffer:
-            f.write(bc + '\n')
 
+def report_stats(stats):
+    seconds = max(stats['seconds'], 1e-9)
+    candidates = max(stats['candidates'], 1)
+    print(
+        f"[📊] {stats['candidates']} candidates in {seconds:.2f}s "
+        f"({stats['candidates'] / seconds:,.0f} candidates/s, {stats['accepted'] / seconds:,.0f} accepted/s), "
+        f"acceptance rate {stats['accepted'] / candidates:.2%}"
+    )
+    print(
+        f"     rejected: homopolymer={stats['homopolymer']} gc={stats['gc']} "
+        f"excluded={stats['excluded']} duplicate={stats.get('duplicate', 0)} too_close={stats['too_close']}"
+    )
 
-def generate_barcodes(n_barcodes, length=14, min_dist=2, checkpoint_every=200):
-    barcodes = load_checkpoint(CHECKPOINT_FILE)
-    bloom = BloomFilter()
 
-    # Rebuild bloom filter with loaded barcodes
-    for bc in barcodes:
-        bloom.add(bc)
+def open_store(store_path, length, min_dist, seed, expected, bloom_fpr=BLOOM_FPR):
+    """Open (or create) the barcode store, its distance index and Bloom filter."""
+    if os.path.exists(store_path):
+        store = BarcodeStore(store_path)
+        if (store.length, store.min_dist) != (length, min_dist):
+            raise ValueError(
+                f"❌ {store_path} holds length={store.length}, min_dist={store.min_dist} barcodes; "
+                f"requested length={length}, min_dist={min_dist}."
+            )
+        print(f"[⏩] Resumed from {store_path} with {len(store)} barcodes")
+    elif os.path.exists(CHECKPOINT_FILE):
+        # Migrate a text checkpoint; older runs only rejected exact repeats
+        store, skipped = BarcodeStore.import_text(CHECKPOINT_FILE, store_path, length, min_dist, seed)
+        print(f"[⏩] Imported {len(store)} barcodes from {CHECKPOINT_FILE} into {store_path}")
+        if skipped:
+            print(f"[⚠️] Dropped {skipped} checkpoint barcodes closer than min_dist={min_dist}")
+    else:
+        store = BarcodeStore.create(store_path, length, min_dist, seed)
+    return store, store.load_index(expected), store.load_bloom(expected, bloom_fpr)
 
-    pbar = tqdm(total=n_barcodes, initial=len(barcodes), desc="Generating barcodes")
-    buffer = []
 
-    while len(barcodes) < n_barcodes:
-        candidate_array = np.random.randint(0, 4, size=length)
+def _scalar_candidates(rng, length, max_homopolymer, gc_range, exclude, stats, bloom, check_stall):
+    """Original one-at-a-time path, kept as the baseline for benchmarking."""
+    while True:
+        check_stall()
+        candidate_array = rng.integers(0, 4, size=length)
         candidate = ''.join(BASES[candidate_array])
+        stats['candidates'] += 1
 
-        if not has_no_4_consecutive_same(candidate):
+        if not has_no_4_consecutive_same(candidate, max_homopolymer):
+            stats['homopolymer'] += 1
+            continue
+        if not gc_range[0] <= gc_fraction(candidate) <= gc_range[1]:
+            stats['gc'] += 1
+            continue
+        if any(seq in candidate for seq in exclude):
+            stats['excluded'] += 1
+            continue
+        value = encode_barcode(candidate)
+        if value in bloom:
+            stats['duplicate'] += 1
             continue
+        yield value
+
+
+def _batched_candidates(rng, length, max_homopolymer, gc_range, exclude, stats, batch_size, remaining,
+                        index, bloom, check_stall):
+    """
+    Draw (batch_size, length) code matrices, filter them as arrays, drop
+    probable repeats with one Bloom lookup and screen the rest against the
+    index's frozen base layer in one vectorized call. `check_stall` runs
+    before every batch, so draws that never reach the caller still count.
+    """
+    while True:
+        check_stall()
+        # Shrink the last batches to what the observed acceptance rate needs
+        rate = stats['accepted'] / stats['candidates'] if stats['accepted'] else 1.0
+        size = min(batch_size, max(1024, int(remaining() / rate * 1.05)))
+        with phase('rng'):
+            batch = rng.integers(0, 4, size=(size, length), dtype=np.uint8)
+        stats['candidates'] += size
+
+        with phase('filters'):
+            ok = filter_batch(batch, max_homopolymer, gc_range, exclude, stats)
+            values = encode_array(batch[ok])
+        with phase('bloom'):
+            seen = bloom.contains_many(values)
+        stats['duplicate'] += int(seen.sum())
+        values = values[~seen]
+        with phase('index'):
+            far = index.far_from_base(values)
+        stats['too_close'] += len(values) - int(far.sum())
+        yield from values[far].tolist()
+
 
-        # Check Bloom filter (probabilistic membership)
-        if candidate in bloom:
-            continue  # Probably too close to existing barcode
+def _generate_parallel(store, index, bloom, n_barcodes, length, min_dist, workers, seed,
+                       max_homopolymer, gc_range, exclude, stats):
+    start = time.perf_counter()
+    existing = np.asarray(store.values, dtype=np.uint64)
 
-        # Accept candidate
-        barcodes.append(candidate)
-        bloom.add(candidate)
-        buffer.append(candidate)
-        pbar.update(1)
+    with phase('sharded'):
+        values = generate_sharded(
+            n_barcodes, length, min_dist, workers=workers, seed=seed, existing=existing,
+            max_homopolymer=max_homopolymer, gc_range=gc_range, exclude=exclude,
+            on_round=store.append, stats=stats, index=index,
+        )
+    with phase('checkpoint'):
+        store.save_index(HammingIndex.from_values(values, length, min_dist))
+        bloom.add_many(values[len(existing):])
+        store.save_bloom(bloom)
 
-        if len(buffer) >= checkpoint_every:
-            append_to_checkpoint(CHECKPOINT_FILE, buffer)
-            buffer.clear()
+    stats['accepted'] = len(values) - len(existing)
+    stats['seconds'] = time.perf_counter() - start
 
-    if buffer:
-        append_to_checkpoint(CHECKPOINT_FILE, buffer)
 
-    pbar.close()
+def generate_barcodes(
+    n_barcodes,
+    length=14,
+    min_dist=2,
+    checkpoint_every=10_000,
+    max_stall=1_000_000,
+    batch_size=BATCH_SIZE,
+    max_homopolymer=4,
+    gc_range=(0.0, 1.0),
+    exclude=(),
+    seed=None,
+    workers=1,
+    store_path=STORE_FILE,
+    export_file=None,
+    bloom_fpr=BLOOM_FPR,
+    return_stats=False,
+):
+    """
+    Generate `n_barcodes` barcodes with pairwise Hamming distance >= min_dist.
+
+    Candidates are drawn `batch_size` at a time and the homopolymer, GC-window
+    and `exclude` filters run as array operations; only survivors reach the
+    distance index. `batch_size=None` uses the original one-at-a-time loop.
+
+    `workers > 1` (or `workers=None` for all cores) shards generation across a
+    process pool; output is reproducible for a given (seed, workers).
+
+    Accepted barcodes are appended to the binary store at `store_path` every
+    `checkpoint_every` barcodes, and the index is saved beside it so a rerun
+    resumes without rehashing. `export_file` also writes the text list.
+
+    A Bloom filter sized for `n_barcodes` at `bloom_fpr` drops exact repeats
+    before the distance check and is persisted with the store.
+    """
+    gc_range = tuple(float(x) for x in gc_range)
+    exclude = [seq.upper() for seq in exclude]
+    with stage('generate_barcodes') as record:
+        with phase('open_store'):
+            store, index, bloom = open_store(store_path, length, min_dist, seed, n_barcodes, bloom_fpr)
+        stats = dict.fromkeys(['candidates', 'homopolymer', 'gc', 'excluded', 'duplicate', 'too_close', 'accepted'], 0)
+
+        if workers != 1:
+            _generate_parallel(store, index, bloom, n_barcodes, length, min_dist, workers, seed,
+                               max_homopolymer, gc_range, exclude, stats)
+        else:
+            _generate_serial(store, index, bloom, n_barcodes, length, min_dist, checkpoint_every, max_stall,
+                             batch_size, max_homopolymer, gc_range, exclude, seed, stats)
+
+        report_stats(stats)
+        if export_file:
+            with phase('export'):
+                store.export_text(export_file)
+            print(f"Barcode list written to: {export_file}")
+        if record is not None:
+            record['rows_in'] += stats['candidates']
+            record['rows_out'] += stats['accepted']
+            record['barcode_stats'] = dict(stats)
+
+    barcodes = store.barcodes(0, n_barcodes)
+    if return_stats:
+        return barcodes, stats
     return barcodes
 
 
+def _generate_serial(store, index, bloom, n_barcodes, length, min_dist, checkpoint_every, max_stall,
+                     batch_size, max_homopolymer, gc_range, exclude, seed, stats):
+    accepted = len(store)
+    if accepted and seed is not None:
+        # A resumed run must not replay the draws that filled the store
+        seed = np.random.SeedSequence(seed, spawn_key=(accepted,))
+    rng = np.random.default_rng(seed)
+    # Every draw since the last acceptance counts, whichever check rejected it
+    last_accepted_at = stats['candidates']
+
+    def check_stall():
+        if stats['candidates'] - last_accepted_at >= max_stall:
+            raise RuntimeError(
+                f"❌ No barcode accepted in {max_stall} draws; the {length}-mer space is "
+                f"saturated at min_dist={min_dist} ({accepted} barcodes)."
+            )
+
+    if batch_size:
+        candidates = _batched_candidates(
+            rng, length, max_homopolymer, gc_range, exclude, stats, batch_size,
+            remaining=lambda: n_barcodes - accepted, index=index, bloom=bloom, check_stall=check_stall,
+        )
+    else:
+        candidates = _scalar_candidates(rng, length, max_homopolymer, gc_range, exclude, stats, bloom,
+                                        check_stall)
+
+    pbar = tqdm(total=n_barcodes, initial=accepted, desc="Generating barcodes")
+    buffer = []
+    start = time.perf_counter()
+
+    # Flush what was accepted even when the space saturates mid-run
+    try:
+        for value in candidates if accepted < n_barcodes else ():
+            # Reject candidates within min_dist - 1 mismatches of an accepted barcode
+            if not index.add_if_far(value, check_base=not batch_size):
+                stats['too_close'] += 1
+                check_stall()
+                continue
+
+            # Accept candidate
+            last_accepted_at = stats['candidates']
+            accepted += 1
+            stats['accepted'] += 1
+            buffer.append(value)
+            pbar.update(1)
+
+            if len(buffer) >= checkpoint_every:
+                with phase('checkpoint'):
+                    store.append(buffer)
+                    bloom.add_many(buffer)
+                buffer.clear()
+            if accepted >= n_barcodes:
+                break
+    finally:
+        with phase('checkpoint'):
+            if buffer:
+                store.append(buffer)
+                bloom.add_many(buffer)
+            if stats['accepted']:
+                store.save_index(index)
+                store.save_bloom(bloom)
+        pbar.close()
+    stats['seconds'] = time.perf_counter() - start
+
+
 def main():
-    generate_barcodes(n_barcodes=1000000)
+    generate_barcodes(n_barcodes=1000000, export_file='barcode_list.txt')
 
 
 if __name__ == "__main__":
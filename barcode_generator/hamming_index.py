@@ -0,0 +1,268 @@
+# barcode_generator/hamming_index.py
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+BASE_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+
+# Upper bound on the number of partition tables kept in memory
+MAX_TABLES = 10
+
+
+def encode_barcode(seq):
+    """Pack a DNA string into an int, 2 bits per base, first base in the high bits."""
+    value = 0
+    for base in seq:
+        value = (value << 2) | BASE_CODES[base]
+    return value
+
+
+def encode_array(matrix):
+    """Pack an (N, length) uint8 matrix of base codes into uint64 values."""
+    values = np.zeros(matrix.shape[0], dtype=np.uint64)
+    for j in range(matrix.shape[1]):
+        values = (values << np.uint64(2)) | matrix[:, j].astype(np.uint64)
+    return values
+
+
+def low_bit_mask(length):
+    """0b0101... mask selecting the low bit of every 2-bit base slot."""
+    mask = 0
+    for _ in range(length):
+        mask = (mask << 2) | 1
+    return mask
+
+
+def segment_sizes(length, n_segments):
+    size, extra = divmod(length, n_segments)
+    return [size + 1 if i < extra else size for i in range(n_segments)]
+
+
+def partition_plan(length, max_mismatches, expected):
+    """
+    Pick (n_segments, n_keyed) for the pigeonhole index.
+
+    Two barcodes within `max_mismatches` of each other split into
+    `max_mismatches + n_keyed` segments agree exactly on at least `n_keyed`
+    segments, so indexing every `n_keyed`-combination of segments finds them.
+    The plan minimises lookups plus expected bucket scans.
+    """
+    if max_mismatches <= 0:
+        return 1, 1
+
+    best = None
+    for n_keyed in range(1, length - max_mismatches + 1):
+        n_segments = max_mismatches + n_keyed
+        n_tables = comb(n_segments, n_keyed)
+        if n_tables > MAX_TABLES and best is not None:
+            break
+        key_bases = sum(sorted(segment_sizes(length, n_segments))[:n_keyed])
+        cost = n_tables * (1 + expected / 4 ** key_bases)
+        if best is None or cost < best[0]:
+            best = (cost, n_segments, n_keyed)
+    return best[1], best[2]
+
+
+class HammingIndex:
+    """
+    Pigeonhole index over 2-bit packed barcodes.
+
+    `is_far(value)` answers "is every indexed barcode at least `min_dist`
+    mismatches away" with a handful of dict lookups instead of a scan.
+
+    Values live in two layers: a frozen base of per-table sorted key/value
+    arrays (what `save`/`load` persist) and dict tables for values added since
+    the last `compact()`.
+    """
+
+    def __init__(self, length, min_dist, expected=1_000_000, key_masks=None):
+        self.length = length
+        self.min_dist = max(min_dist, 1)
+        self.low_mask = low_bit_mask(length)
+        self.count = 0
+
+        if key_masks is None:
+            n_segments, n_keyed = partition_plan(length, self.min_dist - 1, expected)
+            segment_masks = []
+            start = 0
+            for size in segment_sizes(length, n_segments):
+                shift = 2 * (length - start - size)
+                segment_masks.append(((1 << (2 * size)) - 1) << shift)
+                start += size
+            key_masks = [sum(c) for c in combinations(segment_masks, n_keyed)]
+
+        self.key_masks = [int(mask) for mask in key_masks]
+        self.tables = [{} for _ in self.key_masks]
+        self.pending = []
+        self.base_values = np.empty(0, dtype=np.uint64)
+        self.base_keys = [np.empty(0, dtype=np.uint64) for _ in self.key_masks]
+        self.base_sorted = [np.empty(0, dtype=np.uint64) for _ in self.key_masks]
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        for mask, table in zip(self.key_masks, self.tables):
+            key = value & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = value
+            elif isinstance(bucket, list):
+                bucket.append(value)
+            else:
+                table[key] = [bucket, value]
+        self.pending.append(value)
+        self.count += 1
+
+    def is_far(self, value, check_base=True):
+        low_mask = self.low_mask
+        min_dist = self.min_dist
+        for mask, table in zip(self.key_masks, self.tables):
+            bucket = table.get(value & mask)
+            if bucket is None:
+                continue
+            if not isinstance(bucket, list):
+                bucket = (bucket,)
+            for other in bucket:
+                x = value ^ other
+                if ((x | (x >> 1)) & low_mask).bit_count() < min_dist:
+                    return False
+
+        if check_base and len(self.base_values):
+            return bool(self.far_from_base(np.array([value], dtype=np.uint64))[0])
+        return True
+
+    def add_if_far(self, value, check_base=True):
+        if self.is_far(value, check_base):
+            self.add(value)
+            return True
+        return False
+
+    def far_from_base(self, values):
+        """Vectorized check of many values against the frozen base layer only."""
+        values = np.asarray(values, dtype=np.uint64)
+        far = np.ones(len(values), dtype=bool)
+        if not len(self.base_values):
+            return far
+
+        for mask, keys, sorted_values in zip(self.key_masks, self.base_keys, self.base_sorted):
+            probe = values & np.uint64(mask)
+            lo = keys.searchsorted(probe, 'left')
+            hi = keys.searchsorted(probe, 'right')
+            hits = hi - lo
+            if not hits.any():
+                continue
+            row = np.repeat(np.arange(len(values)), hits)
+            pos = np.repeat(lo - np.cumsum(hits) + hits, hits) + np.arange(hits.sum())
+            close = hamming_array(values[row], sorted_values[pos], self.length) < self.min_dist
+            far[row[close]] = False
+        return far
+
+    def compact(self):
+        """Fold the dict layer into the sorted base arrays."""
+        if not self.pending:
+            return
+        self.base_values = np.concatenate([self.base_values, np.array(self.pending, dtype=np.uint64)])
+        self._sort_base()
+        self.tables = [{} for _ in self.key_masks]
+        self.pending = []
+
+    def _sort_base(self):
+        for t, mask in enumerate(self.key_masks):
+            keys = self.base_values & np.uint64(mask)
+            order = np.argsort(keys, kind='stable')
+            self.base_keys[t] = keys[order]
+            self.base_sorted[t] = self.base_values[order]
+
+    @classmethod
+    def from_values(cls, values, length, min_dist, expected=None):
+        """Index values already known to respect min_dist, without dict inserts."""
+        values = np.asarray(values, dtype=np.uint64)
+        index = cls(length, min_dist, expected=max(expected or 0, len(values), 1))
+        index.base_values = values.copy()
+        index.count = len(values)
+        index._sort_base()
+        return index
+
+    def save(self, path):
+        """Persist the base layer; keys are recomputed from values on load."""
+        self.compact()
+        dtype = np.uint32 if self.length <= 16 else np.uint64
+        arrays = {'meta': np.array([self.length, self.min_dist], dtype=np.int64),
+                  'key_masks': np.array(self.key_masks, dtype=np.uint64),
+                  'values': self.base_values.astype(dtype)}
+        for t in range(len(self.key_masks)):
+            arrays[f'sorted_{t}'] = self.base_sorted[t].astype(dtype)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            length, min_dist = (int(x) for x in data['meta'])
+            index = cls(length, min_dist, key_masks=data['key_masks'].tolist())
+            index.base_values = data['values'].astype(np.uint64)
+            index.base_sorted = [data[f'sorted_{t}'].astype(np.uint64) for t in range(len(index.key_masks))]
+        index.base_keys = [values & np.uint64(mask) for mask, values in zip(index.key_masks, index.base_sorted)]
+        index.count = len(index.base_values)
+        return index
+
+
+def decode_array(values, length):
+    """Unpack uint64 values into an (N, length) uint8 matrix of base codes."""
+    values = np.asarray(values, dtype=np.uint64)
+    shifts = np.arange(2 * (length - 1), -1, -2, dtype=np.uint64)
+    return ((values[:, None] >> shifts) & np.uint64(3)).astype(np.uint8)
+
+
+def popcount(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def hamming_array(a, b, length):
+    """Element-wise Hamming distance between two arrays of packed barcodes."""
+    x = np.asarray(a, dtype=np.uint64) ^ np.asarray(b, dtype=np.uint64)
+    return popcount((x | (x >> np.uint64(1))) & np.uint64(low_bit_mask(length)))
+
+
+def find_close_pairs(values, length, min_dist):
+    """
+    Vectorized all-pairs search: index arrays (i, j), i < j, of barcodes that
+    are fewer than `min_dist` mismatches apart.
+
+    Uses the same pigeonhole keys as HammingIndex, but sorts each key column
+    and compares neighbours within equal-key runs instead of building dicts.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    index = HammingIndex(length, min_dist, expected=len(values))
+    found = []
+    for mask in index.key_masks:
+        keys = values & np.uint64(mask)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        offset = 1
+        while offset < len(values):
+            same = sorted_keys[offset:] == sorted_keys[:-offset]
+            if not same.any():
+                break
+            i = order[:-offset][same]
+            j = order[offset:][same]
+            close = hamming_array(values[i], values[j], length) < index.min_dist
+            found.append(np.stack([np.minimum(i[close], j[close]), np.maximum(i[close], j[close])]))
+            offset += 1
+
+    if not found:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    pairs = np.unique(np.concatenate(found, axis=1), axis=1)
+    return pairs[0].astype(np.int64), pairs[1].astype(np.int64)
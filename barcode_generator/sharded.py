@@ -0,0 +1,165 @@
+# barcode_generator/sharded.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from barcode_generator.filters import filter_batch
+from barcode_generator.hamming_index import HammingIndex, encode_array, find_close_pairs
+
+SHARD_BATCH_SIZE = 50_000
+
+
+def generate_shard(n, length, min_dist, seed_seq, recent=(), max_homopolymer=4, gc_range=(0.0, 1.0),
+                   exclude=(), batch_size=SHARD_BATCH_SIZE, max_stall=1_000_000):
+    """
+    Worker: `n` packed barcodes that pass the filters, are at least min_dist
+    from the pool's existing barcodes (the index set by _init_worker) and
+    from `recent` (barcodes accepted in earlier rounds), and respect min_dist
+    among themselves, drawn from this shard's own RNG stream. Returns the
+    values and the shard's rejection tallies.
+    """
+    rng = np.random.default_rng(seed_seq)
+    base = _worker.get('index')
+    recent = HammingIndex.from_values(recent, length, min_dist) if len(recent) else None
+    index = HammingIndex(length, min_dist, expected=n)
+    stats = dict.fromkeys(['candidates', 'homopolymer', 'gc', 'excluded', 'too_close'], 0)
+    accepted = []
+    stall = 0
+
+    while len(accepted) < n:
+        # Draw only what the observed acceptance rate says is still needed
+        rate = len(accepted) / stats['candidates'] if accepted else 1.0
+        size = min(batch_size, max(1024, int((n - len(accepted)) / rate * 1.05)))
+        batch = rng.integers(0, 4, size=(size, length), dtype=np.uint8)
+        stats['candidates'] += size
+        ok = filter_batch(batch, max_homopolymer, gc_range, exclude, stats)
+        values = encode_array(batch[ok])
+        far = np.ones(len(values), dtype=bool)
+        for layer in (base, recent):
+            if layer is not None:
+                far &= layer.far_from_base(values)
+        stats['too_close'] += len(values) - int(far.sum())
+        stall += len(values) - int(far.sum())
+        for value in values[far].tolist():
+            if index.add_if_far(value, check_base=False):
+                accepted.append(value)
+                stall = 0
+                if len(accepted) >= n:
+                    break
+            else:
+                stats['too_close'] += 1
+                stall += 1
+        if stall >= max_stall:
+            raise RuntimeError(
+                f"❌ Shard stalled after {len(accepted)} barcodes; the {length}-mer space is "
+                f"saturated at min_dist={min_dist}."
+            )
+
+    return np.array(accepted, dtype=np.uint64), stats
+
+
+# Index of the barcodes that existed before the run, set once per worker by _init_worker
+_worker = {}
+
+
+def _init_worker(index):
+    _worker['index'] = index
+
+
+def _generate_shard(args):
+    return generate_shard(*args)
+
+
+def interleave(shards):
+    """Round-robin shards into one priority order: s0[0], s1[0], ..., s0[1], ..."""
+    if not shards:
+        return np.empty(0, dtype=np.uint64)
+    values = np.concatenate(shards)
+    rank = np.concatenate([np.arange(len(shard)) * len(shards) + w for w, shard in enumerate(shards)])
+    return values[np.argsort(rank, kind='stable')]
+
+
+def merge_shards(existing, shards, length, min_dist):
+    """
+    Merge independently generated shards into `existing`.
+
+    Barcodes are ranked existing-first, then shards round-robin. Any pair
+    closer than min_dist is resolved by dropping the lower-ranked barcode,
+    unless that barcode's partner was already dropped.
+    """
+    values = np.concatenate([np.asarray(existing, dtype=np.uint64), interleave(shards)])
+    first, second = find_close_pairs(values, length, min_dist)
+
+    dropped = set()
+    for i, j in sorted(zip(first.tolist(), second.tolist()), key=lambda pair: pair[1]):
+        if i not in dropped:
+            dropped.add(j)
+
+    keep = np.ones(len(values), dtype=bool)
+    keep[list(dropped)] = False
+    return values[keep], len(dropped)
+
+
+def generate_sharded(n_barcodes, length=14, min_dist=2, workers=None, seed=None, existing=(),
+                     max_homopolymer=4, gc_range=(0.0, 1.0), exclude=(), on_round=None, stats=None,
+                     index=None):
+    """
+    Generate packed barcodes across a process pool.
+
+    The root SeedSequence is spawned into one child stream per worker and
+    round, so output is reproducible for a given (seed, workers). The number
+    of `existing` barcodes is mixed into the root so a resumed run does not
+    replay the streams that produced them.
+
+    Workers screen candidates against the sorted arrays of `index` (the
+    distance index of `existing`, built if not given), sent to each worker
+    once, and against the barcodes accepted in earlier rounds, so only
+    conflicts between shards of the same round are left to the merge. Each
+    round draws the deficit scaled by the share of drawn barcodes the
+    previous round kept. Rounds repeat until the target is reached;
+    `on_round` is called with the newly accepted values after each round.
+    Worker tallies and cross-shard drops (as 'too_close') are summed into
+    `stats`.
+    """
+    stats = stats if stats is not None else {}
+    workers = workers or os.cpu_count()
+    existing = np.asarray(existing, dtype=np.uint64)
+    values = existing
+    root = np.random.SeedSequence(seed, spawn_key=(len(values),))
+    if seed is None:
+        print(f"[🎲] Sharded run entropy: {root.entropy} (pass as seed to reproduce)")
+    if index is None:
+        index = HammingIndex.from_values(existing, length, min_dist)
+    else:
+        index.compact()
+    index = index if index.count else None
+
+    keep_rate = 1.0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,)) as pool:
+        while len(values) < n_barcodes:
+            deficit = n_barcodes - len(values)
+            # Over-draw by what cross-shard drops took last round, so one more round rarely follows
+            per_worker = int(deficit * 1.05 / keep_rate / workers) + 16
+            recent = values[len(existing):]
+            jobs = [
+                (per_worker, length, min_dist, child, recent, max_homopolymer, gc_range, exclude)
+                for child in root.spawn(workers)
+            ]
+            shards = []
+            for shard, shard_stats in pool.map(_generate_shard, jobs):
+                shards.append(shard)
+                for key, count in shard_stats.items():
+                    stats[key] = stats.get(key, 0) + count
+
+            before = len(values)
+            merged, n_dropped = merge_shards(values, shards, length, min_dist)
+            stats['too_close'] = stats.get('too_close', 0) + n_dropped
+            drawn = sum(len(shard) for shard in shards)
+            keep_rate = max((drawn - n_dropped) / max(drawn, 1), 0.05)
+            values = merged[:n_barcodes]
+            print(f"[🔀] Merged {workers} shards: +{len(values) - before} barcodes, {n_dropped} cross-shard conflicts dropped")
+            if on_round is not None:
+                on_round(values[before:])
+
+    return values
@@ -0,0 +1,208 @@
+# benchmarks/barcode_benchmark.py
+"""
+Runs generate_barcodes over a grid of lengths, target counts, distance
+constraints and strategies, reports throughput, rejection breakdown, memory
+and checkpoint cost, and verifies every resulting set's true minimum Hamming
+distance.
+
+    python -m benchmarks.barcode_benchmark --lengths 12 14 16 --counts 100000 1000000 --min-dists 2 3
+    python -m benchmarks.barcode_benchmark --counts 5000000 --strategies batched sharded --workers 8
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from barcode_generator.barcode_store import BarcodeStore
+from barcode_generator.bloom import BLOOM_FPR
+from barcode_generator.generate_barcodes_numpy_bloom import generate_barcodes
+from barcode_generator.hamming_index import find_close_pairs, hamming_array
+from benchmarks.pipeline_benchmark import git_commit, read_history
+from scripts.profiling import profiling
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'barcode_history.jsonl')
+STRATEGIES = ('batched', 'scalar', 'sharded')
+FPR_PROBES = 1_000_000
+SAMPLE_CHUNK = 2_000_000
+
+
+def strategy_options(strategy, workers):
+    """generate_barcodes keyword arguments for each strategy."""
+    return {
+        'batched': {},
+        'scalar': {'batch_size': None},
+        'sharded': {'workers': workers},
+    }[strategy]
+
+
+def min_distance_indexed(values, length, min_dist):
+    """
+    Exact check through the pigeonhole index: (violating pairs, true minimum
+    distance). The minimum is reported as `min_dist` when some pair sits
+    exactly there, or as '>min_dist' when none does.
+    """
+    i, _ = find_close_pairs(values, length, min_dist)
+    if len(i):
+        return len(i), None
+    at_limit, _ = find_close_pairs(values, length, min_dist + 1)
+    return 0, min_dist if len(at_limit) else f'>{min_dist}'
+
+
+def min_distance_sampled(values, length, sample=1000, seed=0):
+    """Minimum distance from `sample` random barcodes to every other barcode in the set."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(values), min(sample, len(values)), replace=False)
+    best = length
+    for row in rows.tolist():
+        for lo in range(0, len(values), SAMPLE_CHUNK):
+            block = values[lo:lo + SAMPLE_CHUNK]
+            distance = hamming_array(block, values[row], length)
+            if lo <= row < lo + len(block):
+                distance[row - lo] = length
+            best = min(best, int(distance.min()))
+    return best
+
+
+def measured_fpr(store_path, values, length, probes=FPR_PROBES, seed=0):
+    """False-positive rate of the persisted Bloom filter on random non-members."""
+    bloom = BarcodeStore(store_path).load_bloom(len(values))
+    rng = np.random.default_rng(seed)
+    candidates = rng.integers(0, 4 ** length, probes, dtype=np.uint64)
+    members = np.sort(values)
+    pos = np.minimum(members.searchsorted(candidates), len(members) - 1)
+    outside = candidates[members[pos] != candidates]
+    return float(bloom.contains_many(outside).mean()) if len(outside) else 0.0
+
+
+def run_case(length, count, min_dist, strategy, checkpoint_every, bloom_fpr, args):
+    workdir = tempfile.mkdtemp(prefix='barcode_bench_', dir=args.workdir)
+    store_path = os.path.join(workdir, 'barcodes.bcs')
+    cwd = os.getcwd()
+    os.chdir(workdir)   # keeps a legacy barcode_checkpoint.txt in the caller's directory from being imported
+    try:
+        out = sys.stdout if args.verbose else open(os.devnull, 'w')
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            with profiling(os.path.join(workdir, 'run_report.json')) as report:
+                _, stats = generate_barcodes(
+                    count, length=length, min_dist=min_dist, checkpoint_every=checkpoint_every,
+                    seed=args.seed, store_path=store_path, bloom_fpr=bloom_fpr, return_stats=True,
+                    **strategy_options(strategy, args.workers),
+                )
+        if out is not sys.stdout:
+            out.close()
+        record = report.stages['generate_barcodes']
+        values = np.asarray(BarcodeStore(store_path).values, dtype=np.uint64)
+
+        start = time.perf_counter()
+        if args.verify == 'indexed':
+            violations, true_min = min_distance_indexed(values, length, min_dist)
+        elif args.verify == 'sampled':
+            true_min = min_distance_sampled(values, length, args.sample, args.seed)
+            violations = int(true_min < min_dist)
+        else:
+            violations, true_min = None, None
+        verify_s = time.perf_counter() - start
+        fpr = measured_fpr(store_path, values, length, seed=args.seed) if args.fpr else None
+        store_mb = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir)) / 2**20
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    seconds = max(stats['seconds'], 1e-9)
+    # Bloom hits are true repeats plus false positives; split them with the measured rate
+    checked = stats['candidates'] - stats['homopolymer'] - stats['gc'] - stats['excluded']
+    false_positives = min(fpr * checked, stats.get('duplicate', 0)) if fpr is not None else None
+    phases = {name: phase['wall_s'] for name, phase in record['phases'].items()}
+    return {
+        'length': length,
+        'count': count,
+        'min_dist': min_dist,
+        'strategy': strategy,
+        'checkpoint_every': checkpoint_every,
+        'bloom_fpr': bloom_fpr,
+        'wall_s': record['wall_s'],
+        'candidates_per_s': stats['candidates'] / seconds,
+        'accepted_per_s': stats['accepted'] / seconds,
+        'acceptance': stats['accepted'] / max(stats['candidates'], 1),
+        'rejected': {key: stats.get(key, 0) for key in ('homopolymer', 'gc', 'excluded', 'duplicate', 'too_close')},
+        'bloom_measured_fpr': fpr,
+        'bloom_false_positives_est': false_positives,
+        'peak_rss_mb': record['peak_rss_mb'],
+        'store_mb': store_mb,
+        'checkpoint_s': phases.get('checkpoint', 0.0),
+        'phases_s': phases,
+        'violations': violations,
+        'true_min_distance': true_min,
+        'verify': args.verify,
+        'verify_s': verify_s,
+    }
+
+
+def print_result(result):
+    rejected = result['rejected']
+    print(
+        f"L={result['length']:<2} n={result['count']:>9,} d>={result['min_dist']} {result['strategy']:<8} "
+        f"{result['wall_s']:7.2f}s  {result['candidates_per_s']:>11,.0f} cand/s  {result['accepted_per_s']:>11,.0f} acc/s  "
+        f"homopolymer={rejected['homopolymer']} gc={rejected['gc']} bloom={rejected['duplicate']} "
+        f"too_close={rejected['too_close']}  {result['peak_rss_mb']:6.0f} MB  ckpt {result['checkpoint_s']:.2f}s  "
+        f"min d={result['true_min_distance']} ({result['verify']} {result['verify_s']:.1f}s)"
+        + (f"  bloom fpr={result['bloom_measured_fpr']:.2e} (~{result['bloom_false_positives_est']:.0f} false positives)"
+           if result['bloom_measured_fpr'] is not None else '')
+    )
+    if result['violations']:
+        print(f"  ❌ {result['violations']} pairs closer than min_dist={result['min_dist']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lengths', type=int, nargs='+', default=[14])
+    parser.add_argument('--counts', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--min-dists', type=int, nargs='+', default=[2])
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=['batched', 'sharded'])
+    parser.add_argument('--workers', type=int, default=None, help="processes for the sharded strategy")
+    parser.add_argument('--checkpoint-every', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--bloom-fpr', type=float, nargs='+', default=[BLOOM_FPR])
+    parser.add_argument('--scalar-max', type=int, default=200_000, help="skip the scalar loop above this count")
+    parser.add_argument('--verify', choices=('indexed', 'sampled', 'none'), default='indexed')
+    parser.add_argument('--sample', type=int, default=1000, help="barcodes checked by --verify sampled")
+    parser.add_argument('--fpr', action='store_true', help="measure the Bloom filter's false-positive rate")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--verbose', action='store_true', help="show the generator's own output")
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-record', action='store_true', help="do not append to the history")
+    args = parser.parse_args()
+
+    results = []
+    grid = itertools.product(args.lengths, args.counts, args.min_dists, args.strategies,
+                             args.checkpoint_every, args.bloom_fpr)
+    for length, count, min_dist, strategy, checkpoint_every, bloom_fpr in grid:
+        if strategy == 'scalar' and count > args.scalar_max:
+            print(f"L={length:<2} n={count:>9,} d>={min_dist} scalar   skipped (above --scalar-max)")
+            continue
+        result = run_case(length, count, min_dist, strategy, checkpoint_every, bloom_fpr, args)
+        print_result(result)
+        results.append(result)
+
+    if not args.no_record and results:
+        previous = len(read_history(args.history))
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, 'a') as f:
+            for result in results:
+                f.write(json.dumps(dict(result, time=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=git_commit(),
+                                        host=platform.node(), numpy=np.__version__)) + '\n')
+        print(f"\n{len(results)} results appended to: {args.history} ({previous} earlier)")
+    if any(result['violations'] for result in results):
+        sys.exit("❌ Some barcode sets violate their min_dist.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/dedup_benchmark.py
+"""
+Times scripts.dedup.Deduplicator against the original row-by-row loop on a
+synthetic library and checks that both give identical tables.
+
+    python -m benchmarks.dedup_benchmark --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts.dedup import Deduplicator, merge_mutation_labels
+
+
+def synthetic_library(n_rows, n_mutations=12, duplicate_fraction=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(n_rows * (1 - duplicate_fraction)))
+    bases = np.frombuffer(b'ACGT', dtype='S1')
+    pool = bases[rng.integers(0, 4, (n_unique, 43))].view('S43').ravel().astype(str).astype(object)
+    # Skewed reuse so some sequences have many copies
+    picks = np.minimum(rng.zipf(1.3, n_rows) - 1, n_unique - 1)
+    picks[:n_unique] = rng.permutation(n_unique)[:min(n_unique, n_rows)]
+    rng.shuffle(picks)
+    seqs = pool[picks]
+    seqs[rng.random(n_rows) < 0.001] = np.nan
+
+    mutations = np.array([f"{a}{i}{b}" for i, (a, b) in enumerate(zip('RGTKLAVMSEPQ', 'CAKRPTLIWYDN'))], dtype=object)
+    return pd.DataFrame({
+        'Frag_numb': [f"{'ABCDEFGHIJKL'[m]}{i}" for i, m in enumerate(rng.integers(0, n_mutations, n_rows))],
+        'mutation': mutations[rng.integers(0, n_mutations, n_rows)],
+        'Chromosome': rng.choice(['chr1', 'chr2', 'chrX'], n_rows),
+        'Location': rng.integers(0, 10**8, n_rows).astype(str),
+        'fetched_sequence': seqs,
+    })
+
+
+def reference_deduplicate(df):
+    """The original iterrows implementation from deduplicate_sequences."""
+    df = df.copy()
+    df.columns = [col.lower() for col in df.columns]
+    duplicated_mask = df.duplicated(subset="fetched_sequence", keep=False)
+    df["duplicated"] = duplicated_mask.map({True: "yes", False: "no"})
+    cols = df.columns.tolist()
+    cols.insert(1, cols.pop(cols.index("duplicated")))
+    df = df[cols]
+
+    seen = {}
+    filtered_out_rows = []
+    deduplicated_rows = []
+    for _, row in df.iterrows():
+        seq = row["fetched_sequence"]
+        seq = seq if isinstance(seq, str) else None
+        if seq not in seen:
+            seen[seq] = row.copy()
+            deduplicated_rows.append(seen[seq])
+        else:
+            seen[seq]["mutation"] = merge_mutation_labels(seen[seq]["mutation"], row["mutation"])
+            row["kept_frag_numb"] = seen[seq]["frag_numb"]
+            filtered_out_rows.append(row)
+    return pd.DataFrame(deduplicated_rows), pd.DataFrame(filtered_out_rows)
+
+
+def same_table(a, b):
+    return a.reset_index(drop=True).astype(str).equals(b.reset_index(drop=True).astype(str))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--chunksize', type=int, default=None, help="also feed the library in chunks of this size")
+    parser.add_argument('--skip-reference', action='store_true', help="skip the (slow) original loop")
+    args = parser.parse_args()
+
+    df = synthetic_library(args.rows)
+    print(f"{len(df)} rows, {df['fetched_sequence'].nunique()} unique sequences")
+
+    start = time.perf_counter()
+    dedup = Deduplicator()
+    dedup.feed(df)
+    kept, removed = dedup.frames()
+    vectorized = time.perf_counter() - start
+    print(f"vectorized: {vectorized:.2f}s ({len(df) / vectorized:,.0f} rows/s)")
+
+    if args.chunksize:
+        chunked = Deduplicator()
+        start = time.perf_counter()
+        for lo in range(0, len(df), args.chunksize):
+            chunked.feed(df.iloc[lo:lo + args.chunksize])
+        chunk_kept, chunk_removed = chunked.frames()
+        print(f"chunked ({args.chunksize}): {time.perf_counter() - start:.2f}s, "
+              f"identical: {same_table(kept, chunk_kept) and same_table(removed, chunk_removed)}")
+
+    if not args.skip_reference:
+        start = time.perf_counter()
+        ref_kept, ref_removed = reference_deduplicate(df)
+        reference = time.perf_counter() - start
+        print(f"row loop:   {reference:.2f}s ({len(df) / reference:,.0f} rows/s)")
+        print(f"speed-up:   {reference / vectorized:.1f}x")
+        print(f"identical:  {same_table(kept, ref_kept) and same_table(removed, ref_removed)}")
+
+
+if __name__ == "__main__":
+    main()
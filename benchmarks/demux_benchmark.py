@@ -0,0 +1,155 @@
+# benchmarks/demux_benchmark.py
+"""
+Times scripts.demux on synthetic reads from a synthetic oligo library and
+checks every read's assignment against the oligo it was drawn from.
+
+    python -m benchmarks.demux_benchmark --oligos 100000 --reads 10000000 --workers 8
+    python -m benchmarks.demux_benchmark --error-rate 0.01 --shift 2 --max-shift 2
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from barcode_generator.generate_barcodes_numpy_bloom import generate_barcodes
+from scripts.demux import ReadLayout, demultiplex, demux_windows, fastq_windows, open_index
+from scripts.fragment_generation import LEFT_PBS, PROTO_CONST
+
+BASES = np.frombuffer(b'ACGT', dtype=np.uint8)
+WRITE_CHUNK = 1_000_000
+
+
+def synthetic_library(path, n_oligos, length, min_dist, seed):
+    """Oligo table with frag_numb and barcode columns; barcodes at least `min_dist` apart."""
+    workdir = os.path.dirname(path)
+    with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        barcodes = generate_barcodes(n_oligos, length=length, min_dist=min_dist, seed=seed,
+                                     store_path=os.path.join(workdir, 'barcodes.bcs'))
+    pd.DataFrame({'frag_numb': [f'A{i}' for i in range(n_oligos)], 'barcode': barcodes}).to_csv(path, sep='\t', index=False)
+    return barcodes
+
+
+def synthetic_reads(path, barcodes, n_reads, read_length, error_rate, n_rate, max_shift, seed):
+    """
+    FASTQ of reads LEFT_PBS + barcode + PROTO_CONST + random bases, drawn
+    from the oligos with a skewed (Zipf) abundance. Each base is substituted
+    with probability `error_rate` or read as N with `n_rate`; reads start up
+    to `max_shift` bases early or late. Returns the source oligo of every read.
+    """
+    rng = np.random.default_rng(seed)
+    length = len(barcodes[0])
+    codes = BASES.searchsorted(np.frombuffer(''.join(barcodes).encode(), dtype=np.uint8)).reshape(-1, length)
+    truth = np.empty(n_reads, dtype=np.int64)
+    prefix = np.frombuffer(LEFT_PBS.encode(), dtype=np.uint8)
+    suffix = np.frombuffer(PROTO_CONST.encode(), dtype=np.uint8)
+    with open(path, 'wb') as f:
+        for lo in range(0, n_reads, WRITE_CHUNK):
+            n = min(WRITE_CHUNK, n_reads - lo)
+            source = np.minimum(rng.zipf(1.5, n) - 1, len(barcodes) - 1)
+            source = rng.permutation(len(barcodes))[source]
+            truth[lo:lo + n] = source
+            shift = rng.integers(-max_shift, max_shift + 1, n) if max_shift else np.zeros(n, dtype=np.int64)
+            template = np.concatenate([BASES[rng.integers(0, 4, max_shift)], prefix,
+                                       np.zeros(length, dtype=np.uint8), suffix,
+                                       BASES[rng.integers(0, 4, read_length + 2 * max_shift)]])
+            reads = np.tile(template, (n, 1))
+            start = len(prefix) + max_shift
+            reads[:, start:start + length] = BASES[codes[source]]
+            reads = reads[np.arange(n)[:, None], (max_shift - shift)[:, None] + np.arange(read_length)]
+            errors = rng.random(reads.shape) < error_rate
+            reads[errors] = BASES[(BASES.searchsorted(reads[errors]) + rng.integers(1, 4, errors.sum())) % 4]
+            reads[rng.random(reads.shape) < n_rate] = ord('N')
+
+            # '@r' / sequence / '+' / quality lines, laid out as one byte matrix
+            records = np.full((n, 2 * read_length + 7), ord('I'), dtype=np.uint8)
+            records[:, :3] = np.frombuffer(b'@r\n', dtype=np.uint8)
+            records[:, 3:3 + read_length] = reads
+            records[:, 3 + read_length:6 + read_length] = np.frombuffer(b'\n+\n', dtype=np.uint8)
+            records[:, -1] = ord('\n')
+            f.write(records.tobytes())
+    return truth
+
+
+def check_assignments(fastq, oligo_file, truth, args):
+    """(correct, wrong, unassigned) reads from a single-process pass over the FASTQ."""
+    index, _ = open_index(oligo_file, max_mismatches=args.mismatches)
+    layout = ReadLayout(index.length, max_shift=args.max_shift)
+    correct = wrong = unassigned = 0
+    lo = 0
+    for window in fastq_windows(fastq, layout.start, layout.width):
+        rows, _, _ = demux_windows(window, index, layout)
+        expected = truth[lo:lo + len(rows)]
+        assigned = rows >= 0
+        correct += int((rows[assigned] == expected[assigned]).sum())
+        wrong += int((rows[assigned] != expected[assigned]).sum())
+        unassigned += int((~assigned).sum())
+        lo += len(rows)
+    return correct, wrong, unassigned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--oligos', type=int, default=100_000)
+    parser.add_argument('--reads', type=int, default=5_000_000)
+    parser.add_argument('--length', type=int, default=14, help="barcode length")
+    parser.add_argument('--min-dist', type=int, default=3)
+    parser.add_argument('--read-length', type=int, default=75)
+    parser.add_argument('--error-rate', type=float, default=0.005, help="substitutions per base")
+    parser.add_argument('--n-rate', type=float, default=0.001, help="N calls per base")
+    parser.add_argument('--shift', type=int, default=0, help="reads start up to this many bases off")
+    parser.add_argument('--max-shift', type=int, default=0, help="realignment window passed to demultiplex")
+    parser.add_argument('--mismatches', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--gzip', action='store_true', help="compress the FASTQ first")
+    parser.add_argument('--no-check', action='store_true', help="skip the per-read accuracy pass")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='demux_bench_', dir=args.workdir)
+    try:
+        oligo_file = os.path.join(workdir, 'library.txt')
+        fastq = os.path.join(workdir, 'reads.fastq')
+        start = time.perf_counter()
+        barcodes = synthetic_library(oligo_file, args.oligos, args.length, args.min_dist, args.seed)
+        truth = synthetic_reads(fastq, barcodes, args.reads, args.read_length, args.error_rate,
+                                args.n_rate, args.shift, args.seed + 1)
+        if args.gzip:
+            os.system(f"gzip -1 {fastq}")
+            fastq += '.gz'
+        print(f"Synthetic library of {args.oligos:,} oligos and {args.reads:,} reads in "
+              f"{time.perf_counter() - start:.1f}s ({os.path.getsize(fastq) / 2**20:.0f} MB FASTQ)")
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+            open_index(oligo_file, max_mismatches=args.mismatches)
+        print(f"Index built in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+            counts, summary = demultiplex(fastq, oligo_file, max_mismatches=args.mismatches,
+                                          max_shift=args.max_shift, workers=args.workers)
+        seconds = time.perf_counter() - start
+        print(f"Demultiplexed in {seconds:.1f}s: {args.reads / seconds * 60 / 1e6:,.1f}M reads/min")
+        print(summary.to_string(index=False, float_format="%.2f"))
+
+        expected = np.bincount(truth, minlength=args.oligos)
+        print(f"Counts within 1% of truth for {np.mean(np.abs(counts['reads'] - expected) <= 0.01 * expected + 1):.2%} of oligos")
+        if not args.no_check:
+            correct, wrong, unassigned = check_assignments(fastq, oligo_file, truth, args)
+            print(f"Per read: {correct / args.reads:.3%} correct, {wrong / args.reads:.4%} wrong, "
+                  f"{unassigned / args.reads:.3%} unassigned")
+            if wrong > 0.001 * args.reads:
+                sys.exit("❌ More than 0.1% of reads were assigned to the wrong oligo.")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# benchmarks/pipeline_benchmark.py
+"""
+Runs the file-based pipeline on a synthetic genome and synthetic guide libraries
+at several sizes, and appends per-step timings to a history file so hot-path
+regressions show up against earlier runs.
+
+    python -m benchmarks.pipeline_benchmark --rows 10000 100000 1000000
+    python -m benchmarks.pipeline_benchmark --rows 100000 --compare --fail-over 1.25
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts.profiling import profiling, stage
+from scripts.table_io import intermediate_file
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'pipeline_history.jsonl')
+SITE_LENGTH = 23      # crRNA/DNA site, PAM included
+GUIDE_LENGTH = 20     # bases of the crRNA that can carry mismatches
+LINE_WIDTH = 60
+COMPLEMENT = np.frombuffer(bytes.maketrans(b'ACGT', b'TGCA'), dtype=np.uint8)
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def parse_mix(text):
+    """'1:0.3,2:0.4' -> {1: 0.3, 2: 0.4}, normalised to sum to 1."""
+    mix = {int(k): float(v) for k, v in (part.split(':') for part in text.split(','))}
+    total = sum(mix.values())
+    return {k: v / total for k, v in mix.items()}
+
+
+def synthetic_genome(path, n_chroms=4, chrom_length=5_000_000, seed=0):
+    """Random A/C/G/T chromosomes written as a FASTA with 60-base lines; returns {name: uint8 array}."""
+    rng = np.random.default_rng(seed)
+    chroms = {}
+    with open(path, 'wb') as f:
+        for i in range(n_chroms):
+            name = f'chr{i + 1}'
+            seq = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, chrom_length)]
+            chroms[name] = seq
+            f.write(f'>{name}\n'.encode())
+            full = chrom_length // LINE_WIDTH * LINE_WIDTH
+            lines = np.empty((full // LINE_WIDTH, LINE_WIDTH + 1), dtype=np.uint8)
+            lines[:, :LINE_WIDTH] = seq[:full].reshape(-1, LINE_WIDTH)
+            lines[:, LINE_WIDTH] = ord('\n')
+            f.write(lines.tobytes())
+            if full < chrom_length:
+                f.write(seq[full:].tobytes() + b'\n')
+    return chroms
+
+
+def mutation_names(n):
+    rng = np.random.default_rng(n)
+    names = set()
+    while len(names) < n:
+        a, b = rng.choice(list(AMINO_ACIDS), 2, replace=False)
+        names.add(f'{a}{rng.integers(2, 1000)}{b}')
+    return sorted(names)
+
+
+def synthetic_libraries(input_dir, chroms, n_rows, n_libraries=8, duplicate_rate=0.3,
+                        mismatch_mix=None, bulge_rate=0.1, seed=0):
+    """
+    Write `n_libraries` Cas-OFFinder style guide libraries with `n_rows` sites
+    in total. A `duplicate_rate` share of rows repeat an earlier site (so
+    dedup has work), mismatches follow `mismatch_mix` and `bulge_rate` of
+    rows carry a 1-nt bulge. Each library starts with a 1-mismatch,
+    bulge-free site so every mutation gets a variant.
+    """
+    rng = np.random.default_rng(seed)
+    mismatch_mix = mismatch_mix or {1: 0.2, 2: 0.3, 3: 0.3, 4: 0.2}
+    os.makedirs(input_dir, exist_ok=True)
+
+    names = list(chroms)
+    n_unique = max(1, int(n_rows * (1 - duplicate_rate)))
+    site_chrom = rng.integers(0, len(names), n_unique)
+    site_loc = rng.integers(100, np.array([len(chroms[n]) for n in names])[site_chrom] - 100)
+    site_strand = rng.integers(0, 2, n_unique)
+    picks = np.r_[np.arange(n_unique), rng.integers(0, n_unique, n_rows - n_unique)]
+    rng.shuffle(picks)
+    chrom, loc, minus = site_chrom[picks], site_loc[picks], site_strand[picks] == 1
+
+    dna = np.empty((n_rows, SITE_LENGTH), dtype=np.uint8)
+    for c, name in enumerate(names):
+        rows = np.flatnonzero(chrom == c)
+        dna[rows] = chroms[name][loc[rows, None] + np.arange(SITE_LENGTH)]
+    dna[minus] = COMPLEMENT[dna[minus][:, ::-1]]
+
+    mismatches = rng.choice(list(mismatch_mix), n_rows, p=list(mismatch_mix.values()))
+    bulge = rng.random(n_rows) < bulge_rate
+    library = rng.integers(0, n_libraries, n_rows)
+    first = np.unique(library, return_index=True)[1]
+    mismatches[first], bulge[first] = 1, False
+
+    # Substitute `mismatches` random guide positions with a different base
+    crrna = dna.copy()
+    crrna[:, GUIDE_LENGTH:] = ord('N')
+    positions = np.argsort(rng.random((n_rows, GUIDE_LENGTH)), axis=1)
+    codes = np.zeros(256, dtype=np.uint8)
+    codes[list(b'ACGT')] = np.arange(4)
+    for j in range(max(mismatch_mix)):
+        rows = np.flatnonzero(mismatches > j)
+        cols = positions[rows, j]
+        shifted = (codes[crrna[rows, cols]] + rng.integers(1, 4, len(rows))) % 4
+        crrna[rows, cols] = np.frombuffer(b'ACGT', dtype=np.uint8)[shifted]
+
+    frame = pd.DataFrame({
+        'Bulge_Type': np.where(bulge, 'DNA', 'X'),
+        'crRNA': crrna.view(f'S{SITE_LENGTH}').ravel().astype(str),
+        'DNA': dna.view(f'S{SITE_LENGTH}').ravel().astype(str),
+        'Chromosome': np.array(names)[chrom],
+        'Location': loc,
+        'Direction': np.where(minus, '-', '+'),
+        'Mismatches': mismatches,
+        'Bulge_Size': bulge.astype(int),
+    })
+    for i, mutation in enumerate(mutation_names(n_libraries)):
+        part = frame[library == i].reset_index(drop=True)
+        part.insert(0, 'ID', np.arange(len(part)))
+        part.to_csv(os.path.join(input_dir, f'lib_{mutation}_synthetic.txt'), sep='\t', index=False)
+
+
+def synthetic_barcodes(path, n, length=14, seed=0):
+    """A fixed-width pool of `n` random barcodes."""
+    rng = np.random.default_rng(seed)
+    pool = np.empty((n, length + 1), dtype=np.uint8)
+    pool[:, :length] = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, (n, length))]
+    pool[:, length] = ord('\n')
+    with open(path, 'wb') as f:
+        f.write(pool.tobytes())
+
+
+def pipeline_steps(workdir, engine='native', cache=False, qc=False):
+    """(name, callable) for each step, wired to the synthetic files in `workdir`."""
+    from scripts.combine_libraries import combine_libraries
+    from scripts.clean_combined_library import clean_combined_library
+    from scripts.bedtools_fetching import fetch_sequences_with_bedtools
+    from scripts.dedup import deduplicate_sequences
+    from scripts.variant_frag import print_single_mismatch
+    from scripts.fragment_generation import generate_fragments
+    from scripts.oligo_qc import qc_library
+
+    interm = os.path.join(workdir, 'intermediate_files')
+
+    def path(name):
+        return intermediate_file(name, interm)
+
+    oligo_file = os.path.join(workdir, 'synthetic_oligos.txt')
+    steps = [
+        ('combine', lambda: combine_libraries(os.path.join(workdir, 'Input_libraries'), interm, prompt=False)),
+        ('clean', lambda: clean_combined_library(path('1a_combined_library_messy'), path('2a_combined_library_cleaned'))),
+        ('fetch', lambda: fetch_sequences_with_bedtools(
+            path('2a_combined_library_cleaned'), os.path.join(workdir, 'genome.fa'),
+            path('3a_cleaned_file_with_sequences'), engine=engine,
+            cache_dir=os.path.join(interm, 'sequence_cache') if cache else None)),
+        ('dedup', lambda: deduplicate_sequences(
+            path('3a_cleaned_file_with_sequences'), path('4a_deduplicated_file_with_sequences'),
+            path('4b_deduplicated_removed_entries'), confirm=False)),
+        ('variants', lambda: print_single_mismatch(
+            path('4a_deduplicated_file_with_sequences'), path('5a_pre_barcode_plus_variants'), select='first')),
+        ('fragments', lambda: generate_fragments(
+            path('5a_pre_barcode_plus_variants'), os.path.join(workdir, 'barcodes.txt'), oligo_file,
+            build='benchmark')),
+    ]
+    if qc:
+        steps.append(('qc', lambda: qc_library(oligo_file)))
+    return steps
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(n_rows, args):
+    """Generate inputs for `n_rows` sites, run every step under the profiler and return its history entry."""
+    workdir = tempfile.mkdtemp(prefix=f'pipeline_bench_{n_rows}_', dir=args.workdir)
+    start = time.perf_counter()
+    chroms = synthetic_genome(os.path.join(workdir, 'genome.fa'), args.chroms, args.chrom_length, args.seed)
+    synthetic_libraries(os.path.join(workdir, 'Input_libraries'), chroms, n_rows, args.libraries,
+                        args.duplicate_rate, parse_mix(args.mismatch_mix), args.bulge_rate, args.seed)
+    # A different stream from the genome's, or the barcodes would be slices of chr1
+    synthetic_barcodes(os.path.join(workdir, 'barcodes.txt'), int(n_rows * 1.5) + 10_000, seed=args.seed + 1)
+    setup = time.perf_counter() - start
+    print(f"\n{n_rows:,} rows: synthetic inputs in {setup:.1f}s ({workdir})")
+
+    report_file = os.path.join(workdir, 'run_report.json')
+    cwd = os.getcwd()
+    os.chdir(workdir)   # bedtools temp files are written relative to the working directory
+    try:
+        with profiling(report_file) as report:
+            for name, step in pipeline_steps(workdir, args.engine, args.cache, args.qc):
+                out = sys.stdout if args.verbose else open(os.devnull, 'w')
+                with contextlib.redirect_stdout(out), stage(name):
+                    step()
+                if out is not sys.stdout:
+                    out.close()
+                record = report.stages[name]
+                print(f"  {name:<10} {record['wall_s']:8.2f}s  {record['peak_rss_mb']:8.0f} MB peak")
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = {
+        name: {key: record[key] for key in ('wall_s', 'cpu_s', 'child_cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out', 'rows_per_s')}
+        for name, record in report.as_dict()['stages'].items()
+    }
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'rows': n_rows,
+        'config': {key: getattr(args, key) for key in
+                   ('libraries', 'duplicate_rate', 'mismatch_mix', 'bulge_rate', 'engine', 'cache', 'seed')},
+        'setup_s': setup,
+        'stages': stages,
+    }
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(entry, history, window=5, fail_over=None):
+    """
+    Print each step's wall time against the median of the last `window`
+    comparable runs (same host, rows and config). Returns the steps slower
+    than `fail_over` times that median.
+    """
+    previous = [old for old in history
+                if (old['host'], old['rows'], old['config']) == (entry['host'], entry['rows'], entry['config'])][-window:]
+    if not previous:
+        print("  no earlier comparable runs")
+        return []
+    slower = []
+    for name, record in entry['stages'].items():
+        times = [old['stages'][name]['wall_s'] for old in previous if name in old['stages']]
+        if not times:
+            continue
+        ratio = record['wall_s'] / max(float(np.median(times)), 1e-9)
+        flag = fail_over is not None and ratio > fail_over
+        print(f"  {name:<10} {record['wall_s']:8.2f}s vs median {np.median(times):8.2f}s  {ratio:5.2f}x{'  ⚠️' if flag else ''}")
+        if flag:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--libraries', type=int, default=8, help="synthetic input files (mutations)")
+    parser.add_argument('--duplicate-rate', type=float, default=0.3)
+    parser.add_argument('--mismatch-mix', default='1:0.2,2:0.3,3:0.3,4:0.2', help="mismatches:share, ...")
+    parser.add_argument('--bulge-rate', type=float, default=0.1)
+    parser.add_argument('--chroms', type=int, default=4)
+    parser.add_argument('--chrom-length', type=int, default=5_000_000)
+    parser.add_argument('--engine', choices=('native', 'bedtools'), default='native')
+    parser.add_argument('--cache', action='store_true', help="fetch through the sequence cache")
+    parser.add_argument('--qc', action='store_true', help="also time the QC step")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help="where to put the temporary run directories")
+    parser.add_argument('--keep', action='store_true', help="keep the synthetic inputs and outputs")
+    parser.add_argument('--verbose', action='store_true', help="show the steps' own output")
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-record', action='store_true', help="do not append to the history")
+    parser.add_argument('--compare', action='store_true', help="compare with earlier runs in the history")
+    parser.add_argument('--window', type=int, default=5, help="earlier runs to take the median of")
+    parser.add_argument('--fail-over', type=float, default=None, help="exit 1 if a step is this many times slower")
+    args = parser.parse_args()
+
+    history = read_history(args.history)
+    regressions = []
+    for n_rows in args.rows:
+        entry = run_size(n_rows, args)
+        if args.compare or args.fail_over:
+            regressions += [f"{name} @ {n_rows:,}" for name in compare(entry, history, args.window, args.fail_over)]
+        if not args.no_record:
+            os.makedirs(os.path.dirname(args.history), exist_ok=True)
+            with open(args.history, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    if not args.no_record:
+        print(f"\nResults appended to: {args.history}")
+    if regressions:
+        sys.exit(f"❌ Slower than {args.fail_over}x the recent median: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,7 @@
 # main.py
-from scripts.combine_libraries import combine_libraries
-from scripts.clean_combined_library import clean_combined_library
-from scripts.bedtools_fetching import fetch_sequences_with_bedtools
-from scripts.dedup import deduplicate_sequences
-from scripts.fragment_generation import generate_fragments
-from scripts.variant_frag import print_single_mismatch
-
-def main():
-    # print(" Step 1: Combining library files...")
-    # combine_libraries()
-
-    # print("\n Step 2: Cleaning combined library...")
-    # clean_combined_library()
-
-    # print("\n Step 3: Fetching sequences with bedtools...")
-    # fetch_sequences_with_bedtools(fasta_file='hg38.fa')
-
-    # print("\n Step 4: Deduplicating sequences...")
-    # deduplicate_sequences()
-
-    print("\n Step 5: Printing entries with 1 or 0 mismatch and 0 bulges...")
-    print_single_mismatch()
-
-    print("\n Step 6: adding constant regions & barcodes...")
-    generate_fragments()
+import sys
 
+from scripts.cli import main
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -1,35 +1,66 @@
 import csv
+from itertools import islice
+
+from scripts.barcode_collisions import INDEX_CHUNK, CollisionIndex, barcode_length, collision_free_barcodes, report_skipped
+from scripts.barcode_pool import BarcodePool, LibraryFingerprint, PoolView, take_next
+from scripts.fragment_generation import CONSTANT_REGIONS, build_name
 
 def add_barcodes_to_library(
     barcodes_file='barcode_list.txt',
     input_file='combined_library_cleaned.txt',
-    output_file='combined_library_with_barcodes.txt'
+    output_file='combined_library_with_barcodes.txt',
+    skip_collisions=True,
+    build=None
 ):
-    # Read barcodes and reverse the list
-    with open(barcodes_file, 'r') as f:
-        barcodes = [line.strip() for line in f if line.strip()]
-    barcodes.reverse()
+    # The library is streamed twice: once to count rows (and index its
+    # fragments), once to write each row with its barcode appended
+    pool = BarcodePool(barcodes_file)
+    build = build or build_name(output_file)
+    fingerprint = LibraryFingerprint()
+
+    with open(input_file, 'r', newline='') as infile:
+        reader = csv.reader(infile, delimiter='\t')
+        header = next(reader)
+        lowered = [col.lower() for col in header]
+        fetched = lowered.index('fetched_sequence') if 'fetched_sequence' in lowered else None
 
-    # Read the input library
-    with open(input_file, 'r') as infile:
-        reader = list(csv.reader(infile, delimiter='\t'))
-        header = reader[0]
-        rows = reader[1:]
+        # Count rows and fingerprint the fragments as they stream past
+        def fragment_chunks():
+            while True:
+                block = list(islice(reader, INDEX_CHUNK))
+                if not block:
+                    return
+                fragments = [row[fetched] for row in block] if fetched is not None else []
+                fingerprint.update(len(block), fragments)
+                if fragments:
+                    yield fragments
 
-    # Sanity check: Ensure enough barcodes are available
-    if len(barcodes) < len(rows):
-        raise ValueError("Not enough barcodes for the number of rows in the library.")
+        index = None
+        if skip_collisions:
+            # Skip barcodes found in the constant regions or the library's fragments
+            length = barcode_length(PoolView(pool, 0, len(pool)))
+            index = CollisionIndex(length, CONSTANT_REGIONS, fragment_chunks=fragment_chunks())
+        else:
+            for _ in fragment_chunks():
+                pass
+        n_rows = fingerprint.rows
 
-    # Add new header
-    header.append('barcode')
+    def select(candidates, n):
+        if index is None:
+            return take_next(candidates, n)
+        chosen, skipped = collision_free_barcodes(candidates, n, index=index)
+        report_skipped(skipped)
+        return chosen, n + sum(skipped.values())
 
-    # Add barcodes to each row
-    new_rows = [row + [barcodes[i]] for i, row in enumerate(rows)]
+    barcodes = pool.allocate(n_rows, build, select, str(fingerprint))
 
     # Write the output file
-    with open(output_file, 'w', newline='') as outfile:
+    with open(input_file, 'r', newline='') as infile, open(output_file, 'w', newline='') as outfile:
+        reader = csv.reader(infile, delimiter='\t')
         writer = csv.writer(outfile, delimiter='\t')
-        writer.writerow(header)
-        writer.writerows(new_rows)
+        writer.writerow(next(reader) + ['barcode'])
+        for row, barcode in zip(reader, barcodes):
+            row.append(barcode)
+            writer.writerow(row)
 
     print(f"Barcodes added. Output saved to: {output_file}")
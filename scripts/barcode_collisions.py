@@ -0,0 +1,159 @@
+# scripts/barcode_collisions.py
+import numpy as np
+import pandas as pd
+
+INDEX_CHUNK = 200_000
+
+CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    CODES[_base] = CODES[_base + 32] = _code
+
+# Why a barcode was skipped, in the order they are checked
+SKIP_REASONS = {
+    'invalid': 'not a plain A/C/G/T barcode of the library length',
+    'constant': 'occurs in a constant region',
+    'constant_rc': 'reverse complement occurs in a constant region',
+    'fragment': 'occurs in a fetched_sequence window',
+    'fragment_rc': 'reverse complement occurs in a fetched_sequence window',
+}
+
+
+def sorted_unique(values):
+    """np.unique by sorting; faster than the hash-based unique for large integer arrays."""
+    values = np.sort(values)
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+
+
+def kmer_codes(seqs, k):
+    """2-bit codes of every A/C/G/T-only k-mer in `seqs` (strings of any lengths)."""
+    seqs = [s for s in pd.Series(seqs, dtype=object).dropna().astype(str).tolist() if len(s) >= k]
+    if not seqs:
+        return np.empty(0, dtype=np.uint32 if k <= 16 else np.uint64)
+    raw = np.array(seqs, dtype=bytes)
+    width = raw.dtype.itemsize
+    codes = CODES[raw.view(np.uint8).reshape(len(raw), width)]
+    n_windows = width - k + 1
+    dtype = np.uint32 if k <= 16 else np.uint64
+    windows = np.zeros((len(raw), n_windows), dtype=dtype)
+    for j in range(k):
+        windows <<= dtype(2)
+        windows |= codes[:, j:j + n_windows] & 3
+    # Padding bytes of shorter strings map to 4, like N, so their windows drop out
+    bad = np.cumsum(np.pad(codes == 4, ((0, 0), (1, 0))), axis=1, dtype=np.int32)
+    return windows[(bad[:, k:] - bad[:, :-k]) == 0]
+
+
+class CollisionIndex:
+    """
+    Sorted k-mer sets over the constant regions and all fetched fragments,
+    for checking barcodes (and their reverse complements) against them.
+    Fragments are indexed INDEX_CHUNK rows at a time; a stream can be
+    indexed by passing an iterable of chunks as `fragment_chunks` instead.
+    """
+
+    def __init__(self, length, constants=(), fragments=(), fragment_chunks=None):
+        self.length = length
+        self.constant_keys = sorted_unique(kmer_codes(list(constants), length))
+        if fragment_chunks is None:
+            fragments = pd.Series(fragments, dtype=object)
+            fragment_chunks = (fragments[lo:lo + INDEX_CHUNK] for lo in range(0, len(fragments), INDEX_CHUNK))
+        parts = [sorted_unique(kmer_codes(chunk, length)) for chunk in fragment_chunks]
+        self.fragment_keys = sorted_unique(np.concatenate(parts)) if parts else self.constant_keys[:0]
+
+    @staticmethod
+    def _contains(keys, values):
+        found = np.zeros(len(values), dtype=bool)
+        if not len(keys) or not len(values):
+            return found
+        # Sorted probes walk the key array in order, which is far kinder to the cache
+        order = np.argsort(values)
+        probes = values[order]
+        pos = np.minimum(keys.searchsorted(probes), len(keys) - 1)
+        found[order] = keys[pos] == probes
+        return found
+
+    def reasons(self, barcodes):
+        """Skip reason for each barcode ('' when it is safe to use)."""
+        raw = np.array([str(bc) for bc in barcodes], dtype=bytes)
+        width = raw.dtype.itemsize
+        reasons = np.full(len(raw), '', dtype=object)
+        if width < self.length:
+            reasons[:] = 'invalid'
+            return reasons
+        codes = CODES[raw.view(np.uint8).reshape(len(raw), width)]
+        valid = (np.char.str_len(raw) == self.length) & (codes[:, :self.length] < 4).all(axis=1)
+        reasons[~valid] = 'invalid'
+        rows = np.flatnonzero(valid)
+        codes = codes[rows, :self.length]
+
+        dtype = self.constant_keys.dtype
+        forward = np.zeros(len(rows), dtype=dtype)
+        reverse = np.zeros(len(rows), dtype=dtype)
+        for j in range(self.length):
+            forward = (forward << dtype.type(2)) | codes[:, j]
+            reverse = (reverse << dtype.type(2)) | (3 - codes[:, self.length - 1 - j])
+        checks = [
+            ('constant', self.constant_keys, forward),
+            ('constant_rc', self.constant_keys, reverse),
+            ('fragment', self.fragment_keys, forward),
+            ('fragment_rc', self.fragment_keys, reverse),
+        ]
+        unset = np.ones(len(rows), dtype=bool)
+        for reason, keys, values in checks:
+            hit = unset & self._contains(keys, values)
+            reasons[rows[hit]] = reason
+            unset &= ~hit
+        return reasons
+
+
+def barcode_length(barcodes):
+    """The usual barcode length, judged from the first 1000."""
+    lengths = pd.Series(barcodes[:1000], dtype=object).astype(str).str.len()
+    return int(lengths.mode().iloc[0]) if len(lengths) else 0
+
+
+def collision_free_barcodes(barcodes, n, constants=(), fragments=(), index=None):
+    """
+    The first `n` barcodes (in the given order) that pass the collision
+    index, checked in bulk blocks. Returns (barcodes, skipped) where skipped
+    counts the barcodes passed over by reason. Raises ValueError when the
+    list runs out first. A prebuilt `index` replaces constants/fragments.
+    """
+    skipped = dict.fromkeys(SKIP_REASONS, 0)
+    if n <= 0:
+        return [], skipped
+    if index is None:
+        index = CollisionIndex(barcode_length(barcodes), constants, fragments)
+
+    chosen = []
+    start = 0
+    while len(chosen) < n and start < len(barcodes):
+        # Over-draw by the skip rate seen so far so one or two blocks usually suffice
+        rate = len(chosen) / start if start and chosen else 1.0
+        block = np.asarray(barcodes[start:start + int((n - len(chosen)) / rate * 1.05) + 1000], dtype=object)
+        reasons = index.reasons(block)
+        ok = reasons == ''
+        # Stop at the barcode that completes the set
+        needed = n - len(chosen)
+        if ok.sum() >= needed:
+            block_end = int(np.flatnonzero(ok)[needed - 1]) + 1
+            block, reasons, ok = block[:block_end], reasons[:block_end], ok[:block_end]
+        start += len(block)
+        for reason, count in zip(*np.unique(reasons[~ok], return_counts=True)):
+            skipped[reason] += int(count)
+        chosen.extend(block[ok].tolist())
+
+    if len(chosen) < n:
+        raise ValueError(
+            f"❌ Not enough collision-free barcodes: needed {n}, found {len(chosen)} "
+            f"after skipping {sum(skipped.values())}."
+        )
+    return chosen, skipped
+
+
+def report_skipped(skipped):
+    total = sum(skipped.values())
+    print(f"\nSkipped {total} colliding barcodes.")
+    for reason, count in skipped.items():
+        if count:
+            print(f"  {count}: {SKIP_REASONS[reason]}")
@@ -0,0 +1,182 @@
+# scripts/barcode_pool.py
+import fcntl
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from barcode_generator.barcode_store import BarcodeStore
+
+STORE_SUFFIX = '.bcs'
+
+
+class PoolView:
+    """
+    Lazy, read-only list of pool records `stop - 1` down to `start`: the
+    order the barcode list used to be handed out in (file reversed).
+    Supports len() and [a:b] slicing, which reads only that block.
+    """
+
+    def __init__(self, pool, start, stop):
+        self.pool = pool
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError("PoolView only supports contiguous slices")
+        lo, hi, _ = item.indices(len(self))
+        if hi <= lo:
+            return []
+        return self.pool.read(self.stop - hi, self.stop - lo)[::-1]
+
+
+class LibraryFingerprint:
+    """
+    Row count and hash of a library's fragments, fed a chunk at a time.
+    Allocations record it so a build's range is only reused for the same
+    library.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.sha = hashlib.sha256()
+
+    def update(self, rows, fragments=()):
+        self.rows += rows
+        self.sha.update(''.join(f"{fragment}\n" for fragment in fragments).encode())
+
+    def __str__(self):
+        return f"{self.rows}:{self.sha.hexdigest()[:16]}"
+
+
+class BarcodePool:
+    """
+    A barcode file with random access and an allocation ledger.
+
+    Text pools with fixed-width lines (what the generator writes) are read
+    by seeking straight to a record; a `.bcs` barcode store is memory-mapped.
+    Other text files are loaded whole. Builds take records from the end of
+    the file backwards, in the order the reversed list was used before. The
+    ranges each build consumed are appended to `<path>.ledger` (JSON lines)
+    under an exclusive lock, so concurrent builds never share a barcode.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"❌ Barcode file not found: {path}")
+        self.path = path
+        self.ledger_path = path + '.ledger'
+        self.lock_path = path + '.lock'
+        self.store = None
+        self.lines = None
+
+        if path.endswith(STORE_SUFFIX):
+            self.store = BarcodeStore(path)
+            self.size = len(self.store)
+            return
+
+        with open(path, 'rb') as f:
+            first = f.readline()
+        file_size = os.path.getsize(path)
+        self.width = len(first)
+        # Every record is the same width; the last may lack its newline
+        fixed = first.endswith(b'\n') and len(first.strip()) == self.width - 1 and self.width > 1
+        if fixed and file_size % self.width in (0, self.width - 1):
+            self.size = -(-file_size // self.width)
+            return
+
+        with open(path) as f:
+            self.lines = [line.strip() for line in f if line.strip()]
+        self.size = len(self.lines)
+
+    def __len__(self):
+        return self.size
+
+    def read(self, start, stop):
+        """Records start..stop-1 in file order."""
+        start, stop = max(start, 0), min(stop, self.size)
+        if stop <= start:
+            return []
+        if self.store is not None:
+            return self.store.barcodes(start, stop)
+        if self.lines is not None:
+            return self.lines[start:stop]
+
+        with open(self.path, 'rb') as f:
+            f.seek(start * self.width)
+            data = f.read((stop - start) * self.width)
+        if len(data) % self.width:
+            data += b'\n'
+        records = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.width)
+        if (records[:, -1] != ord('\n')).any():
+            raise ValueError(f"❌ {self.path} does not have fixed-width lines.")
+        letters = np.ascontiguousarray(records[:, :-1])
+        return letters.view(f'S{self.width - 1}').ravel().astype(str).tolist()
+
+    def ledger(self):
+        if not os.path.exists(self.ledger_path):
+            return []
+        with open(self.ledger_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def free_end(self, entries):
+        """Records below this position have not been handed out."""
+        return min([entry['start'] for entry in entries], default=self.size)
+
+    def allocate(self, n, build, select=None, fingerprint=None):
+        """
+        Barcodes for `n` rows of `build`.
+
+        `select(candidates, n)` may pass over unsuitable barcodes and returns
+        (chosen, consumed); by default the next `n` are taken. A build that
+        already holds a range for the same `fingerprint` (see
+        LibraryFingerprint) that still yields `n` barcodes gets the same ones
+        again, so reruns do not burn through the pool.
+        """
+        select = select or take_next
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self.ledger()
+
+            previous = [entry for entry in entries if entry['build'] == build]
+            if previous and previous[-1].get('fingerprint') != fingerprint:
+                entry = previous[-1]
+                print(f"Build {build!r} holds barcodes {entry['start']}-{entry['stop'] - 1} of {self.path} "
+                      f"for a different library; allocating a new range")
+            elif previous:
+                entry = previous[-1]
+                try:
+                    chosen, _ = select(PoolView(self, entry['start'], entry['stop']), n)
+                    print(f"Reusing barcodes {entry['start']}-{entry['stop'] - 1} of {self.path} for build {build!r}")
+                    return chosen
+                except ValueError:
+                    pass
+
+            stop = self.free_end(entries)
+            chosen, consumed = select(PoolView(self, 0, stop), n)
+            entry = {
+                'build': build,
+                'start': stop - consumed,
+                'stop': stop,
+                'count': len(chosen),
+                'skipped': consumed - len(chosen),
+                'fingerprint': fingerprint,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            with open(self.ledger_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            print(f"Allocated barcodes {entry['start']}-{stop - 1} of {self.path} to build {build!r} "
+                  f"({entry['start']} left in the pool)")
+            return chosen
+
+
+def take_next(candidates, n):
+    if len(candidates) < n:
+        raise ValueError(f"❌ Not enough barcodes left in the pool: needed {n}, {len(candidates)} left.")
+    return candidates[:n], n
@@ -1,13 +1,86 @@
 # scripts/bedtools_fetching.py
+import numpy as np
 import pandas as pd
 import subprocess
 import os
+import tempfile
+
+from scripts.fasta_index import FastaIndex
+from scripts.profiling import phase
+from scripts.sequence_cache import CACHE_DIR, MAX_ENTRIES, SequenceCache, genome_checksum
+from scripts.table_io import intermediate_file, read_table, write_table
+
+# Window fetched around each site: Location-10 .. Location+33
+WINDOW_UPSTREAM = 10
+WINDOW_DOWNSTREAM = 33
+
+
+def window_coordinates(df):
+    location = df['Location'].astype(int)
+    return (
+        df['Chromosome'].astype(str).to_numpy(),
+        (location - WINDOW_UPSTREAM).to_numpy(),
+        (location + WINDOW_DOWNSTREAM).to_numpy(),
+        df['Direction'].astype(str).to_numpy(),
+    )
+
+
+def fetch_windows(df, fasta_file, engine='native', fasta=None):
+    if engine == 'native':
+        with phase('fasta_fetch'):
+            return (fasta or FastaIndex(fasta_file)).fetch(*window_coordinates(df))
+    return np.asarray(fetch_windows_bedtools(df, fasta_file), dtype=object)
+
+
+def fetch_windows_cached(df, fasta_file, cache, engine='native', fasta=None):
+    """Serve windows from an open SequenceCache; only misses reach the genome reader."""
+    coords = window_coordinates(df)
+    with phase('cache_lookup'):
+        seqs = cache.lookup_many(*coords)
+    miss = np.array([seq is None for seq in seqs], dtype=bool)
+    if miss.any():
+        fetched = fetch_windows(df[miss], fasta_file, engine, fasta)
+        seqs[miss] = fetched
+        with phase('cache_insert'):
+            cache.insert_many(*(column[miss] for column in coords), fetched)
+    return seqs
+
+
+def open_sequence_cache(fasta_file, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+    return SequenceCache(cache_dir, genome_checksum(fasta_file), max_entries)
+
+
+def report_cache(cache):
+    stats = cache.stats()
+    print(f"Sequence cache: {stats['hits']} hits, {stats['misses']} misses "
+          f"({stats['hit_rate']:.1%} hit rate, {stats['entries']} cached windows)")
+
+
+def add_fetched_sequences(df, fasta_file, engine='native', cache=None, fasta=None):
+    """Return `df` with a `fetched_sequence` column (None where the window is skipped)."""
+    if cache is not None:
+        df['fetched_sequence'] = fetch_windows_cached(df, fasta_file, cache, engine, fasta)
+    else:
+        df['fetched_sequence'] = fetch_windows(df, fasta_file, engine, fasta)
+    return df
+
 
 def fetch_sequences_with_bedtools(
-    input_file='intermediate_files/2a_combined_library_cleaned.txt',
+    input_file=intermediate_file('2a_combined_library_cleaned'),
     fasta_file='hg38.fa',
-    output_file='intermediate_files/3a_cleaned_file_with_sequences.txt'
+    output_file=intermediate_file('3a_cleaned_file_with_sequences'),
+    engine='native',
+    cache_dir=CACHE_DIR,
+    cache_max_entries=MAX_ENTRIES
 ):
+    """
+    Add a `fetched_sequence` column holding each site's strand-aware window.
+
+    engine='native' reads the FASTA directly (no temp files, no bedtools);
+    engine='bedtools' shells out to `bedtools getfasta` as before.
+    Windows are cached under `cache_dir` keyed by genome checksum and
+    coordinates, so reruns only fetch new sites; cache_dir=None disables it.
+    """
     if not os.path.exists(input_file):
         print(f"❌ Input file not found: {input_file}")
         return
@@ -16,47 +89,69 @@ def fetch_sequences_with_bedtools(
         print(f"❌ FASTA file not found: {fasta_file}")
         return
 
-    df = pd.read_csv(input_file, sep='\t')
+    df = read_table(input_file)
+
+    if cache_dir:
+        with open_sequence_cache(fasta_file, cache_dir, cache_max_entries) as cache:
+            df = add_fetched_sequences(df, fasta_file, engine, cache)
+            report_cache(cache)
+    else:
+        df = add_fetched_sequences(df, fasta_file, engine)
+
+    skipped = df['fetched_sequence'].isna().sum()
+    if skipped:
+        print(f"⚠️ {skipped} windows fall outside the FASTA and were skipped.")
+
+    # Save final result
+    write_table(df, output_file)
+    print(f"Fetched sequences written to: {output_file}")
 
+
+def fetch_windows_bedtools(df, fasta_file):
+    """
+    Windows via `bedtools getfasta -s`, None where none was returned.
+    bedtools skips windows past a chromosome end or on unknown chromosomes
+    but rejects the whole BED on a negative start, so those rows are left
+    out here; both engines then return None for every such window.
+    """
     # Create BED dataframe
     bed_df = pd.DataFrame()
     bed_df['chrom'] = df['Chromosome']
-    bed_df['start'] = df['Location'].astype(int) - 10
-    bed_df['end'] = df['Location'].astype(int) + 33
+    bed_df['start'] = df['Location'].astype(int) - WINDOW_UPSTREAM
+    bed_df['end'] = df['Location'].astype(int) + WINDOW_DOWNSTREAM
     bed_df['name'] = df['Frag_numb']
     bed_df['score'] = 0
     bed_df['strand'] = df['Direction']
+    bed_df = bed_df[bed_df['start'] >= 0]
 
-    bed_file = 'intermediate_files/3b_temp.bed'
-    bed_df.to_csv(bed_file, sep='\t', header=False, index=False)
-
-    # Run bedtools
-    temp_fasta_output = 'intermediate_files/3c_temp_fasta_output.txt'
-    cmd = [
-        'bedtools', 'getfasta',
-        '-fi', fasta_file,
-        '-bed', bed_file,
-        '-tab',
-        '-name',
-        '-s',
-    ]
-
-    print("Running bedtools getfasta...")
-    with open(temp_fasta_output, 'w') as out:
-        subprocess.run(cmd, stdout=out, check=True)
-    print("bedtools finished.")
-
-    # Parse results
-    fetched_seqs = {}
-    with open(temp_fasta_output) as f:
-        for line in f:
-            name, seq = line.strip().split('\t')
-            frag_numb = name.split('::')[0]
-            fetched_seqs[frag_numb] = seq
-
-    df['fetched_sequence'] = df['Frag_numb'].map(fetched_seqs)
+    # Per-run scratch files, so concurrent builds never share them
+    with tempfile.TemporaryDirectory(prefix='bedtools_') as workdir:
+        bed_file = os.path.join(workdir, '3b_temp.bed')
+        with phase('bed_write'):
+            bed_df.to_csv(bed_file, sep='\t', header=False, index=False)
 
-    # Save final result
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    df.to_csv(output_file, sep='\t', index=False)
-    print(f"Fetched sequences written to: {output_file}")
+        # Run bedtools
+        temp_fasta_output = os.path.join(workdir, '3c_temp_fasta_output.txt')
+        cmd = [
+            'bedtools', 'getfasta',
+            '-fi', fasta_file,
+            '-bed', bed_file,
+            '-tab',
+            '-name',
+            '-s',
+        ]
+
+        print("Running bedtools getfasta...")
+        with open(temp_fasta_output, 'w') as out, phase('bedtools'):
+            subprocess.run(cmd, stdout=out, check=True)
+        print("bedtools finished.")
+
+        # Parse results
+        fetched_seqs = {}
+        with open(temp_fasta_output) as f, phase('parse'):
+            for line in f:
+                name, seq = line.strip().split('\t')
+                frag_numb = name.split('::')[0]
+                fetched_seqs[frag_numb] = seq
+
+    return pd.Series([fetched_seqs.get(name) for name in df['Frag_numb']], index=df.index, dtype=object)
@@ -1,23 +1,30 @@
 # scripts/clean_combined_library.py
-import pandas as pd
 import os
 
+from scripts.table_io import intermediate_file, read_table, write_table
+
+COLUMNS_TO_DROP = ['ID', 'Selected/removed', 'Removed_IDs']
+
+
+def clean_library(df):
+    """Drop the bookkeeping columns that are not carried into the oligo library."""
+    return df.drop(columns=[col for col in COLUMNS_TO_DROP if col in df.columns])
+
+
 def clean_combined_library(
-    input_file='./intermediate_files/1a_combined_library_messy.txt',
-    output_file='./intermediate_files/2a_combined_library_cleaned.txt'
+    input_file=intermediate_file('1a_combined_library_messy'),
+    output_file=intermediate_file('2a_combined_library_cleaned')
 ):
     if not os.path.exists(input_file):
         print(f"❌ Input file not found: {input_file}")
         return
 
-    df = pd.read_csv(input_file, sep='\t', dtype=str)
+    df = read_table(input_file, dtype=str)
 
     # Drop specified columns if they exist
-    columns_to_drop = ['ID', 'Selected/removed', 'Removed_IDs']
-    df.drop(columns=[col for col in columns_to_drop if col in df.columns], inplace=True)
+    df = clean_library(df)
 
     # Save cleaned version
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    df.to_csv(output_file, sep='\t', index=False)
+    write_table(df, output_file)
 
     print(f"Cleaned file written to: {output_file}")
@@ -0,0 +1,341 @@
+# scripts/cli.py
+"""
+Command-line interface of the library pipeline.
+
+    python main.py run build.toml                  # one build, no prompts
+    python main.py run builds/*.toml --jobs 8      # many builds in parallel
+    python main.py run build.toml --dry-run --set variant_select=first
+    python main.py config build.toml               # resolved settings
+    python main.py ledger --barcode-file barcode_list.txt
+    python main.py demux lib_G13A.txt run1_R1.fastq.gz run2_R1.fastq.gz --workers 8
+
+Only the standard library is imported here; pandas, numpy and the pipeline
+modules are imported by the commands that need them, so light commands
+start quickly.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Every setting a build config may hold, with its default. Paths are
+# relative to the working directory, as elsewhere in the pipeline.
+DEFAULTS = {
+    'output_file': None,
+    'input_dir': './Input_libraries/',
+    'fasta_file': 'hg38.fa',
+    'barcode_file': 'barcode_list.txt',
+    'intermediate_dir': 'intermediate_files',
+    'mapping_file': None,
+    'build': None,
+    'prompt': True,
+    'variant_select': None,
+    'variant_max_mismatches': 1,
+    'near_mismatches': 0,
+    'skip_collisions': True,
+    'qc': True,
+    'in_memory': False,
+    'engine': 'native',
+    'profile': None,
+}
+
+# Rule used in place of the variant prompt when prompts are off
+HEADLESS_VARIANT_SELECT = 'min_mismatches'
+
+STEPS = ('combine', 'clean', 'fetch', 'dedup', 'variants', 'fragments', 'qc')
+
+
+def load_config(path):
+    """Settings from a TOML or JSON file: one flat table of DEFAULTS keys."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"❌ Config file not found: {path}")
+    if path.endswith('.json'):
+        with open(path) as f:
+            return json.load(f)
+    try:
+        import tomllib
+    except ImportError:
+        raise ValueError(f"❌ Reading {path} needs Python 3.11+ (tomllib); use a .json config instead.")
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def parse_override(item):
+    """`key=value` from --set; the value is read as JSON when it parses, else as a string."""
+    if '=' not in item:
+        raise ValueError(f"❌ --set expects key=value, got {item!r}")
+    key, value = item.split('=', 1)
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def resolve_config(path=None, overrides=(), headless=False):
+    """
+    DEFAULTS, updated from the config file at `path`, then from `overrides`.
+    Config files and `headless` turn the prompts off unless the config sets
+    prompt = true. Without prompts, the variant site is picked by
+    HEADLESS_VARIANT_SELECT and an output_file is required.
+    """
+    loaded = load_config(path) if path else {}
+    settings = dict(loaded, **dict(overrides))
+    unknown = sorted(set(settings) - set(DEFAULTS))
+    if unknown:
+        raise ValueError(f"❌ Unknown setting(s): {', '.join(unknown)}")
+
+    config = dict(DEFAULTS, prompt=not (path or headless))
+    config.update(settings)
+    if config['variant_select'] is None:
+        config['variant_select'] = 'prompt' if config['prompt'] else HEADLESS_VARIANT_SELECT
+    if not config['prompt']:
+        if config['variant_select'] == 'prompt':
+            raise ValueError("❌ variant_select = 'prompt' needs prompt = true.")
+        if not config['output_file']:
+            raise ValueError(f"❌ {path or 'The build'} has no output_file; it is required when prompts are off.")
+    return config
+
+
+def run_build(config, dry_run=False, force=(), steps=None):
+    """Run one build described by a resolved config. Returns the runner's plan (None in memory)."""
+    output_file = config['output_file']
+    if output_file is None and not config['in_memory']:
+        from scripts.fragment_generation import ask_output_file
+        output_file = ask_output_file()
+
+    if config['in_memory']:
+        if dry_run or steps:
+            raise ValueError("❌ --dry-run and --steps apply to the file-based pipeline, not in_memory.")
+        from scripts.pipeline import run_in_memory
+        from scripts.profiling import stage
+        oligo_file = run_in_memory(
+            output_file=output_file,
+            input_dir=config['input_dir'],
+            fasta_file=config['fasta_file'],
+            barcode_file=config['barcode_file'],
+            intermediate_dir=config['intermediate_dir'],
+            engine=config['engine'],
+            near_mismatches=config['near_mismatches'],
+            variant_select=config['variant_select'],
+            variant_max_mismatches=config['variant_max_mismatches'],
+            skip_collisions=config['skip_collisions'],
+            build=config['build'],
+            mapping_file=config['mapping_file'],
+            prompt=config['prompt'],
+        )
+        if oligo_file and config['qc']:
+            from scripts.oligo_qc import qc_library
+            print("\n Step 7: QC of the final oligo library...")
+            with stage('qc'):
+                qc_library(oligo_file)
+        return None
+
+    # The runner skips every step whose inputs, parameters and code are
+    # unchanged since it last succeeded
+    from scripts.runner import STATE_FILE, pipeline_steps, run_steps
+    pipeline = pipeline_steps(
+        output_file,
+        input_dir=config['input_dir'],
+        fasta_file=config['fasta_file'],
+        barcode_file=config['barcode_file'],
+        intermediate_dir=config['intermediate_dir'],
+        mapping_file=config['mapping_file'],
+        prompt=config['prompt'],
+        variant_select=config['variant_select'],
+        variant_max_mismatches=config['variant_max_mismatches'],
+        near_mismatches=config['near_mismatches'],
+        skip_collisions=config['skip_collisions'],
+        qc=config['qc'],
+        engine=config['engine'],
+        build=config['build'],
+    )
+    if steps:
+        pipeline = [step for step in pipeline if step.name in steps]
+    return run_steps(
+        pipeline,
+        state_file=os.path.join(config['intermediate_dir'], STATE_FILE),
+        dry_run=dry_run,
+        force=force,
+    )
+
+
+def profiled_build(config, profile_options, **kwargs):
+    """run_build under a RunReport when the config (or --profile) names a report file."""
+    from scripts.profiling import profiling
+    if not config['profile']:
+        return run_build(config, **kwargs)
+    with profiling(config['profile'], **profile_options):
+        return run_build(config, **kwargs)
+
+
+def _run_logged(path, config, log_file, profile_options, kwargs):
+    """Process-pool task: one build with its output sent to `log_file`."""
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    with open(log_file, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            profiled_build(config, profile_options, **kwargs)
+        except BaseException:
+            traceback.print_exc()
+            raise
+    return path
+
+
+def check_distinct(configs):
+    """Parallel builds must not share intermediates, outputs or ledger names."""
+    for key in ('intermediate_dir', 'output_file', 'build'):
+        seen = {}
+        for path, config in configs:
+            value = config[key]
+            if key == 'build':
+                # Unnamed builds are recorded under their output's absolute path
+                value = value or os.path.abspath(config['output_file'])
+            elif value:
+                value = os.path.abspath(value)
+            if value in seen:
+                raise ValueError(f"❌ {seen[value]} and {path} share {key} = {config[key]!r}; "
+                                 f"parallel builds need their own.")
+            seen[value] = path
+
+
+def command_run(args):
+    overrides = [parse_override(item) for item in args.set]
+    if args.in_memory:
+        overrides.append(('in_memory', True))
+    if args.profile:
+        overrides.append(('profile', args.profile))
+    profile_options = dict(cprofile=args.cprofile, trace_memory=args.tracemalloc)
+    kwargs = dict(dry_run=args.dry_run, force=args.force, steps=args.steps)
+
+    paths = args.configs or [None]
+    configs = [(path, resolve_config(path, overrides, args.no_prompt)) for path in paths]
+    if len(configs) == 1:
+        profiled_build(configs[0][1], profile_options, **kwargs)
+        return 0
+
+    if any(config['prompt'] for _, config in configs):
+        raise ValueError("❌ Several builds can only run together with prompts off.")
+    check_distinct(configs)
+    if args.dry_run:
+        for path, config in configs:
+            print(f"\n📋 {path}")
+            run_build(config, **kwargs)
+        return 0
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {}
+        for path, config in configs:
+            log_file = os.path.join(config['intermediate_dir'], 'run.log')
+            futures[pool.submit(_run_logged, path, config, log_file, profile_options, kwargs)] = (path, log_file)
+        for future in as_completed(futures):
+            path, log_file = futures[future]
+            try:
+                future.result()
+                print(f"✅ {path} (log: {log_file})")
+            except (Exception, SystemExit):
+                failed.append(path)
+                print(f"❌ {path} failed (log: {log_file})")
+    print(f"\n{len(configs) - len(failed)} of {len(configs)} builds finished.")
+    return 1 if failed else 0
+
+
+def command_config(args):
+    overrides = [parse_override(item) for item in args.set]
+    config = resolve_config(args.config, overrides, args.no_prompt)
+    print(json.dumps(config, indent=2))
+    return 0
+
+
+def command_ledger(args):
+    from scripts.barcode_pool import BarcodePool
+    pool = BarcodePool(args.barcode_file)
+    entries = pool.ledger()
+    for entry in entries:
+        print(f"{entry['time']}  {entry['build']:<30} {entry['start']:>10}-{entry['stop'] - 1:<10} "
+              f"{entry['count']:>10,} used  {entry['skipped']:>8,} skipped")
+    print(f"\n{pool.free_end(entries):,} of {len(pool):,} barcodes in {args.barcode_file} not yet allocated.")
+    return 0
+
+
+def command_demux(args):
+    from scripts.demux import demultiplex
+    from scripts.profiling import profiling, stage
+
+    def run():
+        with stage('demux'):
+            demultiplex(
+                args.fastq, args.oligo_file, output_file=args.output, barcode_file=args.barcode_file,
+                max_mismatches=args.mismatches, offset=args.offset, max_shift=args.max_shift,
+                reverse=args.reverse, workers=args.workers,
+            )
+
+    if args.profile:
+        with profiling(args.profile):
+            run()
+    else:
+        run()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description="ONE-seq oligo library pipeline.")
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help="run one or more builds (the default command)")
+    run.add_argument('configs', nargs='*', help="TOML or JSON build configs; none runs interactively")
+    run.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="override a setting")
+    run.add_argument('--no-prompt', action='store_true', help="never prompt, even without a config")
+    run.add_argument('--jobs', type=int, default=None, help="builds run at once (default: one per CPU)")
+    run.add_argument('--dry-run', action='store_true', help="list the steps that would run and why")
+    run.add_argument('--force', action='append', default=[], choices=STEPS, metavar='STEP',
+                     help="rerun STEP even when it is up to date")
+    run.add_argument('--steps', nargs='+', choices=STEPS, help="only consider these steps")
+    run.add_argument('--in-memory', action='store_true', help="run all steps in one pass (scripts/pipeline.py)")
+    run.add_argument('--profile', metavar='REPORT', help="write a JSON run report")
+    run.add_argument('--cprofile', action='store_true', help="with --profile, dump a .prof per stage")
+    run.add_argument('--tracemalloc', action='store_true', help="with --profile, trace allocations per stage")
+    run.set_defaults(handler=command_run)
+
+    config = commands.add_parser('config', help="print the resolved settings of a build")
+    config.add_argument('config', nargs='?')
+    config.add_argument('--set', action='append', default=[], metavar='KEY=VALUE')
+    config.add_argument('--no-prompt', action='store_true')
+    config.set_defaults(handler=command_config)
+
+    ledger = commands.add_parser('ledger', help="list the barcode ranges allocated to builds")
+    ledger.add_argument('--barcode-file', default=DEFAULTS['barcode_file'])
+    ledger.set_defaults(handler=command_ledger)
+
+    demux = commands.add_parser('demux', help="count sequencing reads per oligo by barcode")
+    demux.add_argument('oligo_file', help="oligo library written by the fragments step")
+    demux.add_argument('fastq', nargs='+', help="FASTQ files, plain or gzipped")
+    demux.add_argument('-o', '--output', help="per-oligo counts (default: <oligo stem>_counts.txt)")
+    demux.add_argument('--barcode-file', help="barcode pool, for libraries without a barcode column")
+    demux.add_argument('--mismatches', type=int, choices=(0, 1), default=1, help="substitutions corrected")
+    demux.add_argument('--offset', type=int, help="barcode start in the read (default: after the primer site)")
+    demux.add_argument('--max-shift', type=int, default=0, help="realign reads up to this many bases off")
+    demux.add_argument('--reverse', action='store_true', help="reads start at Right_PBS and carry barcode_2")
+    demux.add_argument('--workers', type=int, default=None, help="lookup processes (default: one per CPU)")
+    demux.add_argument('--profile', metavar='REPORT', help="write a JSON run report")
+    demux.set_defaults(handler=command_demux)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    # `python main.py [--dry-run ...]` without a command is `run`, as before
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv = ['run'] + argv
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except (ValueError, FileNotFoundError) as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
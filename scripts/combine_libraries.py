@@ -4,29 +4,69 @@ import glob
 import os
 import string
 import re
+from concurrent.futures import ProcessPoolExecutor
 
-def combine_libraries(input_dir='./Input_libraries/', output_dir='./intermediate_files/'):
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, '1a_combined_library_messy.txt')
+from scripts.profiling import phase, record_rows
+from scripts.table_io import intermediate_file, write_table
 
-    file_paths = sorted(glob.glob(os.path.join(input_dir, '*.txt')))
-    if not file_paths:
-        print("No .txt files found in the input directory.")
-        return
+MUTATION_PATTERN = re.compile(r'[A-Z]\d+[A-Z]')
+# Optional `filename<TAB>mutation name` lines in the input directory; .tsv so
+# it is not picked up as a library
+MUTATION_NAMES_FILE = 'mutation_names.tsv'
 
-    dfs = []
-    entry_counts = {}
-    total_entries = 0
-    start_number = 100000
-    mutation_pattern = re.compile(r'[A-Z]\d+[A-Z]')
 
-    for i, file_path in enumerate(file_paths):
-        prefix = string.ascii_uppercase[i]
-        filename = os.path.basename(file_path)
+def list_input_libraries(input_dir='./Input_libraries/'):
+    return sorted(glob.glob(os.path.join(input_dir, '*.txt')))
+
+
+def detect_mutation_name(filename):
+    tokens = re.split(r'[_\-]', filename)
+    candidates = [tok for tok in tokens if MUTATION_PATTERN.fullmatch(tok)]
+    return candidates[0] if candidates else ""
 
-        tokens = re.split(r'[_\-]', filename)
-        candidates = [tok for tok in tokens if mutation_pattern.fullmatch(tok)]
-        mutation_name = candidates[0] if candidates else ""
+
+def read_mutation_names(mapping_file):
+    """{filename: mutation name} from a two-column, tab-separated mapping file."""
+    names = {}
+    with open(mapping_file) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2 or not fields[1].strip():
+                raise ValueError(f"❌ Expected 'filename<TAB>mutation name' in {mapping_file}: {line.strip()}")
+            names[os.path.basename(fields[0].strip())] = fields[1].strip()
+    return names
+
+
+def find_mapping_file(input_dir, mapping_file=None):
+    """`mapping_file`, else the input directory's mutation_names.tsv if there is one."""
+    default = os.path.join(input_dir, MUTATION_NAMES_FILE)
+    if mapping_file is None and os.path.exists(default):
+        return default
+    return mapping_file
+
+
+def resolve_mutation_names(file_paths, mapping_file=None, prompt=True):
+    """
+    A mutation name for each input file. Names in `mapping_file` are used
+    as given. Other files are confirmed (or supplied) by the user, or with
+    prompt=False take the name detected from the filename, failing if none
+    can be detected.
+    """
+    mapped = read_mutation_names(mapping_file) if mapping_file else {}
+    names = []
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        if filename in mapped:
+            names.append(mapped[filename])
+            continue
+        mutation_name = detect_mutation_name(filename)
+        if not prompt:
+            if not mutation_name:
+                raise ValueError(f"❌ No mutation name for {filename}; add it to the mapping file.")
+            names.append(mutation_name)
+            continue
         print(f"\nProcessing file: {filename}")
         while True:
             if mutation_name:
@@ -39,20 +79,88 @@ def combine_libraries(input_dir='./Input_libraries/', output_dir='./intermediate
                 mutation_name = input("Could not detect mutation name. Please enter one: ").strip()
                 if mutation_name:
                     break
+        names.append(mutation_name)
+    return names
+
+
+def library_prefix(i):
+    """Frag_numb prefix of the i-th input file: A..Z, then AA, AB, ... like spreadsheet columns."""
+    prefix = ''
+    i += 1
+    while i:
+        i, rem = divmod(i - 1, 26)
+        prefix = string.ascii_uppercase[rem] + prefix
+    return prefix
 
 
-        df = pd.read_csv(file_path, sep='\t', dtype=str)
-        id_column = 'ID'
-        frag_ids = [f"{prefix}{row[id_column]}" for _, row in df.iterrows()]
-        df.insert(0, 'Frag_numb', frag_ids)
-        df.insert(1, 'mutation', mutation_name)
+def annotate_library(df, prefix, mutation_name):
+    """Prepend the Frag_numb (prefix + ID) and mutation columns."""
+    id_column = 'ID'
+    df.insert(0, 'Frag_numb', prefix + df[id_column].astype(str))
+    df.insert(1, 'mutation', mutation_name)
+    return df
 
-        entry_counts[mutation_name] = len(df)
-        total_entries += len(df)
-        dfs.append(df)
+
+def iter_library_chunks(file_paths, mutation_names, chunksize=None):
+    """Yield annotated library frames, `chunksize` rows at a time per file."""
+    for i, (file_path, mutation_name) in enumerate(zip(file_paths, mutation_names)):
+        prefix = library_prefix(i)
+        if chunksize:
+            chunks = pd.read_csv(file_path, sep='\t', dtype=str, chunksize=chunksize)
+        else:
+            chunks = [pd.read_csv(file_path, sep='\t', dtype=str)]
+        for df in chunks:
+            yield annotate_library(df, prefix, mutation_name)
+
+
+def _read_library(args):
+    file_path, prefix, mutation_name = args
+    return annotate_library(pd.read_csv(file_path, sep='\t', dtype=str), prefix, mutation_name)
+
+
+def read_libraries(file_paths, mutation_names, workers=None):
+    """Annotated frames for every input file, in order, parsed `workers` files at a time."""
+    tasks = [(path, library_prefix(i), name) for i, (path, name) in enumerate(zip(file_paths, mutation_names))]
+    workers = min(workers or os.cpu_count(), len(tasks))
+    if workers <= 1:
+        return [_read_library(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_read_library, tasks))
+
+
+def combine_libraries(
+    input_dir='./Input_libraries/',
+    output_dir='./intermediate_files/',
+    mapping_file=None,
+    prompt=True,
+    workers=None,
+):
+    """
+    Combine every input library into one table. Mutation names come from
+    `mapping_file` (default: mutation_names.tsv in `input_dir`, if present),
+    then from the prompts, or with prompt=False from the filenames. Files are
+    parsed in a pool of `workers` processes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = intermediate_file('1a_combined_library_messy', output_dir)
+
+    file_paths = list_input_libraries(input_dir)
+    if not file_paths:
+        print("No .txt files found in the input directory.")
+        return
+
+    mutation_names = resolve_mutation_names(file_paths, find_mapping_file(input_dir, mapping_file), prompt)
+
+    with phase('parse'):
+        dfs = read_libraries(file_paths, mutation_names, workers)
+    entry_counts = {}
+    for mutation_name, df in zip(mutation_names, dfs):
+        entry_counts[mutation_name] = entry_counts.get(mutation_name, 0) + len(df)
+    total_entries = sum(entry_counts.values())
+    record_rows(rows_in=total_entries)
 
     combined_df = pd.concat(dfs, ignore_index=True)
-    combined_df.to_csv(output_file, sep='\t', index=False)
+    write_table(combined_df, output_file)
 
     print(f"\nCombined file written to: {output_file}")
     print(f"Total entries: {total_entries}")
@@ -1,86 +1,260 @@
 # scripts/dedup.py
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 import sys
 import os
 
-def deduplicate_sequences(
-    input_file="intermediate_files/3a_cleaned_file_with_sequences.txt",
-    output_file="intermediate_files/4a_deduplicated_file_with_sequences.txt",
-    filtered_out_file="intermediate_files/4b_deduplicated_removed_entries.txt"
-):
-    if not os.path.exists(input_file):
-        sys.exit(f"❌ File not found: {input_file}")
+from scripts.table_io import intermediate_file, read_table, write_table
 
-    df = pd.read_csv(input_file, sep="\t", dtype=str)
-    df.columns = [col.lower() for col in df.columns]
+REQUIRED_COLUMNS = ["fetched_sequence", "mutation", "frag_numb"]
 
-    required_columns = ["fetched_sequence", "mutation", "frag_numb"]
-    missing_cols = [col for col in required_columns if col not in df.columns]
-    if missing_cols:
-        sys.exit(f"❌ Missing required columns: {missing_cols}")
+# Below this many rows a fold level is cheaper to walk row by row
+MIN_LEVEL_SIZE = 256
 
-    duplicated_mask = df.duplicated(subset="fetched_sequence", keep=False)
-    df["duplicated"] = duplicated_mask.map({True: "yes", False: "no"})
 
-    # Move "duplicated" column to second position
-    cols = df.columns.tolist()
-    cols.insert(1, cols.pop(cols.index("duplicated")))
-    df = df[cols]
+def merge_mutation_labels(prev_mut, mutation):
+    if prev_mut == mutation:
+        return f"{mutation}_multi"
+    # Combine different mutations with underscore
+    return "_".join(sorted(set(prev_mut.split("_") + mutation.split("_"))))
 
-    summary = df.groupby("mutation")["duplicated"].agg(
-        total='count',
-        unique=lambda x: (x == "no").sum()
-    ).reset_index()
-    summary['percent_unique'] = summary['unique'] / summary['total'] * 100
 
-    print("\nSummary of unique sequences per mutation:")
-    print(summary.to_string(index=False, float_format="%.2f"))
+class Deduplicator:
+    """
+    Exact-sequence deduplication that can be fed a library chunk by chunk.
 
+    The first row seen for each `fetched_sequence` is kept and later copies
+    fold their mutation into its label; removed rows are final as soon as
+    they are fed. With `on_removed`, each chunk's removed rows are handed to
+    it as they are found and only counted, so memory is bounded by the
+    number of unique sequences; otherwise they are held for frames().
 
-    total = len(df)
-    duplicate_count = duplicated_mask.sum()
-    unique_count = total - duplicate_count
+    Each chunk is handled column-wise: rows are factorized by sequence and
+    matched to already-kept sequences in one pass, and mutation labels are
+    folded one rank at a time (the 2nd copy of every sequence, then the 3rd,
+    ...) through a memo of (label, mutation) -> merged label, so the string
+    work in merge_mutation_labels runs once per distinct pair.
+    """
 
-    print(f"\nTotal entries: {total}")
-    print(f"Unique entries: {unique_count} ({(unique_count / total) * 100:.2f}%)")
-    print(f"Duplicated entries: {duplicate_count} ({(duplicate_count / total) * 100:.2f}%)")
+    def __init__(self, on_removed=None):
+        self.on_removed = on_removed
+        self.removed_count = 0
+        self.columns = None
+        self.slot_of = {}          # sequence -> kept slot
+        self.kept_frames = []
+        self.removed_frames = []
+        self.slot_label = np.empty(0, dtype=np.int64)
+        self.slot_first_label = np.empty(0, dtype=np.int64)
+        self.slot_duplicated = np.empty(0, dtype=bool)
+        self.slot_frag = np.empty(0, dtype=object)
+        self.labels = []
+        self.label_id = {}
+        self.merged = {}
+        self.totals = {}
 
-    user_input = input("\nPerform deduplication? (y/n): ").strip().lower()
-    if user_input not in {"y", "yes"}:
-        print("Skipping deduplication. Using original input file.")
-        return  # Exit the function, but don't kill the script
+    def _label_ids(self, values):
+        ids = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            label = self.label_id.get(value)
+            if label is None:
+                label = self.label_id[value] = len(self.labels)
+                self.labels.append(value)
+            ids[i] = label
+        return ids
 
+    def _merge(self, prev, mutation):
+        key = (prev, mutation)
+        merged = self.merged.get(key)
+        if merged is None:
+            label = merge_mutation_labels(self.labels[prev], self.labels[mutation])
+            merged = self.merged[key] = self._label_ids([label])[0]
+        return merged
 
-    seen = {}
-    filtered_out_rows = []
-    deduplicated_rows = []
+    def prepare(self, df):
+        df = df.copy()
+        df.columns = [col.lower() for col in df.columns]
+        missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        if missing_cols:
+            raise ValueError(f"❌ Missing required columns: {missing_cols}")
+        df.insert(1, "duplicated", "no")
+        if self.columns is None:
+            self.columns = df.columns.tolist()
+        return df.reset_index(drop=True)
 
-    for _, row in tqdm(df.iterrows(), total=len(df), desc="Deduplicating", unit="rows"):
-        seq = row["fetched_sequence"]
-        mutation = row["mutation"]
+    def feed(self, df):
+        df = self.prepare(df)
+        n = len(df)
+        if n == 0:
+            return
 
-        if seq not in seen:
-            seen[seq] = row.copy()
-            deduplicated_rows.append(seen[seq])
-        else:
-            prev_row = seen[seq]
-            prev_mut = prev_row["mutation"]
-            if prev_mut == mutation:
-                seen[seq]["mutation"] = f"{mutation}_multi"
+        mut_codes, mut_values = pd.factorize(df["mutation"].astype(object), use_na_sentinel=False)
+        mutation = self._label_ids(list(mut_values))[mut_codes]
+        for label, count in zip(*np.unique(mutation, return_counts=True)):
+            name = self.labels[label]
+            self.totals[name] = self.totals.get(name, 0) + int(count)
+
+        # Missing sequences all share one key, as they did in the row loop
+        codes, uniques = pd.factorize(df["fetched_sequence"].astype(object), use_na_sentinel=False)
+        missing = np.flatnonzero(pd.isna(uniques))
+        uniques = uniques.tolist()
+        for i in missing:
+            uniques[i] = None
+        first_row = np.full(len(uniques), n, dtype=np.int64)
+        np.minimum.at(first_row, codes, np.arange(n))
+
+        # Match this chunk's sequences against the ones already kept
+        known = np.array([self.slot_of.get(seq, -1) for seq in uniques], dtype=np.int64)
+        new = known < 0
+        n_slots = len(self.slot_label)
+        known[new] = n_slots + np.arange(int(new.sum()))
+        self.slot_of.update(zip([uniques[i] for i in np.flatnonzero(new)], known[new].tolist()))
+        slot = known[codes]
+
+        leader = np.zeros(n, dtype=bool)
+        leader[first_row[new]] = True
+        leader_rows = np.flatnonzero(leader)
+        self.slot_label = np.concatenate([self.slot_label, mutation[leader_rows]])
+        self.slot_first_label = np.concatenate([self.slot_first_label, mutation[leader_rows]])
+        self.slot_duplicated = np.concatenate([self.slot_duplicated, np.zeros(len(leader_rows), dtype=bool)])
+        self.slot_frag = np.concatenate([self.slot_frag, df["frag_numb"].to_numpy(dtype=object)[leader_rows]])
+
+        # Every other row is a later copy; fold labels in order of appearance
+        followers = np.flatnonzero(~leader)
+        if len(followers):
+            f_slot = slot[followers]
+            order = np.argsort(f_slot, kind="stable")
+            sorted_slot = f_slot[order]
+            starts = np.flatnonzero(np.r_[True, sorted_slot[1:] != sorted_slot[:-1]])
+            rank = np.empty(len(followers), dtype=np.int64)
+            rank[order] = np.arange(len(followers)) - np.repeat(starts, np.diff(np.r_[starts, len(followers)]))
+
+            by_rank = np.argsort(rank, kind="stable")
+            bounds = np.flatnonzero(np.r_[True, np.diff(rank[by_rank]) != 0, True])
+            done = len(followers)
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                if hi - lo < MIN_LEVEL_SIZE:
+                    done = lo
+                    break
+                level = followers[by_rank[lo:hi]]
+                level_slot = slot[level]
+                n_labels = len(self.labels)
+                pairs = self.slot_label[level_slot] * n_labels + mutation[level]
+                uniq_pairs, inverse = np.unique(pairs, return_inverse=True)
+                merged = np.array([self._merge(*divmod(pair, n_labels)) for pair in uniq_pairs.tolist()], dtype=np.int64)
+                self.slot_label[level_slot] = merged[inverse]
+
+            # The few sequences with long runs of copies finish one row at a time
+            tail = followers[by_rank[done:]]
+            if len(tail):
+                tail_slots = slot[tail]
+                current = dict(zip(tail_slots.tolist(), self.slot_label[tail_slots].tolist()))
+                for s, m in zip(tail_slots.tolist(), mutation[tail].tolist()):
+                    merged = self.merged.get((current[s], m))
+                    current[s] = self._merge(current[s], m) if merged is None else merged
+                self.slot_label[list(current)] = list(current.values())
+
+            self.slot_duplicated[f_slot] = True
+            removed = df.iloc[followers].copy()
+            removed["duplicated"] = "yes"
+            removed["kept_frag_numb"] = self.slot_frag[f_slot]
+            self.removed_count += len(removed)
+            if self.on_removed is not None:
+                self.on_removed(removed)
             else:
-                # Combine different mutations with underscore
-                merged = "_".join(sorted(set(prev_mut.split("_") + mutation.split("_"))))
-                seen[seq]["mutation"] = merged
-            row["kept_frag_numb"] = seen[seq]["frag_numb"]
-            filtered_out_rows.append(row)
+                self.removed_frames.append(removed)
+
+        self.kept_frames.append(df.iloc[leader_rows])
+
+    def summary(self):
+        unique = dict.fromkeys(self.totals, 0)
+        lone = self.slot_first_label[~self.slot_duplicated]
+        for label, count in zip(*np.unique(lone, return_counts=True)):
+            unique[self.labels[label]] += int(count)
+        summary = pd.DataFrame({
+            "mutation": list(self.totals),
+            "total": list(self.totals.values()),
+            "unique": [unique[m] for m in self.totals],
+        }).sort_values("mutation").reset_index(drop=True)
+        summary['percent_unique'] = summary['unique'] / summary['total'] * 100
+        return summary
+
+    def frames(self):
+        if self.kept_frames:
+            deduplicated_df = pd.concat(self.kept_frames, ignore_index=True)
+        else:
+            deduplicated_df = pd.DataFrame(columns=self.columns)
+        deduplicated_df["mutation"] = np.array(self.labels, dtype=object)[self.slot_label] if len(self.labels) else []
+        deduplicated_df["duplicated"] = np.where(self.slot_duplicated, "yes", "no")
 
+        if self.removed_frames:
+            filtered_out_df = pd.concat(self.removed_frames, ignore_index=True)
+        else:
+            filtered_out_df = pd.DataFrame(columns=(self.columns or []) + ["kept_frag_numb"])
+        return deduplicated_df, filtered_out_df
+
+    def report(self):
+        print("\nSummary of unique sequences per mutation:")
+        print(self.summary().to_string(index=False, float_format="%.2f"))
+
+        total = sum(self.totals.values())
+        duplicate_count = self.removed_count + int(self.slot_duplicated.sum())
+        unique_count = total - duplicate_count
+
+        print(f"\nTotal entries: {total}")
+        print(f"Unique entries: {unique_count} ({(unique_count / total) * 100:.2f}%)")
+        print(f"Duplicated entries: {duplicate_count} ({(duplicate_count / total) * 100:.2f}%)")
+
+
+def deduplicate_frame(df):
+    """Deduplicate one in-memory library; returns (deduplicated, filtered_out, Deduplicator)."""
+    dedup = Deduplicator()
+    dedup.feed(df)
+    deduplicated_df, filtered_out_df = dedup.frames()
+    return deduplicated_df, filtered_out_df, dedup
+
+
+def deduplicate_sequences(
+    input_file=intermediate_file('3a_cleaned_file_with_sequences'),
+    output_file=intermediate_file('4a_deduplicated_file_with_sequences'),
+    filtered_out_file=intermediate_file('4b_deduplicated_removed_entries'),
+    near_mismatches=0,
+    near_merge=True,
+    confirm=True,
+):
+    """
+    Collapse identical `fetched_sequence` windows. With `near_mismatches` > 0,
+    windows within that many mismatches of a kept window are also clustered
+    (see scripts/near_dedup.py): merged like duplicates, or only annotated in
+    a `near_cluster` column when `near_merge` is False. confirm=False skips
+    the confirmation prompt.
+    """
+    if not os.path.exists(input_file):
+        sys.exit(f"❌ File not found: {input_file}")
+
+    df = read_table(input_file, dtype=str)
+
+    dedup = Deduplicator()
+    try:
+        dedup.feed(df)
+    except ValueError as e:
+        sys.exit(str(e))
+    dedup.report()
+
+    user_input = input("\nPerform deduplication? (y/n): ").strip().lower() if confirm else "y"
+    if user_input not in {"y", "yes"}:
+        print("Skipping deduplication. Using original input file.")
+        return  # Exit the function, but don't kill the script
 
-    deduplicated_df = pd.DataFrame(deduplicated_rows)
-    filtered_out_df = pd.DataFrame(filtered_out_rows)
+    deduplicated_df, filtered_out_df = dedup.frames()
+    if near_mismatches:
+        from scripts.near_dedup import collapse_near_duplicates, report_near_duplicates
+        deduplicated_df, filtered_out_df, clusters = collapse_near_duplicates(
+            deduplicated_df, filtered_out_df, near_mismatches, merge=near_merge
+        )
+        report_near_duplicates(clusters, near_mismatches)
 
-    deduplicated_df.to_csv(output_file, sep="\t", index=False)
-    filtered_out_df.to_csv(filtered_out_file, sep="\t", index=False)
+    write_table(deduplicated_df, output_file)
+    write_table(filtered_out_df, filtered_out_file)
 
     print(f"\nDeduplicated file saved to: {output_file}")
     print(f"Filtered-out duplicates saved to: {filtered_out_file}")
@@ -0,0 +1,427 @@
+# scripts/demux.py
+import gzip
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from scripts.barcode_collisions import barcode_length
+from scripts.barcode_pool import BarcodePool
+from scripts.fragment_generation import LEFT_PBS, RIGHT_PBS
+from scripts.oligo_qc import CODES, read_oligo_file, reverse_complement
+from scripts.profiling import phase, record_rows
+from scripts.table_io import write_table
+
+DEMUX_CHUNK = 200_000
+INDEX_VERSION = 1
+# Bases of the primer-binding site just before the barcode used to locate it in shifted reads
+ANCHOR_BASES = 8
+
+UNMATCHED = -1
+AMBIGUOUS = -2
+STATUSES = ('exact', 'corrected', 'ambiguous', 'unmatched', 'unreadable')
+INDEX_ARRAYS = ('exact_keys', 'exact_rows', 'near_keys', 'near_rows', 'names', 'barcodes')
+
+
+def pack_codes(codes):
+    """(n, length) matrix of 2-bit base codes -> uint64 keys, first base in the high bits."""
+    keys = np.zeros(len(codes), dtype=np.uint64)
+    for column in codes.T:
+        keys <<= np.uint64(2)
+        keys |= column.astype(np.uint64)
+    return keys
+
+
+def encode_barcodes(barcodes):
+    """uint64 keys of equal-length A/C/G/T barcodes."""
+    raw = np.array([str(bc).upper() for bc in barcodes], dtype=bytes)
+    length = raw.dtype.itemsize
+    codes = CODES[raw.view(np.uint8).reshape(len(raw), length)]
+    if (codes == 4).any() or (np.char.str_len(raw) != length).any():
+        raise ValueError("❌ Barcodes must all have one length and contain only A, C, G and T.")
+    return pack_codes(codes), length
+
+
+def unique_rows(keys, rows):
+    """Sort (key, row) pairs; a key held by more than one row maps to AMBIGUOUS."""
+    if len(keys) and int(keys.max()) < 2 ** 32:
+        # Keys of up to 16 nt share one word with their row: one in-place sort, no argsort
+        packed = (keys << np.uint64(32)) | rows.astype(np.uint64)
+        packed.sort()
+        keys, rows = packed >> np.uint64(32), (packed & np.uint64(0xFFFFFFFF)).astype(np.int32)
+        del packed
+    else:
+        order = np.argsort(keys, kind='stable')
+        keys, rows = keys[order], rows[order].astype(np.int32)
+    first = np.r_[True, keys[1:] != keys[:-1]]
+    shared = np.r_[keys[1:] == keys[:-1], False]
+    rows = np.where(shared[first], AMBIGUOUS, rows[first]).astype(np.int32)
+    return keys[first], rows
+
+
+def neighbour_keys(keys, length):
+    """Every key one substitution away from each of `keys`, as an (n * 3 * length) array and its source rows."""
+    # XOR with 1, 2 or 3 in one 2-bit slot turns that base into each of the other three
+    masks = (np.arange(1, 4, dtype=np.uint64)[None, :] << (2 * np.arange(length, dtype=np.uint64))[:, None]).ravel()
+    near = (keys[:, None] ^ masks[None, :]).ravel()
+    rows = np.repeat(np.arange(len(keys), dtype=np.int32), len(masks))
+    return near, rows
+
+
+def lookup_sorted(keys, values, queries):
+    """values[i] where keys[i] == query, else UNMATCHED. Queries are sorted first for cache locality."""
+    found = np.full(len(queries), UNMATCHED, dtype=np.int32)
+    if not len(keys) or not len(queries):
+        return found
+    order = np.argsort(queries)
+    ordered = queries[order]
+    pos = np.minimum(keys.searchsorted(ordered), len(keys) - 1)
+    hit = keys[pos] == ordered
+    found[order[hit]] = values[pos[hit]]
+    return found
+
+
+class DemuxIndex:
+    """
+    Barcode -> library row lookup tolerant of `max_mismatches` (0 or 1)
+    substitutions.
+
+    Two sorted key arrays of 2-bit packed barcodes: the library's exact
+    barcodes, and (with max_mismatches=1) all 3 * length of their
+    one-substitution neighbours. A neighbour shared by two barcodes, or one
+    that is itself a library barcode, maps to AMBIGUOUS or is dropped, so a
+    read is only corrected when exactly one barcode explains it. Most reads
+    match exactly and only the misses are looked up in the larger
+    neighbour table.
+    """
+
+    def __init__(self, names, barcodes, max_mismatches=1):
+        if max_mismatches not in (0, 1):
+            raise ValueError(f"❌ max_mismatches must be 0 or 1, got {max_mismatches}")
+        self.names = np.asarray(names, dtype=str)
+        self.barcodes = np.asarray(barcodes, dtype=str)
+        self.max_mismatches = max_mismatches
+        keys, self.length = encode_barcodes(self.barcodes)
+        self.exact_keys, self.exact_rows = unique_rows(keys, np.arange(len(keys), dtype=np.int32))
+
+        self.near_keys = np.empty(0, dtype=np.uint64)
+        self.near_rows = np.empty(0, dtype=np.int32)
+        if max_mismatches:
+            near, rows = unique_rows(*neighbour_keys(self.exact_keys, self.length))
+            # A neighbour that is itself a library barcode is always read as that barcode
+            keep = lookup_sorted(self.exact_keys, self.exact_rows, near) == UNMATCHED
+            # Rows of the neighbour table point at exact_keys positions; map them to library rows
+            rows = np.where(rows >= 0, self.exact_rows[np.maximum(rows, 0)], rows)
+            self.near_keys, self.near_rows = near[keep], rows[keep]
+
+    @property
+    def ambiguous(self):
+        """Neighbour keys shared by several barcodes (reads there are not corrected)."""
+        return int((self.near_rows == AMBIGUOUS).sum())
+
+    @classmethod
+    def from_oligo_file(cls, oligo_file, barcode_file=None, max_mismatches=1):
+        """
+        Index of an oligo library written by generate_fragments. FASTA and
+        vendor sheets carry no barcode column, so barcodes are cut from the
+        oligos after LEFT_PBS; their length comes from `barcode_file`.
+        """
+        df = read_oligo_file(oligo_file)
+        columns = {col.lower(): col for col in df.columns}
+        names = df[columns['frag_numb']] if 'frag_numb' in columns else df.iloc[:, 0]
+        if 'barcode' in columns:
+            barcodes = df[columns['barcode']]
+        elif barcode_file:
+            pool = BarcodePool(barcode_file)
+            length = barcode_length(pool.read(0, 1000))
+            barcodes = df['oligo'].str.slice(len(LEFT_PBS), len(LEFT_PBS) + length)
+        else:
+            raise ValueError(f"❌ {oligo_file} has no barcode column; pass the barcode file to get their length.")
+        return cls(names.astype(str).tolist(), barcodes.astype(str).tolist(), max_mismatches)
+
+    def lookup(self, keys):
+        """Library row of every key (UNMATCHED / AMBIGUOUS) and whether it matched exactly."""
+        rows = lookup_sorted(self.exact_keys, self.exact_rows, keys)
+        exact = rows >= 0
+        missed = np.flatnonzero(rows == UNMATCHED)
+        if len(self.near_keys) and len(missed):
+            rows[missed] = lookup_sorted(self.near_keys, self.near_rows, keys[missed])
+        return rows, exact
+
+    def lookup_unknown(self, keys, positions):
+        """
+        Library row of keys with one unknown base at `positions` (read as A):
+        the barcode that matches every other base exactly. The N uses the
+        mismatch budget, so a read two barcodes explain is AMBIGUOUS and no
+        further substitution is corrected.
+        """
+        shifts = (2 * (self.length - 1 - positions)).astype(np.uint64)
+        hits = [lookup_sorted(self.exact_keys, self.exact_rows, keys | (np.uint64(base) << shifts))
+                for base in range(4)]
+        hits = np.stack(hits, axis=1)
+        found = hits != UNMATCHED
+        rows = hits[np.arange(len(hits)), found.argmax(axis=1)]
+        rows[found.sum(axis=1) > 1] = AMBIGUOUS
+        return rows
+
+    def save(self, directory, stamp):
+        """One .npy per array so worker processes can memory-map and share them."""
+        os.makedirs(directory, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        meta = dict(stamp, version=INDEX_VERSION, length=self.length, max_mismatches=self.max_mismatches)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, stamp=None):
+        """A saved index (memory-mapped), or None if it is missing or does not match `stamp`."""
+        meta_file = os.path.join(directory, 'meta.json')
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION or any(meta.get(key) != value for key, value in (stamp or {}).items()):
+            return None
+        index = cls.__new__(cls)
+        index.length = meta['length']
+        index.max_mismatches = meta['max_mismatches']
+        for name in INDEX_ARRAYS:
+            setattr(index, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        return index
+
+
+def index_stamp(oligo_file, max_mismatches):
+    stat = os.stat(oligo_file)
+    return {'source': os.path.abspath(oligo_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'max_mismatches': max_mismatches}
+
+
+def open_index(oligo_file, barcode_file=None, max_mismatches=1, index_dir=None):
+    """
+    The DemuxIndex of `oligo_file`, cached in `index_dir` (default
+    `<oligo_file>.demux/`) and rebuilt when the oligo file changes.
+    Returns (index, index_dir).
+    """
+    index_dir = index_dir or oligo_file + '.demux'
+    stamp = index_stamp(oligo_file, max_mismatches)
+    index = DemuxIndex.load(index_dir, stamp)
+    if index is None:
+        with phase('index'):
+            built = DemuxIndex.from_oligo_file(oligo_file, barcode_file, max_mismatches)
+            built.save(index_dir, stamp)
+        print(f"Demux index of {len(built.names):,} barcodes ({len(built.near_keys):,} one-mismatch keys, "
+              f"{built.ambiguous:,} ambiguous) saved to: {index_dir}")
+        index = DemuxIndex.load(index_dir, stamp)
+    return index, index_dir
+
+
+class ReadLayout:
+    """
+    Where the barcode sits in a read. Forward reads start at LEFT_PBS and
+    carry `barcode`; reverse reads start at the reverse complement of
+    RIGHT_PBS and carry barcode_2 reverse-complemented. The barcode is
+    expected `offset` bases in (default: right after the primer-binding
+    site). With `max_shift`, reads whose anchor (the last ANCHOR_BASES of
+    the primer-binding site, allowing one mismatch) sits up to that many
+    bases off are realigned.
+    """
+
+    def __init__(self, length, offset=None, max_shift=0, reverse=False):
+        primer = reverse_complement(RIGHT_PBS) if reverse else LEFT_PBS
+        self.length = length
+        self.offset = len(primer) if offset is None else offset
+        self.max_shift = max_shift
+        self.reverse = reverse
+        self.anchor = CODES[np.frombuffer(primer[-ANCHOR_BASES:].encode(), dtype=np.uint8)]
+        margin = ANCHOR_BASES + max_shift if max_shift else 0
+        if self.offset < margin:
+            raise ValueError(f"❌ offset {self.offset} leaves no room for the anchor with max_shift={max_shift}.")
+        # Read bases kept per read: from the earliest anchor start to the latest barcode end
+        self.start = self.offset - margin
+        self.width = margin + max_shift + length
+
+    def barcode_codes(self, window):
+        """(n, length) base codes of each read's barcode from its (n, width) window."""
+        base = self.offset - self.start
+        if not self.max_shift:
+            codes = window[:, base:base + self.length]
+        else:
+            # Nearest exact anchor first, then one allowing a sequencing error; else the nominal offset
+            starts = np.full(len(window), base)
+            unset = np.ones(len(window), dtype=bool)
+            for tolerance in (0, 1):
+                for shift in sorted(range(-self.max_shift, self.max_shift + 1), key=abs):
+                    at = base + shift
+                    mismatches = (window[:, at - ANCHOR_BASES:at] != self.anchor).sum(axis=1)
+                    found = unset & (mismatches <= tolerance)
+                    starts[found] = at
+                    unset &= ~found
+            codes = window[np.arange(len(window))[:, None], starts[:, None] + np.arange(self.length)]
+        if self.reverse:
+            codes = np.where(codes < 4, 3 - codes, 4).astype(np.uint8)[:, ::-1]
+        return codes
+
+
+def demux_windows(window_bytes, index, layout):
+    """
+    Assign one chunk of read windows (fixed-width bytes) to library rows.
+    An N counts as a mismatch: with max_mismatches=1 a read with one N is
+    assigned only when its other bases match a barcode exactly, and reads
+    with more are unreadable. Returns (rows, exact, unreadable) per read.
+    """
+    raw = window_bytes.view(np.uint8).reshape(len(window_bytes), -1)
+    codes = layout.barcode_codes(CODES[raw])
+    unknown = (codes == 4).sum(axis=1)
+    keys = pack_codes(codes & 3)
+    rows, exact = index.lookup(keys)
+    exact &= unknown == 0
+    unreadable = unknown > index.max_mismatches
+    single = np.flatnonzero((unknown == 1) & ~unreadable)
+    if len(single):
+        positions = (codes[single] == 4).argmax(axis=1)
+        rows[single] = index.lookup_unknown(keys[single], positions)
+    rows[unreadable] = UNMATCHED
+    return rows, exact, unreadable
+
+
+def chunk_counts(rows, exact, unreadable):
+    """Sparse per-row read counts and per-status totals of one chunk."""
+    assigned = rows >= 0
+    hit_rows, reads = np.unique(rows[assigned], return_counts=True)
+    corrected_rows, corrected = np.unique(rows[assigned & ~exact], return_counts=True)
+    status = {
+        'exact': int((assigned & exact).sum()),
+        'corrected': int((assigned & ~exact).sum()),
+        'ambiguous': int((rows == AMBIGUOUS).sum()),
+        'unmatched': int(((rows == UNMATCHED) & ~unreadable).sum()),
+        'unreadable': int(unreadable.sum()),
+    }
+    return hit_rows, reads, corrected_rows, corrected, status
+
+
+# Index and layout of each worker process, set by _init_worker
+_demux = {}
+
+
+def _init_worker(index_dir, layout):
+    _demux['index'] = DemuxIndex.load(index_dir)
+    _demux['layout'] = layout
+
+
+def _demux_task(window_bytes):
+    return chunk_counts(*demux_windows(window_bytes, _demux['index'], _demux['layout']))
+
+
+def fastq_windows(path, start, width, chunksize=DEMUX_CHUNK):
+    """
+    Yield the bases start..start+width of every read, `chunksize` reads at a
+    time, as a fixed-width bytes array. Short reads are zero-padded (read as
+    N). Plain or gzipped FASTQ.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        while True:
+            lines = list(islice(f, 4 * chunksize))
+            if not lines:
+                return
+            if len(lines) % 4 or not lines[0].startswith(b'@') or not lines[2].startswith(b'+'):
+                raise ValueError(f"❌ {path} is not a well-formed FASTQ file (4 lines per read).")
+            # The newline of a short read lands in the window and reads as N, like the padding
+            yield np.array([line[start:start + width] for line in lines[1::4]], dtype=f'S{width}')
+
+
+def bounded_map(pool, func, tasks, in_flight):
+    """pool.map that keeps at most `in_flight` tasks queued, so a large FASTQ is never read ahead whole."""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(func, task))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def demultiplex(
+    fastq_files,
+    oligo_file,
+    output_file=None,
+    barcode_file=None,
+    max_mismatches=1,
+    offset=None,
+    max_shift=0,
+    reverse=False,
+    workers=None,
+    chunksize=DEMUX_CHUNK,
+    index_dir=None,
+):
+    """
+    Count reads per library oligo. Barcodes are read `offset` bases into
+    each read (see ReadLayout) and looked up in the oligo library's
+    DemuxIndex, correcting up to `max_mismatches` substitution. FASTQ files
+    are streamed in chunks of `chunksize` reads and looked up across a pool
+    of `workers` processes (None: one per CPU).
+
+    Writes per-oligo counts (frag_numb, barcode, reads, exact, corrected)
+    to `output_file` (default `<oligo stem>_counts.txt`) and the read totals
+    per status next to it as `*_summary.txt`. Returns (counts, summary).
+    """
+    if isinstance(fastq_files, str):
+        fastq_files = [fastq_files]
+    for path in [oligo_file] + list(fastq_files):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"❌ File not found: {path}")
+    output_file = output_file or os.path.splitext(oligo_file)[0] + '_counts.txt'
+    summary_file = os.path.splitext(output_file)[0] + '_summary.txt'
+
+    index, index_dir = open_index(oligo_file, barcode_file, max_mismatches, index_dir)
+    layout = ReadLayout(index.length, offset, max_shift, reverse)
+    reads = np.zeros(len(index.names), dtype=np.int64)
+    corrected = np.zeros(len(index.names), dtype=np.int64)
+    status = dict.fromkeys(STATUSES, 0)
+
+    def add(result):
+        hit_rows, hit_reads, corrected_rows, corrected_reads, chunk_status = result
+        reads[hit_rows] += hit_reads
+        corrected[corrected_rows] += corrected_reads
+        for key, value in chunk_status.items():
+            status[key] += value
+        record_rows(rows_in=sum(chunk_status.values()))
+
+    workers = workers or os.cpu_count()
+    chunks = (window for path in fastq_files
+              for window in fastq_windows(path, layout.start, layout.width, chunksize))
+    with phase('lookup'):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(index_dir, layout)) as pool:
+                for result in bounded_map(pool, _demux_task, chunks, 2 * workers):
+                    add(result)
+        else:
+            _init_worker(index_dir, layout)
+            for window in chunks:
+                add(_demux_task(window))
+
+    counts = pd.DataFrame({
+        'frag_numb': index.names,
+        'barcode': index.barcodes,
+        'reads': reads,
+        'exact': reads - corrected,
+        'corrected': corrected,
+    })
+    total = sum(status.values())
+    summary = pd.DataFrame({'status': list(status), 'reads': list(status.values())})
+    summary['percent'] = summary['reads'] / max(total, 1) * 100
+    write_table(counts, output_file)
+    write_table(summary, summary_file)
+
+    print(f"\nDemultiplexed {total:,} reads:")
+    print(summary.to_string(index=False, float_format="%.2f"))
+    print(f"{int((reads > 0).sum()):,} of {len(reads):,} oligos seen")
+    print(f"\nPer-oligo counts saved to: {output_file}")
+    print(f"Summary saved to: {summary_file}")
+    return counts, summary
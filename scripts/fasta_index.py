@@ -0,0 +1,122 @@
+# scripts/fasta_index.py
+import os
+
+import numpy as np
+import pandas as pd
+
+# Case-preserving complement, as bedtools getfasta -s does; other bytes pass through
+COMPLEMENT = np.arange(256, dtype=np.uint8)
+for _a, _b in [(b'A', b'T'), (b'C', b'G'), (b'a', b't'), (b'c', b'g')]:
+    COMPLEMENT[_a[0]], COMPLEMENT[_b[0]] = _b[0], _a[0]
+
+
+def build_fai(fasta_file, fai_file=None):
+    """
+    Write a samtools-style .fai (name, length, offset, linebases, linewidth)
+    for `fasta_file`. Every sequence must use a fixed line width.
+    """
+    fai_file = fai_file or fasta_file + '.fai'
+    entries = []
+    current = None
+
+    def finish(entry):
+        if entry is not None:
+            entries.append(entry)
+
+    with open(fasta_file, 'rb') as f:
+        offset = 0
+        short_line_seen = False
+        for line in f:
+            if line.startswith(b'>'):
+                finish(current)
+                name = line[1:].split()[0].decode()
+                current = [name, 0, offset + len(line), 0, 0]
+                short_line_seen = False
+            elif current is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if current[3] == 0:
+                    current[3], current[4] = bases, len(line)
+                elif short_line_seen and bases:
+                    raise ValueError(f"❌ Uneven line lengths in {name}; cannot index {fasta_file}")
+                elif bases != current[3]:
+                    short_line_seen = True
+                current[1] += bases
+            offset += len(line)
+        finish(current)
+
+    # Written aside and renamed so a build running alongside never reads half an index
+    tmp = f'{fai_file}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as out:
+        for name, length, seq_offset, linebases, linewidth in entries:
+            out.write(f"{name}\t{length}\t{seq_offset}\t{linebases}\t{linewidth}\n")
+    os.replace(tmp, fai_file)
+    return fai_file
+
+
+def read_fai(fai_file):
+    index = {}
+    with open(fai_file) as f:
+        for line in f:
+            name, length, offset, linebases, linewidth = line.split('\t')[:5]
+            index[name] = (int(length), int(offset), int(linebases), int(linewidth))
+    return index
+
+
+class FastaIndex:
+    """
+    Memory-mapped FASTA with a .fai index (built on first use if missing).
+
+    `fetch` slices many [start, end) windows at once: byte offsets for every
+    base of every window are computed as one array and gathered from the
+    mapped file, visiting rows in chromosome/offset order.
+    """
+
+    def __init__(self, fasta_file):
+        fai_file = fasta_file + '.fai'
+        if not os.path.exists(fai_file) or os.path.getmtime(fai_file) < os.path.getmtime(fasta_file):
+            print(f"Indexing {fasta_file}...")
+            build_fai(fasta_file, fai_file)
+        self.fasta_file = fasta_file
+        self.index = read_fai(fai_file)
+        self.genome = np.memmap(fasta_file, dtype=np.uint8, mode='r')
+
+    def fetch(self, chroms, starts, ends, strands=None):
+        """
+        Sequences for BED-style windows; '-' strands are reverse-complemented.
+        Windows on unknown chromosomes or outside the chromosome (a negative
+        start included) come back as None, as from fetch_windows_bedtools.
+        """
+        chroms = np.asarray(chroms, dtype=object)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        strands = np.asarray(strands if strands is not None else ['+'] * len(chroms), dtype=object)
+        n = len(chroms)
+
+        names = list(self.index)
+        name_id = {name: i for i, name in enumerate(names)}
+        inverse, uniq = pd.factorize(chroms)
+        ids = np.array([name_id.get(c, -1) for c in uniq], dtype=np.int64)[inverse]
+
+        table = np.array([self.index[name] for name in names], dtype=np.int64).reshape(-1, 4)
+        safe_ids = np.where(ids >= 0, ids, 0)
+        length, offset, linebases, linewidth = (table[safe_ids, k] for k in range(4))
+        valid = (ids >= 0) & (starts >= 0) & (ends <= length) & (ends > starts)
+
+        result = np.full(n, None, dtype=object)
+        widths = ends - starts
+        for width in np.unique(widths[valid]):
+            rows = np.flatnonzero(valid & (widths == width))
+            pos = starts[rows, None] + np.arange(width)
+            byte = offset[rows, None] + (pos // linebases[rows, None]) * linewidth[rows, None] + pos % linebases[rows, None]
+
+            # Gather in file order for locality, then put rows back
+            order = np.argsort(byte[:, 0], kind='stable')
+            seqs = np.empty((len(rows), width), dtype=np.uint8)
+            seqs[order] = self.genome[byte[order]]
+
+            minus = strands[rows] == '-'
+            seqs[minus] = COMPLEMENT[seqs[minus, ::-1]]
+            result[rows] = [s.decode('ascii') for s in np.ascontiguousarray(seqs).view(f'S{width}').ravel()]
+
+        return result
+
@@ -1,30 +1,39 @@
 # scripts/fragment_generation.py
+import numpy as np
 import pandas as pd
 import os
 
+from scripts.barcode_collisions import collision_free_barcodes, report_skipped
+from scripts.barcode_pool import BarcodePool, LibraryFingerprint, take_next
+from scripts.profiling import phase, record_rows
+from scripts.table_io import intermediate_file, is_columnar, read_table, write_table
+
 # Constants
 LEFT_PBS = "GACGTTCTCACAGCAATTCGTACAGTCGACGTCGATTCGTGT"
 PROTO_CONST = "TTGACATTCTGCAATTA"
 PAM_COST = "AGTATGTATGCTTCGCGCAGTGCGACTTCGCAGCGCATCACTTCA"
 RIGHT_PBS = "AGAGCTGCGAGTCTTACAGCATTGC"
+CONSTANT_REGIONS = (LEFT_PBS, PROTO_CONST, PAM_COST, RIGHT_PBS)
+
+# Output formats other than TSV, chosen by file extension
+FASTA_SUFFIXES = ('.fa', '.fasta', '.fna')
+VENDOR_SUFFIX = '.csv'
+WRITE_CHUNK = 100_000
 
 def generate_fragments(
     input_file=None,
     barcode_file="barcode_list.txt",
-    output_file=None
+    output_file=None,
+    skip_collisions=True,
+    build=None,
 ):
     if input_file is None:
-        dedup_file = "intermediate_files/5a_pre_barcode_plus_variants.txt"
-        fallback_file = "intermediate_files/3a_cleaned_file_with_sequences.txt"
+        dedup_file = intermediate_file('5a_pre_barcode_plus_variants')
+        fallback_file = intermediate_file('3a_cleaned_file_with_sequences')
         input_file = dedup_file if os.path.exists(dedup_file) else fallback_file
 
     if output_file is None:
-        user_filename = input("Enter a name for the final oligo output file (without extension): ").strip()
-        if not user_filename:
-            raise ValueError("❌ Output filename cannot be empty.")
-        if not user_filename.endswith(".txt"):
-            user_filename += ".txt"
-        output_file = os.path.join(os.getcwd(), user_filename)
+        output_file = ask_output_file()
 
 
     if not os.path.exists(input_file):
@@ -34,38 +43,229 @@ def generate_fragments(
         raise FileNotFoundError(f"❌ Barcode file not found: {barcode_file}")
 
     # Read data
-    df = pd.read_csv(input_file, sep='\t')
+    df = read_table(input_file)
+
+    with phase('barcodes'):
+        barcodes = allocate_barcodes(barcode_file, df, build or build_name(output_file), skip_collisions)
+    with phase('assemble_write'):
+        write_oligos(df, barcodes, output_file)
+    print(f"Final annotated oligo file saved to: {output_file}")
+    return output_file
+
+
+def ask_output_file():
+    user_filename = input("Enter a name for the final oligo output file (without extension for a .txt table): ").strip()
+    if not user_filename:
+        raise ValueError("❌ Output filename cannot be empty.")
+    if output_format(user_filename) == 'tsv' and not user_filename.endswith(".txt"):
+        user_filename += ".txt"
+    return os.path.join(os.getcwd(), user_filename)
+
+
+def build_name(output_file):
+    """Ledger name of a library build: the output file's absolute path."""
+    return os.path.abspath(output_file)
+
+
+def allocate_barcodes(barcode_file, df, build, skip_collisions=True):
+    """
+    Barcodes for the rows of `df`, taken from the barcode pool and recorded
+    in its ledger under `build`. With `skip_collisions`, barcodes that (or
+    whose reverse complement) occur in a constant region or any
+    fetched_sequence are passed over and the skips are reported.
+    """
+    fragments = df['fetched_sequence'] if 'fetched_sequence' in df.columns else ()
+    fingerprint = LibraryFingerprint()
+    fingerprint.update(len(df), fragments)
+
+    def select(candidates, n):
+        if not skip_collisions:
+            return take_next(candidates, n)
+        chosen, skipped = collision_free_barcodes(candidates, n, CONSTANT_REGIONS, fragments)
+        report_skipped(skipped)
+        return chosen, n + sum(skipped.values())
+
+    return BarcodePool(barcode_file).allocate(len(df), build, select, str(fingerprint))
+
+
+def fixed_width_bytes(values):
+    """(n, width) uint8 matrix when every value is a string of one width, else None."""
+    values = pd.Series(values, dtype=object)
+    lengths = values.str.len()
+    if values.empty or lengths.isna().any() or lengths.nunique() != 1:
+        return None
+    try:
+        raw = np.array(values.tolist(), dtype=bytes)
+    except UnicodeEncodeError:
+        return None
+    return raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+
+
+def fill_matrix(segments):
+    """
+    Lay `segments` (constant strings or (n, width) uint8 matrices) side by
+    side in a preallocated matrix. Constants are written once into a template
+    row; the variable segments are copied into their column slices.
+    """
+    n = next(len(seg) for seg in segments if not isinstance(seg, str))
+    widths = [len(seg) if isinstance(seg, str) else seg.shape[1] for seg in segments]
+    starts = np.r_[0, np.cumsum(widths)]
+    template = np.zeros(starts[-1], dtype=np.uint8)
+    for seg, lo, hi in zip(segments, starts[:-1], starts[1:]):
+        if isinstance(seg, str):
+            template[lo:hi] = np.frombuffer(seg.encode(), dtype=np.uint8)
+
+    matrix = np.empty((n, starts[-1]), dtype=np.uint8)
+    matrix[:] = template
+    for seg, lo, hi in zip(segments, starts[:-1], starts[1:]):
+        if not isinstance(seg, str):
+            matrix[:, lo:hi] = seg
+    return matrix
+
+
+def oligo_segments(bc, fs):
+    return [LEFT_PBS, bc, PROTO_CONST, fs, PAM_COST, bc, RIGHT_PBS]
+
+
+def oligo_matrix(barcodes, fetched):
+    """Oligos as an (n, width) byte matrix, or None if barcodes or fragments are ragged."""
+    bc = fixed_width_bytes(barcodes)
+    fs = fixed_width_bytes(fetched)
+    if bc is None or fs is None:
+        return None
+    return fill_matrix(oligo_segments(bc, fs))
+
+
+def matrix_lines(matrix):
+    """Rows of an ASCII byte matrix as str."""
+    width = matrix.shape[1]
+    text = matrix.tobytes().decode('ascii')
+    return [text[i:i + width] for i in range(0, len(text), width)]
 
-    # Read and reverse barcodes
-    with open(barcode_file, 'r') as f:
-        barcodes = [line.strip() for line in f if line.strip()]
-    barcodes.reverse()
 
+def oligo_strings(barcodes, fetched):
+    """`oligo` column values for one chunk."""
+    matrix = oligo_matrix(barcodes, fetched)
+    if matrix is not None:
+        oligos = np.empty(len(matrix), dtype=object)
+        oligos[:] = matrix_lines(matrix)
+        return oligos
+    # Ragged or missing fragments: plain string concatenation, as before
+    bc = pd.Series(barcodes, dtype=object).astype(str)
+    fs = pd.Series(np.asarray(fetched, dtype=object)).astype(str)
+    return (LEFT_PBS + bc + PROTO_CONST + fs + PAM_COST + bc + RIGHT_PBS).to_numpy(dtype=object)
+
+
+def tsv_tail_lines(barcodes, fetched):
+    """
+    The tab-joined Left_PBS .. oligo fields of every row, built as one byte
+    matrix so the constant columns are never materialised. None if ragged.
+    """
+    bc = fixed_width_bytes(barcodes)
+    fs = fixed_width_bytes(fetched)
+    if bc is None or fs is None:
+        return None
+    fields = [LEFT_PBS, bc, PROTO_CONST, fs, PAM_COST, bc, RIGHT_PBS]
+    segments = []
+    for field in fields:
+        segments += [field, '\t']
+    return matrix_lines(fill_matrix(segments + oligo_segments(bc, fs)))
+
+
+def write_tsv_chunk(f, chunk, barcodes, header):
+    """
+    Write one chunk of the TSV. The library's own columns go through to_csv;
+    the assembled fields are appended from tsv_tail_lines. Falls back to a
+    plain to_csv of the annotated chunk when the fast path does not apply.
+    """
+    head = chunk.drop(columns='fetched_sequence')
+    if header:
+        annotate_chunk(chunk.iloc[:0], barcodes[:0], barcodes[:0]).to_csv(f, sep='\t', index=False)
+
+    tail = tsv_tail_lines(barcodes, chunk['fetched_sequence'])
+    if tail is not None and head.shape[1] > 1:
+        text = head.to_csv(sep='\t', index=False, header=False)
+        lines = text.split(os.linesep)[:-1]
+        # A quoted field spanning lines would break the row alignment
+        if len(lines) == len(chunk):
+            f.writelines(f"{line}\t{rest}{os.linesep}" for line, rest in zip(lines, tail))
+            return
+
+    oligos = oligo_strings(barcodes, chunk['fetched_sequence'])
+    annotate_chunk(chunk, barcodes, oligos).to_csv(f, sep='\t', index=False, header=False)
+
+
+def annotate_chunk(df, barcodes, oligos):
+    """`df` with the constant regions, barcodes and oligo added in output column order."""
+    fetched = df['fetched_sequence'].to_numpy()
+    return df.drop(columns='fetched_sequence').assign(
+        Left_PBS=LEFT_PBS,
+        barcode=barcodes,
+        proto_const=PROTO_CONST,
+        fetched_sequence=fetched,
+        PAM_cost=PAM_COST,
+        barcode_2=barcodes,
+        Right_PBS=RIGHT_PBS,
+        oligo=oligos,
+    )
+
+
+def assemble_oligos(df, barcodes):
+    """Add constant regions, barcodes and the assembled `oligo` column to `df`."""
     if len(barcodes) < len(df):
         raise ValueError("❌ Not enough barcodes for the number of rows in the input file.")
 
-    # Assign barcodes
-    df['Left_PBS'] = LEFT_PBS
-    df['barcode'] = barcodes[:len(df)]
-    df['proto_const'] = PROTO_CONST
-    df['PAM_cost'] = PAM_COST
-    df['barcode_2'] = df['barcode']
-    df['Right_PBS'] = RIGHT_PBS
-
-    # Reorder columns
-    fetched_seq = df.pop('fetched_sequence')
-    df.insert(df.columns.get_loc('proto_const') + 1, 'fetched_sequence', fetched_seq)
-
-    # Generate oligo
-    df['oligo'] = (
-        df['Left_PBS'].astype(str) +
-        df['barcode'].astype(str) +
-        df['proto_const'].astype(str) +
-        df['fetched_sequence'].astype(str) +
-        df['PAM_cost'].astype(str) +
-        df['barcode_2'].astype(str) +
-        df['Right_PBS'].astype(str)
-    )
+    barcodes = np.asarray(barcodes[:len(df)], dtype=object)
+    return annotate_chunk(df, barcodes, oligo_strings(barcodes, df['fetched_sequence']))
 
-    df.to_csv(output_file, sep='\t', index=False)
-    print(f"Final annotated oligo file saved to: {output_file}")
+
+def output_format(path):
+    suffix = os.path.splitext(str(path))[1].lower()
+    if suffix in FASTA_SUFFIXES:
+        return 'fasta'
+    if suffix == VENDOR_SUFFIX:
+        return 'vendor'
+    if is_columnar(path):
+        return 'columnar'
+    return 'tsv'
+
+
+def oligo_names(df):
+    return (df['frag_numb'] if 'frag_numb' in df.columns else df.iloc[:, 0]).astype(str).tolist()
+
+
+def write_oligos(df, barcodes, output_file, chunksize=WRITE_CHUNK):
+    """
+    Assemble and write the oligo library `chunksize` rows at a time without
+    building the repeated constant columns.
+
+    The format follows the extension: .fa/.fasta/.fna gives FASTA named by
+    frag_numb, .csv a Name,Sequence sheet for synthesis vendors, .npz the
+    columnar format (assembled in one piece) and anything else the TSV.
+    """
+    if len(barcodes) < len(df):
+        raise ValueError("❌ Not enough barcodes for the number of rows in the input file.")
+
+    fmt = output_format(output_file)
+    if fmt == 'columnar':
+        write_table(assemble_oligos(df, barcodes), output_file)
+        return
+
+    directory = os.path.dirname(str(output_file))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_file, 'w', newline='') as f:
+        if fmt == 'vendor':
+            f.write('Name,Sequence\n')
+        for lo in range(0, max(len(df), 1), chunksize):
+            chunk = df.iloc[lo:lo + chunksize]
+            chunk_barcodes = np.asarray(barcodes[lo:lo + len(chunk)], dtype=object)
+            if fmt == 'tsv':
+                write_tsv_chunk(f, chunk, chunk_barcodes, header=lo == 0)
+                continue
+            oligos = oligo_strings(chunk_barcodes, chunk['fetched_sequence'])
+            if fmt == 'fasta':
+                f.writelines(f">{name}\n{oligo}\n" for name, oligo in zip(oligo_names(chunk), oligos))
+            else:
+                f.writelines(f"{name},{oligo}\n" for name, oligo in zip(oligo_names(chunk), oligos))
+    record_rows(rows_out=len(df))
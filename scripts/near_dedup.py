@@ -0,0 +1,186 @@
+# scripts/near_dedup.py
+import numpy as np
+import pandas as pd
+
+from scripts.dedup import merge_mutation_labels
+
+# Seed keys use one base-5 digit per base (A, C, G, T, anything else), so a
+# segment of up to MAX_SEGMENT bases fits in a uint64
+DIGITS = np.full(256, 4, dtype=np.uint64)
+for _code, _base in enumerate(b'ACGT'):
+    DIGITS[_base] = DIGITS[_base + 32] = _code
+MAX_SEGMENT = 27
+
+
+def sequence_matrix(values):
+    """(n, width) uint8 matrix of upper-cased bases for same-length strings."""
+    raw = np.array(values, dtype=bytes)
+    matrix = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    return np.where(matrix >= ord('a'), matrix - 32, matrix).astype(np.uint8)
+
+
+def seed_keys(matrix, max_mismatches):
+    """
+    (n_segments, n) keys, one per segment of each row.
+
+    Rows within `max_mismatches` of each other split into more than
+    `max_mismatches` segments agree exactly on at least one of them.
+    """
+    width = matrix.shape[1]
+    n_segments = min(width, max(max_mismatches + 1, -(-width // MAX_SEGMENT)))
+    size, extra = divmod(width, n_segments)
+    keys = np.zeros((n_segments, len(matrix)), dtype=np.uint64)
+    start = 0
+    for s in range(n_segments):
+        stop = start + size + (s < extra)
+        for j in range(start, stop):
+            keys[s] = keys[s] * np.uint64(5) + DIGITS[matrix[:, j]]
+        start = stop
+    return keys
+
+
+def bucket_pairs(keys):
+    """Yield (i, j) index arrays, i < j, for every pair of rows sharing a key."""
+    n = len(keys)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.repeat(np.r_[starts[1:], n], np.diff(np.r_[starts, n]))
+    offset = 1
+    pos = np.flatnonzero(ends - np.arange(n) > offset)
+    while len(pos):
+        yield order[pos], order[pos + offset]
+        offset += 1
+        pos = pos[ends[pos] - pos > offset]
+
+
+def find_near_pairs(matrix, max_mismatches):
+    """
+    (i, j, distance) for every pair of rows, i < j, at most `max_mismatches`
+    apart. Each pair is only compared in the first segment it shares.
+    """
+    keys = seed_keys(matrix, max_mismatches)
+    found = []
+    for s in range(len(keys)):
+        for i, j in bucket_pairs(keys[s]):
+            if s:
+                first = ~(keys[:s, i] == keys[:s, j]).any(axis=0)
+                i, j = i[first], j[first]
+            distance = (matrix[i] != matrix[j]).sum(axis=1)
+            close = distance <= max_mismatches
+            found.append((i[close], j[close], distance[close]))
+    if not found:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate(parts) for parts in zip(*found))
+
+
+def greedy_clusters(n, i, j, distance):
+    """
+    Fold each row into the earliest kept row within range of it.
+
+    Returns rep (the kept row each row belongs to, itself for kept rows) and
+    the distance of every row to its rep. Every member is within range of its
+    kept row, so clusters never chain.
+    """
+    order = np.lexsort((j, i))
+    rep = list(range(n))
+    dist = [0] * n
+    for a, b, d in zip(i[order].tolist(), j[order].tolist(), distance[order].tolist()):
+        if rep[a] == a and rep[b] == b:
+            rep[b] = a
+            dist[b] = d
+    return np.array(rep, dtype=np.int64), np.array(dist, dtype=np.int64)
+
+
+def near_duplicate_clusters(sequences, max_mismatches):
+    """rep and distance arrays over `sequences`; missing values are left alone."""
+    sequences = pd.Series(sequences).reset_index(drop=True)
+    n = len(sequences)
+    rep = np.arange(n)
+    dist = np.zeros(n, dtype=np.int64)
+    present = sequences.notna().to_numpy()
+    lengths = sequences[present].str.len()
+
+    # Hamming distance is only defined between windows of the same width
+    for _, rows in lengths.groupby(lengths).groups.items():
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) < 2:
+            continue
+        matrix = sequence_matrix(sequences[rows].tolist())
+        i, j, distance = find_near_pairs(matrix, max_mismatches)
+        group_rep, group_dist = greedy_clusters(len(rows), i, j, distance)
+        rep[rows] = rows[group_rep]
+        dist[rows] = group_dist
+    return rep, dist
+
+
+def collapse_near_duplicates(deduplicated_df, filtered_out_df, max_mismatches, merge=True):
+    """
+    Cluster the exact-deduplicated rows whose `fetched_sequence` windows are
+    within `max_mismatches` of an earlier kept row.
+
+    With `merge`, members are moved to the filtered-out table with their
+    `kept_frag_numb` and `near_mismatches`, and their mutation labels are
+    folded into the kept row exactly like exact duplicates. Otherwise no rows
+    are removed and each clustered row gets the kept row's frag_numb in a
+    `near_cluster` column. Returns (deduplicated, filtered_out, clusters).
+    """
+    df = deduplicated_df.reset_index(drop=True)
+    rep, dist = near_duplicate_clusters(df['fetched_sequence'], max_mismatches)
+    members = np.flatnonzero(rep != np.arange(len(df)))
+    frag = df['frag_numb'].to_numpy(dtype=object)
+
+    clusters = pd.DataFrame({
+        'kept_frag_numb': frag[rep[members]],
+        'frag_numb': frag[members],
+        'near_mismatches': dist[members],
+    })
+
+    if not merge:
+        df = df.copy()
+        clustered = np.zeros(len(df), dtype=bool)
+        clustered[members] = clustered[rep[members]] = True
+        df['near_cluster'] = np.where(clustered, frag[rep], '')
+        return df, filtered_out_df, clusters
+
+    labels = df['mutation'].to_numpy(dtype=object).copy()
+    merged = {}
+    for member, kept in zip(members.tolist(), rep[members].tolist()):
+        key = (labels[kept], labels[member])
+        label = merged.get(key)
+        if label is None:
+            label = merged[key] = merge_mutation_labels(*key)
+        labels[kept] = label
+
+    df = df.copy()
+    df['mutation'] = labels
+    df.loc[np.unique(rep[members]), 'duplicated'] = 'yes'
+
+    removed = df.iloc[members].copy()
+    removed['duplicated'] = 'yes'
+    removed['kept_frag_numb'] = frag[rep[members]]
+    removed['near_mismatches'] = dist[members]
+
+    filtered_out_df = filtered_out_df.copy()
+    if len(members):
+        # Exact copies of a folded row now point at the row it was folded into
+        folded = dict(zip(frag[members].tolist(), frag[rep[members]].tolist()))
+        kept_frag = filtered_out_df['kept_frag_numb']
+        filtered_out_df['kept_frag_numb'] = kept_frag.map(folded).fillna(kept_frag)
+    filtered_out_df['near_mismatches'] = 0
+
+    kept = df.iloc[np.flatnonzero(rep == np.arange(len(df)))].reset_index(drop=True)
+    filtered_out_df = pd.concat([filtered_out_df, removed], ignore_index=True)
+    return kept, filtered_out_df, clusters
+
+
+def report_near_duplicates(clusters, max_mismatches):
+    print(f"\nNear-duplicate clusters (<= {max_mismatches} mismatches):")
+    if clusters.empty:
+        print("No near-duplicate windows found.")
+        return
+    print(f"Clusters: {clusters['kept_frag_numb'].nunique()}")
+    print(f"Rows folded into a cluster: {len(clusters)}")
+    for distance, count in clusters['near_mismatches'].value_counts().sort_index().items():
+        print(f"  {distance} mismatch(es): {count}")
@@ -0,0 +1,402 @@
+# scripts/oligo_qc.py
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from scripts.fragment_generation import LEFT_PBS, RIGHT_PBS, output_format
+from scripts.profiling import phase
+from scripts.table_io import read_table, write_table
+
+QC_CHUNK = 10_000
+
+# Synthesis-vendor style defaults: no run longer than 6 and 25-65% GC in every 50-nt window
+MAX_HOMOPOLYMER = 6
+GC_WINDOW = 50
+GC_RANGE = (0.25, 0.65)
+
+# Type IIS sites used by common Golden Gate cloning; reverse complements are added automatically
+TYPE_IIS_SITES = {
+    'BsaI': 'GGTCTC',
+    'BsmBI': 'CGTCTC',
+    'BbsI': 'GAAGAC',
+    'SapI': 'GCTCTTC',
+    'PaqCI': 'CACCTGC',
+}
+
+# Sites up to this length use a direct lookup table; longer ones a sorted search
+TABLE_BASES = 12
+# Barcode membership is a bitset over the first BITSET_BASES bases of each window
+BITSET_BASES = 14
+
+CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    CODES[_base] = CODES[_base + 32] = _code
+GC_BYTES = np.zeros(256, dtype=bool)
+GC_BYTES[list(b'GCgc')] = True
+
+COMPLEMENT = str.maketrans('ACGTacgt', 'TGCAtgca')
+
+
+def reverse_complement(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def byte_matrix(values):
+    """(n, width) uint8 matrix of strings, zero-padded on the right, and their lengths."""
+    raw = np.array([str(v) for v in pd.Series(values, dtype=object).tolist()], dtype=bytes)
+    lengths = np.char.str_len(raw)
+    return raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize), lengths
+
+
+def kmer_windows(codes, k):
+    """
+    2-bit codes of every k-mer window of each row, (n, width - k + 1), and a
+    mask of windows made only of A/C/G/T (padding and N are not).
+
+    Windows are built by doubling: 2-mers from 1-mers, 4-mers from 2-mers,
+    ..., and the powers of two in k are appended, so a k-mer costs about
+    2 * log2(k) array operations instead of k.
+    """
+    n, width = codes.shape
+    n_windows = width - k + 1
+    if n_windows < 1:
+        return np.zeros((n, 0), dtype=np.uint64), np.zeros((n, 0), dtype=bool)
+
+    # Column i of `power` holds the span-mer starting at i (complete while i + span <= width)
+    dtype = np.uint32 if k <= 16 else np.uint64
+    power = (codes & 3).astype(dtype)
+    span = 1
+    windows = None
+    size = 0
+    remaining = k
+    while True:
+        if remaining & 1:
+            if windows is None:
+                windows = power.copy()
+            else:
+                windows <<= dtype(2 * span)
+                windows[:, :width - size] |= power[:, size:]
+            size += span
+        remaining >>= 1
+        if not remaining:
+            break
+        doubled = power << dtype(2 * span)
+        doubled[:, :width - span] |= power[:, span:]
+        power = doubled
+        span *= 2
+
+    bad = np.cumsum(np.pad(codes == 4, ((0, 0), (1, 0))), axis=1, dtype=np.int32)
+    valid = (bad[:, k:] - bad[:, :-k]) == 0
+    return windows[:, :n_windows], valid
+
+
+def encode_kmers(seqs):
+    codes = CODES[byte_matrix(seqs)[0]]
+    return kmer_windows(codes, codes.shape[1])[0][:, 0].astype(np.uint64)
+
+
+class ChunkWindows:
+    """
+    k-mer windows of one chunk for every k up to `max_k`, derived from a
+    single pass: the k-mer at a position is the top 2k bits of the
+    max_k-mer there (rows are padded so every start position has one).
+    """
+
+    def __init__(self, codes, lengths, max_k):
+        n, self.width = codes.shape
+        self.max_k = max_k
+        self.lengths = lengths
+        padded = np.full((n, self.width + max_k - 1), 4, dtype=np.uint8)
+        padded[:, :self.width] = codes
+        self.windows = kmer_windows(padded, max_k)[0]
+        # Without N bases inside the oligos, only the right padding invalidates windows
+        bad = codes == 4
+        inner = bad & (np.arange(self.width) < lengths[:, None])
+        self.bad = np.cumsum(np.pad(bad, ((0, 0), (1, 0))), axis=1, dtype=np.int16) if inner.any() else None
+
+    def get(self, k):
+        n_windows = max(self.width - k + 1, 0)
+        windows = self.windows[:, :n_windows] >> (2 * (self.max_k - k))
+        if self.bad is None:
+            valid = np.arange(n_windows) + k <= self.lengths[:, None]
+        else:
+            valid = (self.bad[:, k:] - self.bad[:, :-k]) == 0
+        return windows, valid
+
+
+def longest_homopolymer(matrix):
+    """Length of the longest single-base run in each row (case-insensitive)."""
+    n, width = matrix.shape
+    if width == 0:
+        return np.zeros(n, dtype=np.int64)
+    upper = matrix & 0xDF
+    same = (upper[:, 1:] == upper[:, :-1]) & (upper[:, 1:] != 0)
+    idx = np.arange(width, dtype=np.int16)
+    # Position where the run covering each base started
+    starts = np.ones((n, width), dtype=bool)
+    starts[:, 1:] = ~same
+    run_start = np.maximum.accumulate(np.where(starts, idx, np.int16(0)), axis=1)
+    runs = np.where(upper != 0, idx - run_start + 1, np.int16(0))
+    return runs.max(axis=1).astype(np.int64)
+
+
+def window_gc(matrix, lengths, window):
+    """(min, max) GC fraction over every full `window`-nt window; whole-oligo GC for shorter oligos."""
+    gc = np.zeros((len(matrix), matrix.shape[1] + 1), dtype=np.int16)
+    np.cumsum(GC_BYTES[matrix], axis=1, dtype=np.int16, out=gc[:, 1:])
+    whole = gc[np.arange(len(matrix)), lengths] / np.maximum(lengths, 1)
+    if matrix.shape[1] < window:
+        return whole, whole
+    counts = gc[:, window:] - gc[:, :-window]
+    full = np.arange(counts.shape[1]) + window <= lengths[:, None]
+    has_full = full.any(axis=1)
+    low = np.where(full, counts, np.int16(window + 1)).min(axis=1) / window
+    high = np.where(full, counts, np.int16(-1)).max(axis=1) / window
+    return np.where(has_full, low, whole), np.where(has_full, high, whole)
+
+
+class SiteMatcher:
+    """Multi-pattern matcher for short sites over 2-bit k-mer windows, both strands."""
+
+    def __init__(self, sites):
+        self.names = list(sites)
+        self.by_length = {}
+        for s, name in enumerate(self.names):
+            seq = sites[name].upper()
+            for strand in {seq, reverse_complement(seq)}:
+                self.by_length.setdefault(len(strand), []).append((strand, s))
+        self.max_k = max(self.by_length, default=0)
+
+        self.lookups = {}
+        for k, entries in self.by_length.items():
+            codes = encode_kmers([seq for seq, _ in entries])
+            site_ids = np.array([s for _, s in entries], dtype=np.int16)
+            if k <= TABLE_BASES:
+                table = np.full(4 ** k, -1, dtype=np.int16)
+                table[codes] = site_ids
+                self.lookups[k] = ('table', table)
+            else:
+                order = np.argsort(codes)
+                self.lookups[k] = ('sorted', (codes[order], site_ids[order]))
+
+    def find(self, windows):
+        """(n, n_sites) bool matrix of which sites occur in each row of a ChunkWindows."""
+        found = np.zeros((len(windows.windows), len(self.names)), dtype=bool)
+        for k, (kind, lookup) in self.lookups.items():
+            values, valid = windows.get(k)
+            if kind == 'table':
+                site = lookup[values]
+            else:
+                keys, site_ids = lookup
+                values = values.astype(np.uint64)
+                pos = np.minimum(keys.searchsorted(values), len(keys) - 1)
+                site = np.where(keys[pos] == values, site_ids[pos], -1)
+            rows, cols = np.nonzero((site >= 0) & valid)
+            found[rows, site[rows, cols]] = True
+        return found
+
+
+class BarcodeMatcher:
+    """
+    Finds library barcodes (either strand) in oligo windows. Windows are
+    screened against a bitset over their first BITSET_BASES bases, and only
+    the survivors are checked exactly when barcodes are longer than that.
+    """
+
+    def __init__(self, barcodes):
+        barcodes = pd.Series(barcodes, dtype=object).dropna().astype(str).str.upper().unique().tolist()
+        self.length = len(barcodes[0]) if len(barcodes) else 0
+        if any(len(bc) != self.length for bc in barcodes):
+            raise ValueError("❌ Barcodes must all have the same length for the QC scan.")
+        both = list(barcodes) + [reverse_complement(bc) for bc in barcodes]
+        self.keys = np.unique(encode_kmers(both)) if both else np.empty(0, dtype=np.uint64)
+        self.prefix_bases = min(self.length, BITSET_BASES)
+        self.shift = 2 * (self.length - self.prefix_bases)
+        self.bits = np.zeros(max(4 ** self.prefix_bases // 8, 1), dtype=np.uint8)
+        prefix = self.keys >> np.uint64(self.shift)
+        np.bitwise_or.at(self.bits, prefix >> np.uint64(3), (1 << (prefix & np.uint64(7))).astype(np.uint8))
+
+    def hits(self, windows):
+        """(rows, positions, window codes) of every barcode occurrence in a ChunkWindows."""
+        values, valid = windows.get(self.length)
+        prefix = values >> self.shift
+        present = ((self.bits[prefix >> 3] >> (prefix & 7).astype(np.uint8)) & 1).astype(bool)
+        rows, cols = np.nonzero(present & valid)
+        values = values[rows, cols].astype(np.uint64)
+        if self.shift:
+            pos = np.minimum(self.keys.searchsorted(values), len(self.keys) - 1)
+            exact = self.keys[pos] == values
+            rows, cols, values = rows[exact], cols[exact], values[exact]
+        return rows, cols, values
+
+
+def scan_chunk(oligos, barcodes, site_matcher, barcode_matcher, gc_window):
+    matrix, lengths = byte_matrix(oligos)
+    result = {
+        'length': lengths,
+        'max_homopolymer': longest_homopolymer(matrix),
+    }
+    result['min_window_gc'], result['max_window_gc'] = window_gc(matrix, lengths, gc_window)
+
+    use_barcodes = barcode_matcher is not None and barcode_matcher.length
+    # At least 1-mers, so a scan with no sites and no barcodes still has windows
+    max_k = max(site_matcher.max_k, barcode_matcher.length if use_barcodes else 0, 1)
+    windows = ChunkWindows(CODES[matrix], lengths, max_k)
+
+    found = site_matcher.find(windows)
+    sites = np.full(len(oligos), '', dtype=object)
+    names = np.array(site_matcher.names, dtype=object)
+    for row in np.flatnonzero(found.any(axis=1)):
+        sites[row] = ';'.join(names[found[row]])
+    result['forbidden_sites'] = sites
+
+    hits = np.zeros(len(oligos), dtype=np.int64)
+    if use_barcodes:
+        rows, cols, values = barcode_matcher.hits(windows)
+        # An oligo's own barcode in its two barcode slots is expected
+        own = encode_kmers([str(bc).upper() for bc in barcodes])
+        slot_2 = lengths - len(RIGHT_PBS) - barcode_matcher.length
+        expected = (values == own[rows]) & ((cols == len(LEFT_PBS)) | (cols == slot_2[rows]))
+        np.add.at(hits, rows[~expected], 1)
+    result['barcode_hits'] = hits
+    return result
+
+
+# Matchers built once per process by _init_worker
+_matchers = {}
+
+
+def _init_worker(sites, barcodes, gc_window):
+    _matchers['site'] = SiteMatcher(sites)
+    _matchers['barcode'] = BarcodeMatcher(barcodes) if barcodes is not None else None
+    _matchers['gc_window'] = gc_window
+
+
+def _scan_task(task):
+    oligos, barcodes = task
+    return scan_chunk(oligos, barcodes, _matchers['site'], _matchers['barcode'], _matchers['gc_window'])
+
+
+def scan_oligos(
+    oligos,
+    barcodes=None,
+    max_homopolymer=MAX_HOMOPOLYMER,
+    gc_window=GC_WINDOW,
+    gc_range=GC_RANGE,
+    sites=TYPE_IIS_SITES,
+    names=None,
+    chunksize=QC_CHUNK,
+    workers=1,
+):
+    """
+    Per-oligo QC flags for a synthesis library.
+
+    Flags homopolymer runs longer than `max_homopolymer`, any full
+    `gc_window`-nt window with GC outside `gc_range`, occurrences of `sites`
+    on either strand, and library barcodes (either strand) found anywhere in
+    an oligo other than its own barcode slots. `barcodes` is aligned with
+    `oligos`; the barcode check is skipped without it. `workers` > 1 (or
+    None for every core) scans chunks across a process pool.
+    """
+    oligos = pd.Series(oligos, dtype=object).reset_index(drop=True)
+    if barcodes is not None:
+        barcodes = pd.Series(barcodes, dtype=object).reset_index(drop=True)
+    if barcodes is not None and not len(barcodes):
+        barcodes = None
+
+    tasks = [(oligos[lo:lo + chunksize], None if barcodes is None else barcodes[lo:lo + chunksize])
+             for lo in range(0, len(oligos), chunksize)]
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(sites, barcodes, gc_window)) as pool:
+            results = list(pool.map(_scan_task, tasks))
+    else:
+        _init_worker(sites, barcodes, gc_window)
+        results = [_scan_task(task) for task in tasks]
+
+    parts = {}
+    for chunk in results:
+        for key, values in chunk.items():
+            parts.setdefault(key, []).append(values)
+
+    columns = ['length', 'max_homopolymer', 'min_window_gc', 'max_window_gc', 'forbidden_sites', 'barcode_hits']
+    flags = pd.DataFrame({key: np.concatenate(parts[key]) if parts else [] for key in columns})
+    flags.insert(0, 'name', np.arange(len(oligos)) if names is None else pd.Series(names).to_numpy())
+
+    checks = {
+        'homopolymer': flags['max_homopolymer'] > max_homopolymer,
+        'gc': (flags['min_window_gc'] < gc_range[0]) | (flags['max_window_gc'] > gc_range[1]),
+        'site': flags['forbidden_sites'] != '',
+        'barcode': flags['barcode_hits'] > 0,
+    }
+    labels = pd.Series('', index=flags.index, dtype=object)
+    for check, failed in checks.items():
+        labels = labels.where(~failed, labels + np.where(labels == '', '', ';') + check)
+    flags['flags'] = labels
+    flags['pass'] = labels == ''
+    return flags
+
+
+def summarize(flags):
+    """Counts of oligos failing each check, plus the overall pass count."""
+    total = len(flags)
+    counts = {check: int(flags['flags'].str.contains(check, regex=False).sum())
+              for check in ('homopolymer', 'gc', 'site', 'barcode')}
+    counts['pass'] = int(flags['pass'].sum())
+    summary = pd.DataFrame({'check': list(counts), 'oligos': list(counts.values())})
+    summary['percent'] = summary['oligos'] / max(total, 1) * 100
+    return summary
+
+
+def read_oligo_file(path):
+    """
+    Oligo table written by write_oligos. FASTA and vendor sheets only carry
+    names and sequences, so the barcode check is skipped for them.
+    """
+    fmt = output_format(path)
+    if fmt == 'fasta':
+        with open(path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        return pd.DataFrame({'frag_numb': [line[1:] for line in lines[0::2]], 'oligo': lines[1::2]})
+    if fmt == 'vendor':
+        return pd.read_csv(path, dtype=str).rename(columns={'Name': 'frag_numb', 'Sequence': 'oligo'})
+    return read_table(path, dtype=str)
+
+
+def qc_library(input_file, output_file=None, summary_file=None, **kwargs):
+    """
+    QC the final oligo table from generate_fragments. Writes the per-oligo
+    flag table (next to the input as *_qc.txt by default) and a summary.
+    """
+    if not os.path.exists(input_file):
+        raise FileNotFoundError(f"❌ Oligo file not found: {input_file}")
+
+    stem = os.path.splitext(input_file)[0]
+    output_file = output_file or stem + '_qc.txt'
+    summary_file = summary_file or stem + '_qc_summary.txt'
+
+    df = read_oligo_file(input_file)
+    names = df['frag_numb'] if 'frag_numb' in df.columns else None
+    barcodes = df['barcode'] if 'barcode' in df.columns else None
+    with phase('scan'):
+        flags = scan_oligos(df['oligo'], barcodes, names=names, **kwargs)
+    summary = summarize(flags)
+
+    write_table(flags, output_file)
+    write_table(summary, summary_file)
+
+    print("\nOligo QC summary:")
+    print(summary.to_string(index=False, float_format="%.2f"))
+    print(f"\nPer-oligo flags saved to: {output_file}")
+    print(f"Summary saved to: {summary_file}")
+    return flags, summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Usage: python -m scripts.oligo_qc <oligo_file> [flags_output]")
+    qc_library(*sys.argv[1:])
@@ -0,0 +1,192 @@
+# scripts/pipeline.py
+import os
+
+import pandas as pd
+
+from scripts.combine_libraries import find_mapping_file, iter_library_chunks, list_input_libraries, resolve_mutation_names
+from scripts.clean_combined_library import clean_library
+from scripts.bedtools_fetching import add_fetched_sequences, open_sequence_cache, report_cache
+from scripts.sequence_cache import CACHE_DIR
+from scripts.fasta_index import FastaIndex
+from scripts.dedup import Deduplicator
+from scripts.near_dedup import collapse_near_duplicates, report_near_duplicates
+from scripts.variant_frag import add_variants
+from scripts.fragment_generation import allocate_barcodes, ask_output_file, build_name, write_oligos
+from scripts.profiling import phase, record_rows, stage, staged
+from scripts.table_io import intermediate_file, is_columnar, write_columnar
+
+CHUNK_SIZE = 200_000
+
+# Step names of the file-based pipeline, resolved through intermediate_file
+INTERMEDIATE_FILES = {
+    'combined': '1a_combined_library_messy',
+    'cleaned': '2a_combined_library_cleaned',
+    'fetched': '3a_cleaned_file_with_sequences',
+    'deduplicated': '4a_deduplicated_file_with_sequences',
+    'removed': '4b_deduplicated_removed_entries',
+    'variants': '5a_pre_barcode_plus_variants',
+}
+# Intermediates produced a chunk at a time; the others are written whole
+STREAMED_INTERMEDIATES = ('combined', 'cleaned', 'fetched', 'removed')
+
+
+def intermediate_path(step, directory):
+    return intermediate_file(INTERMEDIATE_FILES[step], directory)
+
+
+class ChunkWriter:
+    """
+    Writes a table a chunk at a time, with the header from the first chunk.
+    TSV paths are appended to directly. Columnar paths are spooled to a TSV
+    beside them and converted on close(), as that format stores whole columns.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.spool = f'{path}.{os.getpid()}.spool' if is_columnar(path) else path
+        self.started = False
+
+    def write(self, df):
+        df.to_csv(self.spool, sep='\t', index=False, mode='a' if self.started else 'w', header=not self.started)
+        self.started = True
+
+    def close(self):
+        if self.started and self.spool != self.path:
+            write_columnar(pd.read_csv(self.spool, sep='\t'), self.path)
+            os.remove(self.spool)
+
+
+def run_in_memory(
+    output_file=None,
+    input_dir='./Input_libraries/',
+    fasta_file='hg38.fa',
+    barcode_file='barcode_list.txt',
+    chunksize=CHUNK_SIZE,
+    write_intermediates=False,
+    intermediate_dir='intermediate_files',
+    engine='native',
+    cache_dir=CACHE_DIR,
+    deduplicate=True,
+    near_mismatches=0,
+    near_merge=True,
+    variant_select='prompt',
+    variant_max_mismatches=1,
+    skip_collisions=True,
+    build=None,
+    mapping_file=None,
+    prompt=True,
+):
+    """
+    Run combine -> clean -> fetch -> dedup -> variants -> fragments passing
+    frames between stages instead of re-reading TSVs.
+
+    Input libraries are read `chunksize` rows at a time and the row-local
+    stages (combine, clean, fetch) run per chunk, so their peak memory is
+    bounded by the chunk size. Deduplication holds one row per unique
+    sequence, which is what the variant and fragment stages then see; its
+    removed rows go straight to the 4b intermediate (or are only counted).
+    `near_mismatches` keeps them in memory, as clustering repoints their
+    `kept_frag_numb`. Intermediates are written only when
+    `write_intermediates` is set, under the same names and format as the
+    file-based pipeline's (intermediate_file). Pass cache_dir=None to skip the sequence
+    cache. `near_mismatches` > 0 also clusters windows within that many
+    mismatches after exact deduplication. `variant_select` and
+    `variant_max_mismatches` are add_variants' `select` and
+    `max_mismatches`. `skip_collisions` passes over barcodes found in the
+    constants or fragments (see allocate_barcodes). Barcodes are recorded
+    in the pool ledger under `build`, which defaults to the output file's
+    absolute path. Mutation names are resolved as in combine_libraries
+    (`mapping_file`, `prompt`).
+    """
+    file_paths = list_input_libraries(input_dir)
+    if not file_paths:
+        print("No .txt files found in the input directory.")
+        return
+    if not os.path.exists(fasta_file):
+        raise FileNotFoundError(f"❌ FASTA file not found: {fasta_file}")
+
+    if not os.path.exists(barcode_file):
+        raise FileNotFoundError(f"❌ Barcode file not found: {barcode_file}")
+
+    mutation_names = resolve_mutation_names(file_paths, find_mapping_file(input_dir, mapping_file), prompt)
+    if output_file is None:
+        output_file = ask_output_file()
+
+    writers = {}
+    if write_intermediates:
+        os.makedirs(intermediate_dir, exist_ok=True)
+        writers = {step: ChunkWriter(intermediate_path(step, intermediate_dir)) for step in STREAMED_INTERMEDIATES}
+
+    fasta = FastaIndex(fasta_file) if engine == 'native' else None
+    cache = open_sequence_cache(fasta_file, cache_dir) if cache_dir else None
+    if near_mismatches:
+        on_removed = None
+    else:
+        on_removed = writers['removed'].write if writers else (lambda removed: None)
+    dedup = Deduplicator(on_removed)
+    unique_frames = []
+
+    for chunk in staged(iter_library_chunks(file_paths, mutation_names, chunksize), 'combine'):
+        if writers:
+            with stage('combine'):
+                writers['combined'].write(chunk)
+        with stage('clean'):
+            chunk = clean_library(chunk)
+            record_rows(len(chunk), len(chunk))
+            if writers:
+                writers['cleaned'].write(chunk)
+        with stage('fetch'):
+            chunk = add_fetched_sequences(chunk, fasta_file, engine, cache, fasta)
+            record_rows(len(chunk), len(chunk))
+            if writers:
+                writers['fetched'].write(chunk)
+        with stage('dedup'):
+            record_rows(rows_in=len(chunk))
+            if deduplicate:
+                dedup.feed(chunk)
+            else:
+                unique_frames.append(chunk)
+        skipped = chunk['fetched_sequence'].isna().sum()
+        if skipped:
+            print(f"⚠️ {skipped} windows fall outside the FASTA and were skipped.")
+        print(f"Processed chunk of {len(chunk)} rows")
+    for step, stage_name in (('combined', 'combine'), ('cleaned', 'clean'), ('fetched', 'fetch')) if writers else ():
+        with stage(stage_name):
+            writers[step].close()
+
+    if cache is not None:
+        with stage('fetch'):
+            cache.save()
+        report_cache(cache)
+
+    with stage('dedup'):
+        if deduplicate:
+            dedup.report()
+            library, removed = dedup.frames()
+            if near_mismatches:
+                library, removed, clusters = collapse_near_duplicates(library, removed, near_mismatches, merge=near_merge)
+                report_near_duplicates(clusters, near_mismatches)
+            if writers:
+                write_columnar(library, intermediate_path('deduplicated', intermediate_dir))
+                writers['removed'].write(removed)
+                writers['removed'].close()
+        else:
+            library = pd.concat(unique_frames, ignore_index=True)
+            library.columns = [col.lower() for col in library.columns]
+        record_rows(rows_out=len(library))
+
+    with stage('variants'):
+        record_rows(rows_in=len(library))
+        library = add_variants(library, select=variant_select, max_mismatches=variant_max_mismatches)
+        record_rows(rows_out=len(library))
+        if writers:
+            write_columnar(library, intermediate_path('variants', intermediate_dir))
+
+    with stage('fragments'):
+        record_rows(rows_in=len(library))
+        with phase('barcodes'):
+            barcodes = allocate_barcodes(barcode_file, library, build or build_name(output_file), skip_collisions)
+        with phase('assemble_write'):
+            write_oligos(library, barcodes, output_file)
+    print(f"Final annotated oligo file saved to: {output_file}")
+    return output_file
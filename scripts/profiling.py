@@ -0,0 +1,213 @@
+# scripts/profiling.py
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# The report being recorded, if any. stage(), phase() and record_rows() do
+# nothing without one, so instrumented code costs nothing in normal runs.
+_report = None
+
+TOP_ALLOCATIONS = 10
+
+
+def _rusage_cpu(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak-RSS mark (Linux); False where that is not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is the peak of the whole process: KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class RunReport:
+    """
+    Per-stage metrics of one run: wall and CPU time (own and child
+    processes), peak RSS, rows in/out, rows per second and timed sub-phases.
+    A stage entered more than once (e.g. once per chunk) accumulates into one
+    record. With `profile_dir`, `cprofile` writes a `<stage>.prof` per stage
+    and `trace_memory` adds tracemalloc's peak and top allocation sites.
+    """
+
+    def __init__(self, path=None, profile_dir=None, cprofile=False, trace_memory=False):
+        self.path = path
+        self.profile_dir = profile_dir or (os.path.splitext(path)[0] + '_profiles' if path else 'profiles')
+        self.cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.stack = []
+        self.rss_reset = False
+
+    def _record(self, name):
+        if name not in self.stages:
+            self.stages[name] = {
+                'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'child_cpu_s': 0.0,
+                'peak_rss_mb': 0.0, 'rows_in': 0, 'rows_out': 0, 'phases': {},
+            }
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        record = self._record(name)
+        self.stack.append(record)
+        # Nested stages share the outer stage's profiler and peak-RSS mark
+        outer = len(self.stack) == 1
+        profiler = cProfile.Profile() if self.cprofile and outer else None
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if outer:
+            self.rss_reset = _reset_peak_rss()
+        reset = self.rss_reset
+        wall, cpu = time.perf_counter(), time.process_time()
+        child = _rusage_cpu(resource.RUSAGE_CHILDREN)
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['calls'] += 1
+            record['wall_s'] += time.perf_counter() - wall
+            record['cpu_s'] += time.process_time() - cpu
+            record['child_cpu_s'] += _rusage_cpu(resource.RUSAGE_CHILDREN) - child
+            record['peak_rss_mb'] = max(record['peak_rss_mb'], _peak_rss_mb())
+            record['peak_rss_scope'] = 'stage' if reset else 'process'
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+            if tracing:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                record['traced_peak_mb'] = max(record.get('traced_peak_mb', 0.0), peak / 2**20)
+                record['top_allocations'] = [
+                    {'site': str(stat.traceback), 'size_mb': stat.size / 2**20, 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+                ]
+            self.stack.pop()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.stack:
+            yield
+            return
+        phases = self.stack[-1]['phases']
+        entry = phases.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry['calls'] += 1
+            entry['wall_s'] += time.perf_counter() - wall
+            entry['cpu_s'] += time.process_time() - cpu
+
+    def record_rows(self, rows_in=0, rows_out=0):
+        if self.stack:
+            self.stack[-1]['rows_in'] += int(rows_in)
+            self.stack[-1]['rows_out'] += int(rows_out)
+
+    def as_dict(self):
+        stages = {}
+        for name, record in self.stages.items():
+            rows = max(record['rows_in'], record['rows_out'])
+            stages[name] = dict(record, rows_per_s=rows / record['wall_s'] if record['wall_s'] else 0.0)
+        return {
+            'started': self.started,
+            'wall_s': time.perf_counter() - self.start,
+            'argv': sys.argv,
+            'stages': stages,
+        }
+
+    def save(self, path=None):
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        print(f"📈 Run report written to: {path}")
+
+
+@contextmanager
+def profiling(path, **kwargs):
+    """Record a RunReport for everything run inside the block and write it to `path` as JSON."""
+    global _report
+    previous, _report = _report, RunReport(path, **kwargs)
+    try:
+        yield _report
+    finally:
+        report, _report = _report, previous
+        report.save()
+
+
+@contextmanager
+def stage(name):
+    """Time `name` as a stage of the active report (a no-op without one)."""
+    if _report is None:
+        yield None
+        return
+    with _report.stage(name) as record:
+        yield record
+
+
+def phase(name):
+    """Time `name` as a sub-phase of the current stage (a no-op without one)."""
+    if _report is None or not _report.stack:
+        return _NULL_PHASE
+    return _report.phase(name)
+
+
+def record_rows(rows_in=0, rows_out=0):
+    if _report is not None:
+        _report.record_rows(rows_in, rows_out)
+
+
+def staged(frames, name):
+    """Yield from an iterable of frames, timing each step of it as stage `name`."""
+    frames = iter(frames)
+    while True:
+        with stage(name):
+            frame = next(frames, None)
+            if frame is not None:
+                record_rows(rows_out=len(frame))
+        if frame is None:
+            return
+        yield frame
+
+
+class _NullPhase:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
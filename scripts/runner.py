@@ -0,0 +1,231 @@
+# scripts/runner.py
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import re
+
+from scripts.profiling import stage
+
+STATE_FILE = '.runner_state.json'
+SCRIPTS_IMPORT = re.compile(r'^\s*(?:from|import)\s+scripts\.(\w+)', re.MULTILINE)
+
+
+def file_digest(path, memo):
+    """
+    SHA-256 of a file (first 16 hex digits), memoized in `memo` against its
+    size and mtime so unchanged files, the genome above all, are hashed once.
+    """
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    cached = memo.get(path)
+    if cached and cached[:2] == stamp:
+        return cached[2]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            sha.update(block)
+    digest = sha.hexdigest()[:16]
+    memo[path] = stamp + [digest]
+    return digest
+
+
+def code_modules(func):
+    """
+    The module defining `func` plus every `scripts.*` module it imports,
+    directly or through other modules, including imports inside functions.
+    """
+    seen = {}
+    pending = [func.__module__]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen[name] = importlib.import_module(name)
+        pending.extend(f'scripts.{dep}' for dep in SCRIPTS_IMPORT.findall(inspect.getsource(seen[name])))
+    return [seen[name] for name in sorted(seen)]
+
+
+def code_version(func):
+    """Hash of the source of every module `func` depends on."""
+    sha = hashlib.sha256()
+    for module in code_modules(func):
+        sha.update(module.__name__.encode())
+        sha.update(inspect.getsource(module).encode())
+    return sha.hexdigest()[:16]
+
+
+class Step:
+    """
+    One pipeline step: `func(**params)` reads `inputs` and writes `outputs`.
+    `inputs` may be a callable returning the paths, for inputs only known at
+    run time (e.g. the files in an input directory).
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+    def input_paths(self):
+        return list(self.inputs() if callable(self.inputs) else self.inputs)
+
+    def key(self, memo):
+        """Content hash of the step's inputs, parameters and code."""
+        missing = [path for path in self.input_paths() if not os.path.exists(path)]
+        if missing:
+            return None
+        fingerprint = {
+            'inputs': {path: file_digest(path, memo) for path in self.input_paths()},
+            'params': self.params,
+            'code': code_version(self.func),
+        }
+        blob = json.dumps(fingerprint, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()[:16]
+
+
+def load_state(state_file):
+    if not os.path.exists(state_file):
+        return {'steps': {}, 'files': {}}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def save_state(state, state_file):
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+    tmp = state_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, state_file)
+
+
+def stale_reason(step, key, state):
+    """Why `step` has to run, or None when its recorded outputs are current."""
+    record = state['steps'].get(step.name)
+    if record is None:
+        return 'never run'
+    if record['key'] != key:
+        return 'inputs, parameters or code changed'
+    for path in step.outputs:
+        if not os.path.exists(path):
+            return f'output missing: {path}'
+        if file_digest(path, state['files']) != record['outputs'].get(path):
+            return f'output modified: {path}'
+    return None
+
+
+def run_steps(steps, state_file=os.path.join('intermediate_files', STATE_FILE), dry_run=False, force=()):
+    """
+    Run `steps` in order, skipping every step whose inputs, parameters, code
+    and outputs all match its last successful run. A step that reruns and
+    writes identical outputs leaves its downstream steps skipped. With
+    `dry_run` nothing is executed; steps fed by one that would run are
+    reported as pending on it. Steps named in `force` always run. Returns
+    [(step name, 'run' | 'skip' | 'would run', reason)].
+    """
+    state = load_state(state_file)
+    plan = []
+    pending = {}   # output path -> step that would rewrite it (dry run)
+
+    for step in steps:
+        upstream = sorted({pending[path] for path in step.input_paths() if path in pending})
+        if dry_run and upstream:
+            reason = f"after {', '.join(upstream)}"
+        else:
+            key = step.key(state['files'])
+            if key is None:
+                missing = [path for path in step.input_paths() if not os.path.exists(path)]
+                raise FileNotFoundError(f"❌ {step.name}: input not found: {missing[0]}")
+            reason = 'forced' if step.name in force else stale_reason(step, key, state)
+
+        if reason is None:
+            print(f"⏭️  {step.name}: up to date")
+            plan.append((step.name, 'skip', 'up to date'))
+            continue
+        if dry_run:
+            print(f"▶️  {step.name}: would run ({reason})")
+            plan.append((step.name, 'would run', reason))
+            pending.update(dict.fromkeys(step.outputs, step.name))
+            continue
+
+        print(f"\n▶️  {step.name}: running ({reason})")
+        with stage(step.name):
+            step.func(**step.params)
+        missing = [path for path in step.outputs if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"❌ {step.name} did not write {missing[0]}")
+        state['steps'][step.name] = {
+            'key': key,
+            'outputs': {path: file_digest(path, state['files']) for path in step.outputs},
+        }
+        save_state(state, state_file)
+        plan.append((step.name, 'run', reason))
+    return plan
+
+
+def pipeline_steps(
+    output_file,
+    input_dir='./Input_libraries/',
+    fasta_file='hg38.fa',
+    barcode_file='barcode_list.txt',
+    intermediate_dir='intermediate_files',
+    mapping_file=None,
+    prompt=True,
+    variant_select='prompt',
+    variant_max_mismatches=1,
+    near_mismatches=0,
+    skip_collisions=True,
+    qc=True,
+    engine='native',
+    build=None,
+):
+    """The file-based pipeline of main.py (combine -> ... -> fragments -> QC) as runner steps."""
+    # Imported here so that importing the runner does not pull in pandas
+    from scripts.combine_libraries import combine_libraries, find_mapping_file, list_input_libraries
+    from scripts.clean_combined_library import clean_combined_library
+    from scripts.bedtools_fetching import fetch_sequences_with_bedtools
+    from scripts.dedup import deduplicate_sequences
+    from scripts.variant_frag import print_single_mismatch
+    from scripts.fragment_generation import generate_fragments
+    from scripts.oligo_qc import qc_library
+    from scripts.table_io import intermediate_file
+
+    def path(name):
+        return intermediate_file(name, intermediate_dir)
+
+    def library_inputs():
+        mapping = find_mapping_file(input_dir, mapping_file)
+        return list_input_libraries(input_dir) + ([mapping] if mapping else [])
+
+    stem = os.path.splitext(output_file)[0]
+    steps = [
+        Step('combine', combine_libraries, library_inputs, [path('1a_combined_library_messy')],
+             dict(input_dir=input_dir, output_dir=intermediate_dir, mapping_file=mapping_file, prompt=prompt)),
+        Step('clean', clean_combined_library, [path('1a_combined_library_messy')], [path('2a_combined_library_cleaned')],
+             dict(input_file=path('1a_combined_library_messy'), output_file=path('2a_combined_library_cleaned'))),
+        Step('fetch', fetch_sequences_with_bedtools, [path('2a_combined_library_cleaned'), fasta_file],
+             [path('3a_cleaned_file_with_sequences')],
+             dict(input_file=path('2a_combined_library_cleaned'), fasta_file=fasta_file,
+                  output_file=path('3a_cleaned_file_with_sequences'), engine=engine)),
+        Step('dedup', deduplicate_sequences, [path('3a_cleaned_file_with_sequences')],
+             [path('4a_deduplicated_file_with_sequences'), path('4b_deduplicated_removed_entries')],
+             dict(input_file=path('3a_cleaned_file_with_sequences'),
+                  output_file=path('4a_deduplicated_file_with_sequences'),
+                  filtered_out_file=path('4b_deduplicated_removed_entries'),
+                  near_mismatches=near_mismatches, confirm=prompt)),
+        Step('variants', print_single_mismatch, [path('4a_deduplicated_file_with_sequences')],
+             [path('5a_pre_barcode_plus_variants')],
+             dict(input_file=path('4a_deduplicated_file_with_sequences'),
+                  output_file=path('5a_pre_barcode_plus_variants'), select=variant_select,
+                  max_mismatches=variant_max_mismatches)),
+        Step('fragments', generate_fragments, [path('5a_pre_barcode_plus_variants'), barcode_file], [output_file],
+             dict(input_file=path('5a_pre_barcode_plus_variants'), barcode_file=barcode_file,
+                  output_file=output_file, skip_collisions=skip_collisions, build=build)),
+    ]
+    if qc:
+        steps.append(Step('qc', qc_library, [output_file], [stem + '_qc.txt', stem + '_qc_summary.txt'],
+                          dict(input_file=output_file)))
+    return steps
@@ -0,0 +1,173 @@
+# scripts/sequence_cache.py
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'intermediate_files/sequence_cache'
+MAX_ENTRIES = 5_000_000
+
+
+def genome_checksum(fasta_file):
+    """
+    SHA-256 of the genome FASTA (first 16 hex digits). The digest is memoized
+    in `<fasta>.sha256` against the file's size and mtime, so only the first
+    run over a given genome pays for hashing it.
+    """
+    stat = os.stat(fasta_file)
+    stamp = f"{stat.st_size} {int(stat.st_mtime)}"
+    sidecar = fasta_file + '.sha256'
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            cached_stamp, _, digest = f.read().strip().rpartition(' ')
+        if cached_stamp == stamp:
+            return digest
+
+    sha = hashlib.sha256()
+    with open(fasta_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            sha.update(block)
+    digest = sha.hexdigest()[:16]
+    try:
+        tmp = f'{sidecar}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(f"{stamp} {digest}\n")
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass
+    return digest
+
+
+def window_keys(chroms, starts, ends, strands):
+    """64-bit key per (chrom, start, end, strand), computed column-wise."""
+    frame = pd.DataFrame({
+        'chrom': np.asarray(chroms, dtype=object).astype(str),
+        'start': np.asarray(starts, dtype=np.int64),
+        'end': np.asarray(ends, dtype=np.int64),
+        'strand': np.asarray(strands, dtype=object).astype(str),
+    })
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64), frame
+
+
+class SequenceCache:
+    """
+    On-disk cache of fetched windows for one genome, stored as
+    `<cache_dir>/<genome checksum>.npz`.
+
+    Entries are kept sorted by a 64-bit key of (chrom, start, end, strand),
+    so `lookup_many` is one searchsorted plus a coordinate check over whole
+    columns. Each entry carries a last-used stamp; beyond `max_entries` the
+    least recently used are evicted when new windows are inserted.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, genome='default', max_entries=MAX_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f'{genome}.npz')
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+        if os.path.exists(self.path):
+            with np.load(self.path, allow_pickle=False) as data:
+                self.columns = {name: data[name] for name in data.files}
+        else:
+            self.columns = {
+                'key': np.empty(0, dtype=np.uint64),
+                'chrom': np.empty(0, dtype='U1'),
+                'start': np.empty(0, dtype=np.int64),
+                'end': np.empty(0, dtype=np.int64),
+                'strand': np.empty(0, dtype='U1'),
+                'seq': np.empty(0, dtype='S1'),
+                'last_used': np.empty(0, dtype=np.int64),
+            }
+
+    def __len__(self):
+        return len(self.columns['key'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def _find(self, chroms, starts, ends, strands):
+        keys, frame = window_keys(chroms, starts, ends, strands)
+        cached = self.columns
+        pos = np.minimum(cached['key'].searchsorted(keys), max(len(self) - 1, 0))
+        found = np.zeros(len(keys), dtype=bool)
+        if len(self):
+            found = (
+                (cached['key'][pos] == keys)
+                & (cached['chrom'][pos] == frame['chrom'].to_numpy().astype(str))
+                & (cached['start'][pos] == frame['start'].to_numpy())
+                & (cached['end'][pos] == frame['end'].to_numpy())
+                & (cached['strand'][pos] == frame['strand'].to_numpy().astype(str))
+            )
+        return keys, frame, pos, found
+
+    def lookup_many(self, chroms, starts, ends, strands):
+        """Object array of cached sequences, None where the window is not cached."""
+        _, _, pos, found = self._find(chroms, starts, ends, strands)
+        result = np.full(len(found), None, dtype=object)
+        if found.any():
+            result[found] = self.columns['seq'][pos[found]].astype(str)
+            self.columns['last_used'][pos[found]] = int(time.time())
+            self.dirty = True
+
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return result
+
+    def insert_many(self, chroms, starts, ends, strands, seqs):
+        """Cache fetched windows; rows whose sequence is missing are skipped."""
+        seqs = np.asarray(seqs, dtype=object)
+        keys, frame, _, found = self._find(chroms, starts, ends, strands)
+        new = ~found & np.array([isinstance(seq, str) for seq in seqs], dtype=bool)
+        if not new.any():
+            return
+
+        added = {
+            'key': keys[new],
+            'chrom': frame['chrom'].to_numpy()[new].astype(str),
+            'start': frame['start'].to_numpy()[new],
+            'end': frame['end'].to_numpy()[new],
+            'strand': frame['strand'].to_numpy()[new].astype(str),
+            'seq': seqs[new].astype(str).astype(bytes),
+            'last_used': np.full(int(new.sum()), int(time.time()), dtype=np.int64),
+        }
+        merged = {name: np.concatenate([self.columns[name], added[name]]) for name in added}
+        _, first = np.unique(merged['key'], return_index=True)
+        self.columns = {name: column[first] for name, column in merged.items()}
+        self.dirty = True
+        self.evict()
+
+    def evict(self):
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return 0
+        keep = np.sort(np.argsort(self.columns['last_used'], kind='stable')[excess:])
+        self.columns = {name: column[keep] for name, column in self.columns.items()}
+        self.dirty = True
+        return excess
+
+    def save(self):
+        if not self.dirty:
+            return
+        # Per-process temp name: builds running in parallel share the cache
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **self.columns)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self),
+        }
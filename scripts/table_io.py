@@ -0,0 +1,273 @@
+# scripts/table_io.py
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from scripts.profiling import phase, record_rows
+
+# Intermediates ending in COLUMNAR_SUFFIX use the binary format below (an
+# uncompressed .npz with a fixed schema); any other extension is read and
+# written as tab-separated text.
+COLUMNAR_SUFFIX = '.npz'
+FORMAT_VERSION = 1
+
+# Fixed schema, matched case-insensitively. Columns not listed are typed from
+# their contents: integers stay integers, floats stay floats and anything
+# else is stored as a categorical.
+CATEGORICAL_COLUMNS = {'mutation', 'chromosome', 'direction', 'duplicated', 'bulge type', 'bulge_type'}
+INTEGER_COLUMNS = {'location', 'mismatches', 'bulge size', 'bulge_size'}
+SEQUENCE_COLUMNS = {'fetched_sequence', 'crrna', 'dna'}
+
+
+def intermediate_file(name, directory='intermediate_files'):
+    """Default path of an intermediate step file, e.g. '3a_cleaned_file_with_sequences'."""
+    return os.path.join(directory, name + COLUMNAR_SUFFIX)
+
+
+def is_columnar(path):
+    return str(path).endswith(COLUMNAR_SUFFIX)
+
+
+def _smallest_int(low, high=None):
+    high = low if high is None else high
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min < low and high < info.max:
+            return dtype
+    return np.int64
+
+
+def _encode_category(values):
+    codes, categories = pd.factorize(values, use_na_sentinel=True)
+    # UTF-8 bytes rather than numpy's 4-byte-per-character unicode
+    categories = np.array([str(c).encode() for c in categories], dtype=bytes)
+    return {'codes': codes.astype(_smallest_int(-1, len(categories))), 'categories': categories}
+
+
+def _encode_integer(values):
+    """Integer column and NA mask, or None if the text would not round-trip."""
+    mask = values.isna().to_numpy()
+    if pd.api.types.is_integer_dtype(values.dtype):
+        ints = values.fillna(0).to_numpy(dtype=np.int64)
+    else:
+        # '007', '+1' or '1.0' would not survive the trip
+        present = values[~mask].astype(str)
+        if not present.str.fullmatch(r'-?(?:0|[1-9][0-9]{0,17})').all():
+            return None
+        ints = np.zeros(len(values), dtype=np.int64)
+        ints[~mask] = present.to_numpy(dtype=object).astype(np.int64)
+    low, high = (int(ints.min()), int(ints.max())) if len(ints) else (0, 0)
+    return {
+        'values': ints.astype(_smallest_int(low, high)),
+        'mask': mask if mask.any() else np.zeros(0, dtype=bool),
+    }
+
+
+# 2-bit code per base; 255 marks bytes that cannot be packed
+BASE_CODES = np.full(256, 255, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    BASE_CODES[_base] = BASE_CODES[_base + 32] = _code
+# The four base bytes encoded by each packed byte value
+QUAD_BYTES = np.frombuffer(b'ACGT', dtype=np.uint8)[(np.arange(256)[:, None] >> np.array([6, 4, 2, 0])) & 3]
+
+
+def pack_sequences(matrix):
+    """
+    Pack an (n, width) uint8 matrix of ACGT/acgt bytes into 2 bits per base,
+    first base in the high bits, plus a bit-packed lowercase mask (empty
+    when every base is uppercase). Returns None if any byte is not a base.
+    """
+    codes = BASE_CODES[matrix]
+    if (codes == 255).any():
+        return None
+    n, width = codes.shape
+    padded = np.zeros((n, -(-width // 4) * 4), dtype=np.uint8)
+    padded[:, :width] = codes
+    quads = padded.reshape(n, -1, 4)
+    packed = (quads[..., 0] << 6) | (quads[..., 1] << 4) | (quads[..., 2] << 2) | quads[..., 3]
+    lower = matrix >= ord('a')
+    lower = np.packbits(lower, axis=1) if lower.any() else np.empty((0, 0), dtype=np.uint8)
+    return packed, lower
+
+
+def unpack_sequences(packed, lower, width):
+    """Inverse of pack_sequences: (n, width) uint8 matrix of base bytes."""
+    matrix = QUAD_BYTES[packed].reshape(len(packed), -1)[:, :width]
+    if lower.size:
+        matrix |= np.unpackbits(lower, axis=1, count=width) << 5
+    return matrix
+
+
+def _encode_sequence(values):
+    """
+    2-bit packed bases when every value is a same-length A/C/G/T string
+    (either case); fixed-width bytes otherwise. None if not plain ASCII text.
+    """
+    mask = values.isna().to_numpy()
+    text = values.to_numpy(dtype=object).copy()
+    text[mask] = ''
+    try:
+        raw = np.array(text, dtype=bytes)
+    except UnicodeEncodeError:
+        return None
+
+    width = raw.dtype.itemsize
+    if len(raw) and width and not mask.all():
+        matrix = raw.view(np.uint8).reshape(len(raw), width).copy()
+        matrix[mask] = ord('A')
+        if (matrix[~mask] != 0).all():
+            packed = pack_sequences(matrix)
+            if packed is not None:
+                return {'packed': packed[0], 'lower': packed[1], 'width': np.array(width), 'mask': mask}
+    return {'values': raw, 'mask': mask}
+
+
+def column_kind(name, values):
+    key = name.lower()
+    if key in SEQUENCE_COLUMNS:
+        return 'sequence'
+    if key in INTEGER_COLUMNS or pd.api.types.is_integer_dtype(values.dtype):
+        return 'integer'
+    if key in CATEGORICAL_COLUMNS:
+        return 'category'
+    if pd.api.types.is_float_dtype(values.dtype):
+        return 'float'
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return 'bool'
+    return 'category'
+
+
+def encode_column(name, values):
+    """(kind, arrays) for one column, falling back to a categorical when the schema type does not fit."""
+    kind = column_kind(name, values)
+    arrays = None
+    if kind == 'sequence':
+        arrays = _encode_sequence(values)
+    elif kind == 'integer':
+        arrays = _encode_integer(values)
+    elif kind == 'float':
+        arrays = {'values': values.to_numpy(dtype=np.float64)}
+    elif kind == 'bool':
+        arrays = {'values': values.to_numpy(dtype=bool)}
+    if arrays is None:
+        kind, arrays = 'category', _encode_category(values)
+    return kind, arrays
+
+
+def decode_column(kind, arrays):
+    if kind == 'category':
+        return pd.Categorical.from_codes(
+            arrays['codes'].astype(np.int64),
+            pd.Index([c.decode() for c in arrays['categories'].tolist()], dtype=object),
+            validate=False,
+        )
+    if kind == 'sequence':
+        if 'packed' in arrays:
+            width = int(arrays['width'])
+            text = unpack_sequences(arrays['packed'], arrays['lower'], width).tobytes().decode('ascii')
+            values = np.empty(len(arrays['mask']), dtype=object)
+            values[:] = [text[i:i + width] for i in range(0, len(text), width)]
+        else:
+            values = np.array([s.decode('ascii') for s in arrays['values'].tolist()], dtype=object)
+        values[arrays['mask']] = np.nan
+        return values
+    if kind == 'integer':
+        ints = arrays['values'].astype(np.int64)
+        if arrays['mask'].any():
+            return pd.arrays.IntegerArray(ints, arrays['mask'])
+        return ints
+    return arrays['values']
+
+
+def write_columnar(df, path, compress=False):
+    arrays = {
+        '__version__': np.array(FORMAT_VERSION),
+        '__columns__': np.array([str(col) for col in df.columns], dtype=str),
+        '__rows__': np.array(len(df)),
+    }
+    kinds = []
+    for i, name in enumerate(df.columns):
+        kind, column = encode_column(str(name), df.iloc[:, i])
+        kinds.append(kind)
+        for part, values in column.items():
+            arrays[f'{i}.{part}'] = values
+    arrays['__kinds__'] = np.array(kinds, dtype=str)
+
+    # Written aside and renamed, so readers and other writers never see half a file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+    os.replace(tmp, path)
+
+
+def read_columnar(path, columns=None):
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data['__version__'])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"❌ {path} has columnar format version {version}, expected {FORMAT_VERSION}")
+        names = data['__columns__'].tolist()
+        kinds = data['__kinds__'].tolist()
+        n_rows = int(data['__rows__'])
+        wanted = set(columns) if columns is not None else None
+
+        frame = {}
+        for i, (name, kind) in enumerate(zip(names, kinds)):
+            if wanted is not None and name not in wanted:
+                continue
+            prefix = f'{i}.'
+            arrays = {f[len(prefix):]: data[f] for f in data.files if f.startswith(prefix)}
+            frame[name] = decode_column(kind, arrays)
+    return pd.DataFrame(frame, index=pd.RangeIndex(n_rows))
+
+
+def apply_dtype(df, dtype):
+    """`dtype` applied as read_csv would: with str, missing values stay NaN."""
+    if dtype not in (str, 'str'):
+        return df.astype(dtype)
+    return pd.DataFrame({
+        name: df[name].astype(object).astype(str).where(df[name].notna(), np.nan) for name in df.columns
+    }, index=df.index)
+
+
+def read_table(path, dtype=None, columns=None):
+    """
+    Load an intermediate table. Columnar files come back typed (categoricals,
+    integers, string sequences) unless `dtype` is given, which is applied as
+    read_csv applies it to TSVs.
+    """
+    with phase('read'):
+        if is_columnar(path):
+            df = read_columnar(path, columns)
+            if dtype is not None:
+                df = apply_dtype(df, dtype)
+        else:
+            df = pd.read_csv(path, sep='\t', dtype=dtype, usecols=columns)
+    record_rows(rows_in=len(df))
+    return df
+
+
+def write_table(df, path):
+    """Write `df` to `path`, choosing the columnar format or TSV by extension."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with phase('write'):
+        if is_columnar(path):
+            write_columnar(df, path)
+        else:
+            df.to_csv(path, sep='\t', index=False)
+    record_rows(rows_out=len(df))
+
+
+def convert(input_file, output_file):
+    """Convert between the columnar format and TSV, e.g. to open an intermediate in a spreadsheet."""
+    write_table(read_table(input_file, dtype=str), output_file)
+    print(f"Converted {input_file} -> {output_file}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m scripts.table_io <input> <output>")
+    convert(sys.argv[1], sys.argv[2])
@@ -1,107 +1,187 @@
 # scripts/filter_one_mismatch.py
+import numpy as np
 import pandas as pd
 
-def print_single_mismatch(input_file="intermediate_files/4a_deduplicated_file_with_sequences.txt",
-                          output_file="intermediate_files/5a_pre_barcode_plus_variants.txt"):
+from scripts.combine_libraries import library_prefix
+from scripts.table_io import intermediate_file, read_table, write_table
+
+def print_single_mismatch(input_file=intermediate_file('4a_deduplicated_file_with_sequences'),
+                          output_file=intermediate_file('5a_pre_barcode_plus_variants'),
+                          select='prompt', max_mismatches=1):
 
     """
     Reads the deduplicated file and prints entries with 1 mismatch and 0 bulges.
+    `select` and `max_mismatches` are passed to add_variants.
     """
     # Load the TSV
-    df = pd.read_csv(input_file, sep="\t")
+    df = read_table(input_file)
+
+    combined = add_variants(df, select=select, max_mismatches=max_mismatches)
+
+    # Save to file
+    write_table(combined, output_file)
+    print(f"\nVariants prepended to file and saved as:\n{output_file}")
+
+
+# Rules for picking one site per mutation when several qualify
+SELECTION_RULES = ('prompt', 'first', 'min_mismatches', 'lowest_frag_numb')
+
+# fetched_sequence starts 10 bases upstream of the crRNA/DNA site
+FETCH_OFFSET = 10
+
+# Bytes treated as real bases in the crRNA; anything else (e.g. N in the PAM) is never copied
+CRRNA_BASES = np.zeros(256, dtype=bool)
+CRRNA_BASES[list(b'ACGTacgt')] = True
+
 
-    # Filter for 1 mismatch and 0 bulges
-    filtered = df[(df["mismatches"] <= 1) & (df["bulge_size"] == 0)]
+def add_variants(df, select='prompt', max_mismatches=1):
+    """
+    Select one bulge-free site with 1 to `max_mismatches` mismatches per
+    mutation (a perfect match has nothing to correct), correct all of its crRNA/DNA mismatches and return the
+    corrected variants prepended to `df`.
+
+    `select` picks the site when a mutation has several: 'prompt' asks,
+    'first' takes the first in file order, 'min_mismatches' the fewest
+    mismatches (then file order) and 'lowest_frag_numb' the smallest
+    frag_numb in natural order (A2 before A10).
+    """
+    if select not in SELECTION_RULES:
+        raise ValueError(f"❌ Unknown selection rule {select!r}; expected one of {SELECTION_RULES}")
+
+    # Filter for 1..max_mismatches and 0 bulges
+    mismatches = pd.to_numeric(df["mismatches"])
+    bulge_size = pd.to_numeric(df["bulge_size"])
+    filtered = df[(mismatches >= 1) & (mismatches <= max_mismatches) & (bulge_size == 0)]
+    wanted = "1 mismatch" if max_mismatches == 1 else f"1-{max_mismatches} mismatches"
 
     # Print to console
     if filtered.empty:
-        print("No entries found with 1 (or 0) mismatch and 0 bulges.")
+        print(f"No entries found with {wanted} and 0 bulges.")
     else:
-        print("\nEntries with 1 mismatch and 0 bulges:\n")
+        print(f"\nEntries with {wanted} and 0 bulges:\n")
         print(filtered.to_string(index=False))
 
-    # Filter out mutations ending with '_multi'
-    df_filtered_mutations = df[~df["mutation"].str.endswith("_multi")]
-    filtered_filtered_mutations = filtered[~filtered["mutation"].str.endswith("_multi")]
-
-    # Get all unique mutations excluding _multi
-    all_mutations = df_filtered_mutations["mutation"].unique()
-
-    # Get mutations that have entries passing the filter
-    filtered_mutations = filtered_filtered_mutations["mutation"].unique()
-
-    # Alert user about mutations with no filtered entries
+    # Alert user about mutations (excluding _multi) with no filtered entries
+    all_mutations = df.loc[~df["mutation"].str.endswith("_multi"), "mutation"].unique()
+    filtered_mutations = filtered.loc[~filtered["mutation"].str.endswith("_multi"), "mutation"].unique()
     missing_mutations = set(all_mutations) - set(filtered_mutations)
     if missing_mutations:
-        print("\nWARNING: The following variants do NOT have any entries with <=1 mismatch and 0 bulges:")
+        print(f"\nWARNING: The following variants do NOT have any entries with {wanted} and 0 bulges:")
         print(", ".join(missing_mutations))
 
-        # Group by mutation
-    mutation_groups = filtered.groupby("mutation")
+    variants_to_process = select_sites(filtered, select)
+    variants = correct_variants(variants_to_process, df.columns[0])
 
-    variants_to_process = pd.DataFrame()
+    # Combine variants with original
+    combined = pd.concat([variants, df], ignore_index=True)
 
-    for mutation, group in mutation_groups:
+    # Print original + modified for user
+    print("\nOriginal and modified entries:\n")
+    print(pd.concat([variants_to_process, variants], ignore_index=True).to_string(index=False))
+
+    return combined
+
+
+def frag_sort_key(frag_numb):
+    """Natural sort key for frag_numb values: prefix letters, then the numeric ID."""
+    parts = frag_numb.astype(str).str.extract(r'^(\D*)(\d*)')
+    return parts[0], pd.to_numeric(parts[1], errors='coerce')
+
+
+def select_sites(filtered, select='prompt'):
+    """One row per mutation from `filtered`, chosen by `select`, in group order."""
+    if filtered.empty:
+        return filtered.iloc[:0]
+    # .npz intermediates load mutation as a categorical in first-appearance
+    # order; group and sort on the strings so both formats pick alike
+    filtered = filtered.astype({"mutation": object})
+
+    ranked = filtered.reset_index(drop=True)
+    if select == 'min_mismatches':
+        ranked = ranked.assign(_rank=pd.to_numeric(ranked["mismatches"]))
+        ranked = ranked.sort_values("_rank", kind="stable").drop(columns="_rank")
+    elif select == 'lowest_frag_numb':
+        prefix, number = frag_sort_key(ranked["frag_numb"])
+        ranked = ranked.assign(_prefix=prefix, _number=number)
+        ranked = ranked.sort_values(["_prefix", "_number"], kind="stable").drop(columns=["_prefix", "_number"])
+
+    if select != 'prompt':
+        picked = ranked.drop_duplicates("mutation").sort_values("mutation", kind="stable")
+        for mutation, frag in zip(picked["mutation"], picked["frag_numb"]):
+            print(f"\nSelected {frag} for variant {mutation} ({select})")
+        return picked.reset_index(drop=True)
+
+    rows = []
+    for mutation, group in filtered.groupby("mutation"):
+        positions = filtered.index.get_indexer(group.index)
         if len(group) == 1:
             # Only one entry, print directly
             print(f"\nSingle entry for variant {mutation}:\n")
             print(group.to_string(index=False))
-            variants_to_process = pd.concat([variants_to_process, group], ignore_index=True)
-        else:
-            # Multiple entries, show numbered list
-            print(f"\nMultiple entries found for variant {mutation}:")
-            for i, frag in enumerate(group["frag_numb"]):
-                print(f"{i+1}. {frag}")
-
-            while True:
-                selection = input(f"Select the number corresponding to the frag_numb to process for variant {mutation}: ").strip()
-                if selection.isdigit() and 1 <= int(selection) <= len(group):
-                    selected_row = group.iloc[int(selection)-1]
-                    variants_to_process = pd.concat([variants_to_process, selected_row.to_frame().T], ignore_index=True)
-                    break
-                else:
-                    print("Invalid selection. Try again.")
-
-    # Generate corrected variants
-    variants = []
-    for idx, row in enumerate(variants_to_process.itertuples(index=False)):
-        new_row = row._asdict()
-
-        # Replace ID (first column)
-        first_col_name = df.columns[0]
-        new_row[first_col_name] = f"{chr(65 + idx)}-variant"
-
-        # Reset mismatches to 0
-        new_row["mismatches"] = 0
-
-        # Correct mismatch in dna
-        cr = new_row["crrna"]
-        dn = list(new_row["dna"])
-        mismatch_index = next((j for j, (a, b) in enumerate(zip(cr, dn)) if a != b), None)
-        if mismatch_index is None:
-            raise ValueError(f"No mismatch found for row {row}")
-
-        dn[mismatch_index] = cr[mismatch_index]
-        new_row["dna"] = "".join(dn)
-
-        # Correct fetched_sequence at offset (11th base = index 10)
-        fs = list(new_row["fetched_sequence"])
-        fetch_index = mismatch_index + 10
-        if fetch_index >= len(fs):
-            raise ValueError(f"Mismatch index {fetch_index} out of range for fetched_sequence")
-        fs[fetch_index] = cr[mismatch_index]
-        new_row["fetched_sequence"] = "".join(fs)
-
-        variants.append(new_row)
+            rows.append(positions[0])
+            continue
 
-    # Combine variants with original
-    combined = pd.concat([pd.DataFrame(variants), df], ignore_index=True)
+        # Multiple entries, show numbered list
+        print(f"\nMultiple entries found for variant {mutation}:")
+        for i, frag in enumerate(group["frag_numb"]):
+            print(f"{i+1}. {frag}")
 
-    # Print original + modified for user
-    print("\nOriginal and modified entries:\n")
-    display_df = pd.concat([variants_to_process, pd.DataFrame(variants)], ignore_index=True)
-    print(display_df.to_string(index=False))
+        while True:
+            selection = input(f"Select the number corresponding to the frag_numb to process for variant {mutation}: ").strip()
+            if selection.isdigit() and 1 <= int(selection) <= len(group):
+                rows.append(positions[int(selection) - 1])
+                break
+            else:
+                print("Invalid selection. Try again.")
+    return filtered.iloc[rows].reset_index(drop=True)
 
-    # Save to file
-    combined.to_csv(output_file, sep="\t", index=False)
-    print(f"\nVariants prepended to file and saved as:\n{output_file}")
\ No newline at end of file
+
+def byte_matrix(values, width=0):
+    """(n, width) uint8 matrix of ASCII strings, zero-padded on the right."""
+    raw = np.array([str(v) for v in values], dtype=bytes)
+    matrix = np.zeros((len(raw), max(width, raw.dtype.itemsize)), dtype=np.uint8)
+    matrix[:, :raw.dtype.itemsize] = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    return matrix
+
+
+def matrix_strings(matrix):
+    """Inverse of byte_matrix; trailing padding is dropped."""
+    return np.ascontiguousarray(matrix).view(f'S{matrix.shape[1]}').ravel().astype(str).astype(object)
+
+
+def correct_variants(selected, id_column):
+    """
+    Copy `selected` as corrected variants: every position where the DNA
+    differs from a crRNA base takes the crRNA base, in `dna` and in
+    `fetched_sequence` (shifted by FETCH_OFFSET), and mismatches drop to 0.
+    """
+    variants = selected.copy().reset_index(drop=True)
+    if variants.empty:
+        return variants
+
+    crrna = byte_matrix(variants["crrna"])
+    width = crrna.shape[1]
+    dna = byte_matrix(variants["dna"], width)[:, :width]
+    fetched = byte_matrix(variants["fetched_sequence"], FETCH_OFFSET + width)
+
+    mismatch = (crrna != dna) & (crrna != 0) & (dna != 0) & CRRNA_BASES[crrna]
+    if not mismatch.any(axis=1).all():
+        row = variants.iloc[int(np.flatnonzero(~mismatch.any(axis=1))[0])]
+        raise ValueError(f"No mismatch found for row {row.to_dict()}")
+
+    fetched_window = fetched[:, FETCH_OFFSET:FETCH_OFFSET + width]
+    out_of_range = mismatch & (fetched_window == 0)
+    if out_of_range.any():
+        row, col = np.argwhere(out_of_range)[0]
+        raise ValueError(f"Mismatch index {col + FETCH_OFFSET} out of range for fetched_sequence "
+                         f"of {variants['frag_numb'].iloc[row]}")
+
+    dna[mismatch] = crrna[mismatch]
+    fetched_window[mismatch] = crrna[mismatch]
+
+    # Replace ID (first column) and reset mismatches to 0
+    variants[id_column] = [f"{library_prefix(idx)}-variant" for idx in range(len(variants))]
+    variants["mismatches"] = 0
+    variants["dna"] = matrix_strings(dna)
+    variants["fetched_sequence"] = matrix_strings(fetched)
+    return variants
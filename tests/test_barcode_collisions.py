@@ -0,0 +1,72 @@
+# tests/test_barcode_collisions.py
+import numpy as np
+import pytest
+
+from scripts.barcode_collisions import CollisionIndex, collision_free_barcodes
+from scripts.fragment_generation import CONSTANT_REGIONS
+from scripts.oligo_qc import reverse_complement
+
+
+def random_seq(rng, width):
+    return ''.join(rng.choice(list('ACGT'), width))
+
+
+def collision_inputs(length, seed):
+    rng = np.random.default_rng(seed)
+    fragments = [random_seq(rng, int(rng.integers(length - 1, 60))) for _ in range(200)]
+    fragments[5] = fragments[5][:10] + 'N' + fragments[5][11:]
+    fragments[6] = fragments[6].lower()
+    fragments.append(np.nan)
+    barcodes = [random_seq(rng, length) for _ in range(3000)]
+    # Barcodes that do (or whose reverse complement does) occur somewhere, and a few malformed ones
+    for i in range(0, 3000, 50):
+        source = CONSTANT_REGIONS[i % 4] if i % 100 else fragments[i % 200]
+        if len(source) < length:
+            continue
+        at = int(rng.integers(0, len(source) - length + 1))
+        hit = source[at:at + length].upper()
+        barcodes[i] = hit if i % 150 else reverse_complement(hit)
+    barcodes[7], barcodes[8], barcodes[9] = barcodes[7][:-1], barcodes[8][:3] + 'N' + barcodes[8][4:], ''
+    return barcodes, fragments
+
+
+def reference_reason(barcode, length, fragments):
+    if len(barcode) != length or set(barcode) - set('ACGT'):
+        return 'invalid'
+    fragments = [str(f).upper() for f in fragments if isinstance(f, str)]
+    rc = reverse_complement(barcode)
+    for reason, seqs, probe in (('constant', CONSTANT_REGIONS, barcode), ('constant_rc', CONSTANT_REGIONS, rc),
+                                ('fragment', fragments, barcode), ('fragment_rc', fragments, rc)):
+        if any(probe in seq for seq in seqs):
+            return reason
+    return ''
+
+
+@pytest.mark.parametrize('length', [6, 12])
+def test_index_matches_substring_search(length):
+    barcodes, fragments = collision_inputs(length, seed=length)
+    index = CollisionIndex(length, CONSTANT_REGIONS, fragments)
+    expected = [reference_reason(bc, length, fragments) for bc in barcodes]
+    assert index.reasons(barcodes).tolist() == expected
+    # Every reason turns up, so each check is exercised
+    assert set(expected) == {'', 'invalid', 'constant', 'constant_rc', 'fragment', 'fragment_rc'}
+
+    chunked = CollisionIndex(length, CONSTANT_REGIONS, fragment_chunks=[fragments[:70], fragments[70:]])
+    assert chunked.reasons(barcodes).tolist() == expected
+
+
+def test_first_free_barcodes_are_taken_in_order():
+    barcodes, fragments = collision_inputs(6, seed=1)
+    expected = [reference_reason(bc, 6, fragments) for bc in barcodes]
+    free = [i for i, reason in enumerate(expected) if not reason]
+
+    n = 200
+    chosen, skipped = collision_free_barcodes(barcodes, n, CONSTANT_REGIONS, fragments)
+    assert chosen == [barcodes[i] for i in free[:n]]
+    passed_over = [reason for reason in expected[:free[n - 1]] if reason]
+    assert sum(skipped.values()) == len(passed_over)
+    for reason, count in skipped.items():
+        assert count == passed_over.count(reason)
+
+    with pytest.raises(ValueError, match='Not enough collision-free barcodes'):
+        collision_free_barcodes(barcodes, len(free) + 1, CONSTANT_REGIONS, fragments)
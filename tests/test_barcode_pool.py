@@ -0,0 +1,62 @@
+# tests/test_barcode_pool.py
+import contextlib
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from scripts.fragment_generation import generate_fragments
+
+
+def barcode_list(path, n, length=12, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, (n, length))]
+    path.write_text(''.join(row.tobytes().decode() + '\n' for row in codes))
+    return str(path)
+
+
+def library(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, (n, 40))]
+    pd.DataFrame({'frag_numb': [f'A{i}' for i in range(n)],
+                  'fetched_sequence': [row.tobytes().decode() for row in codes]}).to_csv(path, sep='\t', index=False)
+    return str(path)
+
+
+def build(input_file, barcode_file, output_file, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_fragments(input_file, barcode_file, str(output_file), skip_collisions=False, **kwargs)
+    return pd.read_csv(output_file, sep='\t')['barcode'].tolist()
+
+
+def ledger(barcode_file):
+    with open(barcode_file + '.ledger') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_same_basename_in_different_directories_gets_distinct_barcodes(tmp_path):
+    barcode_file = barcode_list(tmp_path / 'barcodes.txt', 100)
+    input_file = library(tmp_path / '5a.txt', 20)
+    (tmp_path / 'run1').mkdir()
+    (tmp_path / 'run2').mkdir()
+
+    first = build(input_file, barcode_file, tmp_path / 'run1' / 'lib.txt')
+    second = build(input_file, barcode_file, tmp_path / 'run2' / 'lib.txt')
+    assert not set(first) & set(second)
+    assert len(ledger(barcode_file)) == 2
+
+    # Rerunning a build on the same library reuses its range
+    assert build(input_file, barcode_file, tmp_path / 'run1' / 'lib.txt') == first
+    assert len(ledger(barcode_file)) == 2
+
+
+def test_changed_library_does_not_reuse_the_build_range(tmp_path):
+    barcode_file = barcode_list(tmp_path / 'barcodes.txt', 100)
+    first = build(library(tmp_path / 'a.txt', 20, seed=1), barcode_file, tmp_path / 'lib.txt', build='lib')
+    # Fewer rows would still fit in the old range, but the fragments differ
+    second = build(library(tmp_path / 'b.txt', 10, seed=2), barcode_file, tmp_path / 'lib.txt', build='lib')
+    assert not set(first) & set(second)
+    entries = ledger(barcode_file)
+    assert [entry['build'] for entry in entries] == ['lib', 'lib']
+    assert entries[0]['fingerprint'] != entries[1]['fingerprint']
@@ -0,0 +1,72 @@
+# tests/test_bedtools_fetching.py
+import contextlib
+import io
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.bedtools_fetching import WINDOW_DOWNSTREAM, WINDOW_UPSTREAM, fetch_windows
+
+COMPLEMENT = str.maketrans('ACGTacgt', 'TGCAtgca')
+
+
+@pytest.fixture
+def genome(tmp_path):
+    rng = np.random.default_rng(0)
+    chroms = {}
+    for name, length in (('chr1', 157), ('chr2', 90)):
+        seq = ''.join(rng.choice(list('ACGTacgtN'), length, p=[0.2] * 4 + [0.04] * 4 + [0.04]))
+        chroms[name] = seq
+    fasta = tmp_path / 'genome.fa'
+    with open(fasta, 'w') as f:
+        for name, seq in chroms.items():
+            f.write(f">{name} test\n")
+            f.write(''.join(seq[i:i + 60] + '\n' for i in range(0, len(seq), 60)))
+    return str(fasta), chroms
+
+
+def expected_window(chroms, chrom, location, direction):
+    """bedtools getfasta -s semantics for one window; None where it is skipped."""
+    start, end = location - WINDOW_UPSTREAM, location + WINDOW_DOWNSTREAM
+    seq = chroms.get(chrom)
+    if seq is None or start < 0 or end > len(seq):
+        return None
+    window = seq[start:end]
+    return window.translate(COMPLEMENT)[::-1] if direction == '-' else window
+
+
+def sites():
+    rows = [
+        ('chr1', 60, '+'), ('chr1', 60, '-'),                  # across a line break
+        ('chr1', WINDOW_UPSTREAM, '+'),                         # first base of the chromosome
+        ('chr2', 90 - WINDOW_DOWNSTREAM, '-'),                  # last base of the chromosome
+        ('chr2', 90 - WINDOW_DOWNSTREAM + 1, '+'),              # one past the end
+        ('chr1', WINDOW_UPSTREAM - 1, '-'),                     # negative start
+        ('chrUn', 50, '+'),                                     # unknown chromosome
+    ]
+    return pd.DataFrame({'Frag_numb': [f'A{i}' for i in range(len(rows))],
+                         'Chromosome': [r[0] for r in rows], 'Location': [r[1] for r in rows],
+                         'Direction': [r[2] for r in rows]})
+
+
+def test_native_engine_matches_getfasta_semantics(genome):
+    fasta, chroms = genome
+    df = sites()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetched = fetch_windows(df, fasta, engine='native')
+    coords = df[['Chromosome', 'Location', 'Direction']].itertuples(index=False)
+    expected = [expected_window(chroms, *row) for row in coords]
+    assert list(fetched) == expected
+    assert sum(seq is None for seq in expected) == 3
+
+
+@pytest.mark.skipif(shutil.which('bedtools') is None, reason="bedtools is not installed")
+def test_native_and_bedtools_engines_agree(genome):
+    fasta, _ = genome
+    df = sites()
+    with contextlib.redirect_stdout(io.StringIO()):
+        native = fetch_windows(df, fasta, engine='native')
+        bedtools = fetch_windows(df, fasta, engine='bedtools')
+    assert list(native) == list(bedtools)
@@ -0,0 +1,88 @@
+# tests/test_cli.py
+import contextlib
+import io
+import json
+
+import pytest
+
+from scripts.cli import DEFAULTS, HEADLESS_VARIANT_SELECT, check_distinct, main, parse_override, resolve_config
+
+
+def write_config(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def run_main(argv):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        code = main(argv)
+    return code, out.getvalue()
+
+
+def test_overrides_are_read_as_json_when_they_parse():
+    assert parse_override('qc=false') == ('qc', False)
+    assert parse_override('near_mismatches=2') == ('near_mismatches', 2)
+    assert parse_override('output_file=lib=v2.txt') == ('output_file', 'lib=v2.txt')
+    with pytest.raises(ValueError, match='key=value'):
+        parse_override('qc')
+
+
+def test_config_file_turns_prompts_off_and_overrides_win(tmp_path):
+    path = write_config(tmp_path / 'build.toml', 'output_file = "lib.txt"\nnear_mismatches = 1\nqc = false\n')
+    config = resolve_config(path, [('near_mismatches', 2)])
+    assert config == dict(DEFAULTS, output_file='lib.txt', near_mismatches=2, qc=False, prompt=False,
+                          variant_select=HEADLESS_VARIANT_SELECT)
+
+    json_path = write_config(tmp_path / 'build.json', json.dumps({'output_file': 'lib.txt', 'prompt': True}))
+    assert resolve_config(json_path)['variant_select'] == 'prompt'
+    # Interactive runs keep the prompts and need no output_file up front
+    assert resolve_config()['prompt'] and resolve_config()['variant_select'] == 'prompt'
+
+
+@pytest.mark.parametrize('text, message', [
+    ('output_file = "lib.txt"\nnear_mismatch = 1\n', 'Unknown setting'),
+    ('near_mismatches = 1\n', 'has no output_file'),
+    ('output_file = "lib.txt"\nvariant_select = "prompt"\n', 'needs prompt = true'),
+])
+def test_bad_configs_are_rejected(tmp_path, text, message):
+    path = write_config(tmp_path / 'build.toml', text)
+    with pytest.raises(ValueError, match=message):
+        resolve_config(path)
+    with pytest.raises(SystemExit, match=message):
+        run_main(['config', path])
+
+
+def test_parallel_builds_must_not_share_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = resolve_config(headless=True, overrides=[('output_file', 'a.txt'), ('intermediate_dir', 'a')])
+    second = dict(first, output_file='b.txt', intermediate_dir='b')
+    check_distinct([('a.toml', first), ('b.toml', second)])
+
+    # Paths are compared absolute, and an unnamed build is named by its output
+    clashes = [
+        (first, dict(second, output_file=str(tmp_path / 'a.txt')), 'output_file'),
+        (first, dict(second, intermediate_dir='./a'), 'intermediate_dir'),
+        (dict(first, build=str(tmp_path / 'b.txt')), second, 'build'),
+    ]
+    for a, b, key in clashes:
+        with pytest.raises(ValueError, match=f'share {key}'):
+            check_distinct([('a.toml', a), ('b.toml', b)])
+
+
+def test_config_command_prints_the_resolved_settings(tmp_path):
+    path = write_config(tmp_path / 'build.toml', 'output_file = "lib.txt"\n')
+    code, out = run_main(['config', path, '--set', 'engine=bedtools'])
+    assert code == 0
+    assert json.loads(out) == resolve_config(path, [('engine', 'bedtools')])
+
+
+def test_dry_run_is_the_default_command(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = write_config(tmp_path / 'build.toml', 'output_file = "lib.txt"\n')
+    code, out = run_main(['--dry-run', path, '--steps', 'combine', 'clean'])
+    assert code == 0
+    assert 'combine: would run (never run)' in out
+    assert 'clean: would run (after combine)' in out
+    assert 'fetch' not in out
+    assert not (tmp_path / 'intermediate_files' / '.runner_state.json').exists()
@@ -0,0 +1,75 @@
+# tests/test_combine_libraries.py
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.combine_libraries import combine_libraries, iter_library_chunks, library_prefix, read_libraries
+from scripts.table_io import intermediate_file, read_table
+
+# More libraries than letters, so the two-letter prefixes are used
+N_LIBRARIES = 28
+
+
+def write_libraries(input_dir, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(input_dir)
+    paths, names = [], []
+    for i in range(N_LIBRARIES):
+        n = int(rng.integers(0, 40)) if i != 3 else 0
+        df = pd.DataFrame({
+            'ID': rng.permutation(100000 + np.arange(n)).astype(str),
+            'crRNA': [''.join(rng.choice(list('ACGT'), 23)) for _ in range(n)],
+            'Chromosome': rng.choice(['chr1', 'chrX'], n),
+            'Location': rng.integers(0, 10**6, n).astype(str),
+        })
+        paths.append(os.path.join(input_dir, f'lib{i:02d}_G{i}D_sites.txt'))
+        names.append(f'G{i}D')
+        df.to_csv(paths[-1], sep='\t', index=False)
+    return paths, names
+
+
+def reference_combined(paths, names):
+    """The original row-by-row Frag_numb construction."""
+    dfs = []
+    for i, (path, name) in enumerate(zip(paths, names)):
+        df = pd.read_csv(path, sep='\t', dtype=str)
+        df.insert(0, 'Frag_numb', [f"{library_prefix(i)}{row['ID']}" for _, row in df.iterrows()])
+        df.insert(1, 'mutation', name)
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def test_library_prefixes_run_like_spreadsheet_columns():
+    assert [library_prefix(i) for i in (0, 1, 25, 26, 27, 51, 52, 701, 702)] == [
+        'A', 'B', 'Z', 'AA', 'AB', 'AZ', 'BA', 'ZZ', 'AAA']
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_parse_matches_row_by_row_reference(tmp_path, workers):
+    paths, names = write_libraries(str(tmp_path / 'input'))
+    expected = reference_combined(paths, names)
+
+    combined = pd.concat(read_libraries(paths, names, workers), ignore_index=True)
+    pd.testing.assert_frame_equal(combined, expected)
+    assert combined['Frag_numb'].str.startswith('AB').sum() == len(pd.read_csv(paths[27], sep='\t'))
+
+    chunked = pd.concat(iter_library_chunks(paths, names, chunksize=7), ignore_index=True)
+    pd.testing.assert_frame_equal(chunked, expected)
+
+
+def test_combine_libraries_uses_mapping_file_without_prompting(tmp_path, monkeypatch):
+    input_dir, output_dir = str(tmp_path / 'input'), str(tmp_path / 'out')
+    paths, names = write_libraries(input_dir)
+    names[0] = 'KRAS_G12D'
+    with open(os.path.join(input_dir, 'mutation_names.tsv'), 'w') as f:
+        f.write(f'# filename\tmutation\n{os.path.basename(paths[0])}\tKRAS_G12D\n')
+    monkeypatch.setattr('builtins.input', lambda prompt: pytest.fail('prompted'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        combine_libraries(input_dir, output_dir, prompt=False, workers=2)
+    combined = read_table(intermediate_file('1a_combined_library_messy', output_dir), dtype=str)
+    pd.testing.assert_frame_equal(combined, reference_combined(paths, names), check_dtype=False)
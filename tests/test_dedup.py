@@ -0,0 +1,81 @@
+# tests/test_dedup.py
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.dedup import Deduplicator
+
+
+def random_library(n, n_sequences, seed=0):
+    rng = np.random.default_rng(seed)
+    sequences = [''.join(rng.choice(list('ACGT'), 12)) for _ in range(n_sequences)]
+    return pd.DataFrame({
+        'Frag_numb': [f'A{i}' for i in range(n)],
+        'mutation': rng.choice(['G12D', 'G13A', 'V600E'], n),
+        'fetched_sequence': [sequences[i] for i in rng.integers(0, n_sequences, n)],
+    })
+
+
+def test_streamed_removed_rows_match_held_ones():
+    library = random_library(3000, 400)
+    held = Deduplicator()
+    held.feed(library)
+    kept, removed = held.frames()
+
+    chunks = []
+    streamed = Deduplicator(on_removed=chunks.append)
+    for lo in range(0, len(library), 700):
+        streamed.feed(library.iloc[lo:lo + 700])
+    streamed_kept, leftover = streamed.frames()
+
+    assert streamed.removed_frames == [] and leftover.empty
+    assert streamed.removed_count == len(removed)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), removed)
+    pd.testing.assert_frame_equal(streamed_kept, kept)
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        streamed.report()
+    assert f"Duplicated entries: {len(removed) + int((kept['duplicated'] == 'yes').sum())}" in out.getvalue()
+
+
+def baseline_deduplicate(df):
+    """The original row-by-row deduplication, kept as the reference."""
+    df = df.copy()
+    df.columns = [col.lower() for col in df.columns]
+    df.insert(1, "duplicated", df.duplicated(subset="fetched_sequence", keep=False).map({True: "yes", False: "no"}))
+    seen = {}
+    kept, removed = [], []
+    for _, row in df.iterrows():
+        seq, mutation = row["fetched_sequence"], row["mutation"]
+        if seq not in seen:
+            seen[seq] = row.copy()
+            kept.append(seen[seq])
+            continue
+        prev_mut = seen[seq]["mutation"]
+        if prev_mut == mutation:
+            seen[seq]["mutation"] = f"{mutation}_multi"
+        else:
+            seen[seq]["mutation"] = "_".join(sorted(set(prev_mut.split("_") + mutation.split("_"))))
+        row["kept_frag_numb"] = seen[seq]["frag_numb"]
+        removed.append(row)
+    return pd.DataFrame(kept).reset_index(drop=True), pd.DataFrame(removed).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('chunk', [None, 700])
+def test_vectorized_dedup_matches_the_row_loop(seed, chunk):
+    rng = np.random.default_rng(seed)
+    # Enough copies per sequence that the first fold levels run vectorized
+    library = random_library(4000, int(rng.integers(300, 600)), seed=seed)
+    library['mutation'] = rng.choice(['G12D', 'G13A', 'KRAS_G12C', 'V600E_multi'], len(library))
+    expected_kept, expected_removed = baseline_deduplicate(library)
+
+    dedup = Deduplicator()
+    for lo in range(0, len(library), chunk or len(library)):
+        dedup.feed(library.iloc[lo:lo + (chunk or len(library))])
+    kept, removed = dedup.frames()
+
+    pd.testing.assert_frame_equal(kept.astype(object), expected_kept.astype(object))
+    pd.testing.assert_frame_equal(removed.astype(object), expected_removed.astype(object))
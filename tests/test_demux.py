@@ -0,0 +1,36 @@
+# tests/test_demux.py
+import numpy as np
+
+from scripts.demux import AMBIGUOUS, UNMATCHED, DemuxIndex, ReadLayout, demux_windows
+
+# Pairwise at least 4 apart
+BARCODES = ['AAAAAAAA', 'AAAATTTT', 'CCCCGGGG', 'ACGTACGT']
+
+
+def demux(barcodes):
+    index = DemuxIndex([f'A{i}' for i in range(4)], BARCODES)
+    layout = ReadLayout(index.length, offset=0)
+    windows = np.array([bc.encode() for bc in barcodes], dtype=f'S{index.length}')
+    return demux_windows(windows, index, layout)
+
+
+def test_n_counts_as_the_mismatch():
+    rows, exact, unreadable = demux([
+        'AAAAAAAA',  # exact
+        'AAAAAAAC',  # one substitution, corrected
+        'CCCCGGGN',  # N, other bases match CCCCGGGG
+        'NAAAAAAA',  # N where the barcode has A, other bases match AAAAAAAA
+        'CCCCGGTN',  # N plus a substitution: two mismatches
+        'NAAAAAAC',  # N read as A would be one substitution from AAAAAAAA
+        'ANAAAAAN',  # two Ns
+    ])
+    assert rows.tolist() == [0, 0, 2, 0, UNMATCHED, UNMATCHED, UNMATCHED]
+    assert exact.tolist() == [True, False, False, False, False, False, False]
+    assert unreadable.tolist() == [False] * 6 + [True]
+
+
+def test_n_explained_by_two_barcodes_is_ambiguous():
+    index = DemuxIndex(['A0', 'A1'], ['AAAAAAAA', 'AAAAAAAC'])
+    layout = ReadLayout(index.length, offset=0)
+    rows, _, _ = demux_windows(np.array([b'AAAAAAAN'], dtype='S8'), index, layout)
+    assert rows.tolist() == [AMBIGUOUS]
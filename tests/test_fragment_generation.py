@@ -0,0 +1,70 @@
+# tests/test_fragment_generation.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.fragment_generation import LEFT_PBS, PAM_COST, PROTO_CONST, RIGHT_PBS, oligo_strings, write_oligos
+
+
+def random_bases(rng, n, width):
+    return [''.join(row) for row in rng.choice(list('ACGT'), (n, width))]
+
+
+def library(ragged, seed=0):
+    rng = np.random.default_rng(seed)
+    n = 25
+    fetched = random_bases(rng, n, 43)
+    if ragged:
+        fetched[3] = fetched[3][:40]
+        fetched[7] += 'ACG'
+    df = pd.DataFrame({
+        'frag_numb': [f'A{i + 1}' for i in range(n)],
+        'mutation': rng.choice(['KRAS_G12D', 'BRAF_V600E'], n),
+        'fetched_sequence': fetched,
+    })
+    return df, random_bases(rng, n, 14)
+
+
+def reference_oligo(bc, fs):
+    return LEFT_PBS + bc + PROTO_CONST + fs + PAM_COST + bc + RIGHT_PBS
+
+
+@pytest.mark.parametrize('ragged', [False, True])
+def test_byte_matrix_oligos_match_string_concatenation(ragged):
+    df, barcodes = library(ragged)
+    oligos = oligo_strings(barcodes, df['fetched_sequence'])
+    assert oligos.tolist() == [reference_oligo(bc, fs) for bc, fs in zip(barcodes, df['fetched_sequence'])]
+
+
+@pytest.mark.parametrize('ragged', [False, True])
+def test_written_formats_match_string_concatenation(tmp_path, ragged):
+    df, barcodes = library(ragged)
+    expected = [reference_oligo(bc, fs) for bc, fs in zip(barcodes, df['fetched_sequence'])]
+
+    tsv = tmp_path / 'library.txt'
+    write_oligos(df, barcodes, tsv, chunksize=10)
+    table = pd.read_csv(tsv, sep='\t', dtype=str, keep_default_na=False)
+    assert table.columns.tolist() == ['frag_numb', 'mutation', 'Left_PBS', 'barcode', 'proto_const',
+                                      'fetched_sequence', 'PAM_cost', 'barcode_2', 'Right_PBS', 'oligo']
+    assert table['frag_numb'].tolist() == df['frag_numb'].tolist()
+    assert table['barcode'].tolist() == table['barcode_2'].tolist() == barcodes
+    assert (table['Left_PBS'] == LEFT_PBS).all() and (table['Right_PBS'] == RIGHT_PBS).all()
+    assert table['oligo'].tolist() == expected
+
+    fasta = tmp_path / 'library.fa'
+    write_oligos(df, barcodes, fasta, chunksize=10)
+    lines = fasta.read_text().splitlines()
+    assert lines[0::2] == [f'>{name}' for name in df['frag_numb']]
+    assert lines[1::2] == expected
+
+    vendor = tmp_path / 'library.csv'
+    write_oligos(df, barcodes, vendor, chunksize=10)
+    sheet = pd.read_csv(vendor, dtype=str)
+    assert sheet['Name'].tolist() == df['frag_numb'].tolist()
+    assert sheet['Sequence'].tolist() == expected
+
+
+def test_too_few_barcodes_is_an_error(tmp_path):
+    df, barcodes = library(False)
+    with pytest.raises(ValueError, match='Not enough barcodes'):
+        write_oligos(df, barcodes[:-1], tmp_path / 'library.txt')
@@ -0,0 +1,67 @@
+# tests/test_generate_barcodes.py
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from barcode_generator.barcode_store import BarcodeStore
+from barcode_generator.bloom import BloomFilter
+from barcode_generator.generate_barcodes_numpy_bloom import generate_barcodes
+from barcode_generator.hamming_index import HammingIndex, encode_barcode, find_close_pairs
+
+
+def generate(n, store_path, length=12, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return generate_barcodes(n, length=length, min_dist=3, seed=7, store_path=store_path,
+                                 return_stats=True, **kwargs)
+
+
+def test_seeded_resume_draws_fresh_candidates(tmp_path):
+    store_path = str(tmp_path / 'barcodes.bcs')
+    first, _ = generate(3000, store_path)
+    barcodes, stats = generate(6000, store_path)
+
+    assert barcodes[:3000] == first
+    assert stats['accepted'] == 3000
+    # Replaying the first run's draws would reject each of them as a repeat
+    assert stats['duplicate'] < 50
+    values = [encode_barcode(bc) for bc in barcodes]
+    assert len(find_close_pairs(values, 12, 3)[0]) == 0
+
+
+def test_seeded_resume_is_reproducible(tmp_path):
+    runs = []
+    for name in ('a', 'b'):
+        store_path = str(tmp_path / f'{name}.bcs')
+        generate(2000, store_path)
+        runs.append(generate(4000, store_path)[0])
+    assert runs[0] == runs[1]
+
+
+def test_saturated_run_keeps_what_it_accepted(tmp_path):
+    store_path = str(tmp_path / 'barcodes.bcs')
+    # Far fewer than 500 5-mers can be pairwise 3 apart
+    with pytest.raises(RuntimeError, match='saturated'):
+        generate(500, store_path, length=5, max_stall=2000, checkpoint_every=10_000)
+
+    store = BarcodeStore(store_path)
+    assert len(store) > 0
+    # The index and Bloom sidecars were saved with everything accepted
+    assert HammingIndex.load(store.index_path).count == len(store)
+    assert BloomFilter.load(store.bloom_path).count == len(store)
+    values = np.asarray(store.values, dtype=np.uint64)
+    assert len(find_close_pairs(values, 5, 3)[0]) == 0
+
+
+@pytest.mark.parametrize('batch_size', [1024, None])
+def test_resuming_a_saturated_store_stops(tmp_path, batch_size):
+    store_path = str(tmp_path / 'barcodes.bcs')
+    with pytest.raises(RuntimeError, match='saturated'):
+        generate(500, store_path, length=5, max_stall=2000, batch_size=batch_size)
+    saved = len(BarcodeStore(store_path))
+
+    # Every draw is now a Bloom hit or too close to the stored base layer
+    with pytest.raises(RuntimeError, match='saturated'):
+        generate(500, store_path, length=5, max_stall=2000, batch_size=batch_size, checkpoint_every=1)
+    assert len(BarcodeStore(store_path)) >= saved
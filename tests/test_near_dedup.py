@@ -0,0 +1,60 @@
+# tests/test_near_dedup.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.near_dedup import collapse_near_duplicates, find_near_pairs, near_duplicate_clusters, sequence_matrix
+
+
+def mutated_library(n, width, seed):
+    """Random windows, about half of them copies of an earlier one with 1-3 substitutions."""
+    rng = np.random.default_rng(seed)
+    matrix = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, (n, width))]
+    for row in range(1, n):
+        if rng.random() < 0.5:
+            matrix[row] = matrix[rng.integers(0, row)]
+            cols = rng.choice(width, rng.integers(1, 4), replace=False)
+            matrix[row, cols] = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, len(cols))]
+    return [row.tobytes().decode() for row in matrix]
+
+
+@pytest.mark.parametrize('max_mismatches', [1, 2, 3])
+def test_seeded_buckets_find_every_close_pair(max_mismatches):
+    sequences = mutated_library(400, 43, seed=max_mismatches)
+    matrix = sequence_matrix(sequences)
+    i, j, distance = find_near_pairs(matrix, max_mismatches)
+
+    all_distances = (matrix[:, None, :] != matrix[None, :, :]).sum(axis=2)
+    expected_i, expected_j = np.nonzero(np.triu(all_distances <= max_mismatches, k=1))
+    assert sorted(zip(i.tolist(), j.tolist())) == sorted(zip(expected_i.tolist(), expected_j.tolist()))
+    assert (distance == all_distances[i, j]).all()
+
+
+def test_clusters_fold_into_the_earliest_kept_row():
+    sequences = ['AAAAAAAA', 'AAAAAAAC', 'AAAAAACC', 'GGGGGGGG', np.nan, 'AAAAAAAT', 'GGGGGGGGG']
+    rep, dist = near_duplicate_clusters(sequences, 1)
+    # AAAAAACC is one from AAAAAAAC, which already joined AAAAAAAA: clusters never chain
+    assert rep.tolist() == [0, 0, 2, 3, 4, 0, 6]
+    assert dist.tolist() == [0, 1, 0, 0, 0, 1, 0]
+
+
+def test_merge_moves_members_and_repoints_exact_copies():
+    deduplicated = pd.DataFrame({
+        'frag_numb': ['A1', 'B1', 'A2'],
+        'duplicated': ['no', 'yes', 'no'],
+        'mutation': ['G12D', 'V600E', 'G13A'],
+        'fetched_sequence': ['ACGTACGT', 'ACGTACGA', 'TTTTTTTT'],
+    })
+    removed = pd.DataFrame({
+        'frag_numb': ['B2'], 'duplicated': ['yes'], 'mutation': ['V600E'],
+        'fetched_sequence': ['ACGTACGA'], 'kept_frag_numb': ['B1'],
+    })
+    kept, filtered_out, clusters = collapse_near_duplicates(deduplicated, removed, 1)
+
+    assert kept['frag_numb'].tolist() == ['A1', 'A2']
+    assert kept['mutation'].tolist() == ['G12D_V600E', 'G13A']
+    assert kept['duplicated'].tolist() == ['yes', 'no']
+    assert filtered_out['frag_numb'].tolist() == ['B2', 'B1']
+    assert filtered_out['kept_frag_numb'].tolist() == ['A1', 'A1']
+    assert filtered_out['near_mismatches'].tolist() == [0, 1]
+    assert clusters.to_dict('records') == [{'kept_frag_numb': 'A1', 'frag_numb': 'B1', 'near_mismatches': 1}]
@@ -0,0 +1,89 @@
+# tests/test_oligo_qc.py
+import numpy as np
+import pytest
+
+from scripts.fragment_generation import LEFT_PBS, RIGHT_PBS, oligo_strings
+from scripts.oligo_qc import GC_RANGE, GC_WINDOW, MAX_HOMOPOLYMER, TYPE_IIS_SITES, reverse_complement, scan_oligos
+
+# One site longer than the lookup table's 12 bases
+SITES = dict(TYPE_IIS_SITES, LongSite='ACGTTGCAAGGCTTAC')
+
+
+def random_seq(rng, width):
+    return ''.join(rng.choice(list('ACGT'), width))
+
+
+def planted_library(n, barcode_length, seed):
+    """Random oligos, most with a site, a long run, an N or another oligo's barcode planted in the fragment."""
+    rng = np.random.default_rng(seed)
+    barcodes = [random_seq(rng, barcode_length) for _ in range(n)]
+    fragments = []
+    for _ in range(n):
+        fragment = random_seq(rng, 43)
+        planted = rng.choice(['site', 'run', 'n', 'barcode', 'rc', 'none'])
+        if planted == 'site':
+            site = SITES[rng.choice(list(SITES))]
+            insert = site if rng.random() < 0.5 else reverse_complement(site)
+        elif planted == 'run':
+            insert = rng.choice(list('ACGT')) * int(rng.integers(5, 10))
+        elif planted == 'n':
+            insert = 'N'
+        elif planted in ('barcode', 'rc'):
+            insert = barcodes[rng.integers(n)]
+            insert = insert if planted == 'barcode' else reverse_complement(insert)
+        else:
+            insert = ''
+        at = int(rng.integers(0, 43 - len(insert) + 1))
+        fragment = fragment[:at] + insert + fragment[at + len(insert):]
+        fragments.append(fragment.lower() if rng.random() < 0.1 else fragment)
+    return list(oligo_strings(barcodes, fragments)), barcodes
+
+
+def reference_flags(oligo, barcode, all_barcodes):
+    """Per-oligo QC with plain string operations."""
+    seq = oligo.upper()
+    run = best = 1
+    for a, b in zip(seq, seq[1:]):
+        run = run + 1 if a == b else 1
+        best = max(best, run)
+
+    gc = [sum(base in 'GC' for base in seq[i:i + GC_WINDOW]) / GC_WINDOW for i in range(len(seq) - GC_WINDOW + 1)]
+    gc = gc or [sum(base in 'GC' for base in seq) / len(seq)]
+
+    sites = [name for name, site in SITES.items() if site in seq or reverse_complement(site) in seq]
+
+    k = len(barcode)
+    library = set(all_barcodes) | {reverse_complement(bc) for bc in all_barcodes}
+    own_slots = {len(LEFT_PBS), len(seq) - len(RIGHT_PBS) - k}
+    hits = sum(seq[i:i + k] in library and not (seq[i:i + k] == barcode and i in own_slots)
+               for i in range(len(seq) - k + 1))
+    return best, min(gc), max(gc), ';'.join(sites), hits
+
+
+@pytest.mark.parametrize('barcode_length', [10, 16])
+def test_vectorized_scan_matches_per_oligo_reference(barcode_length):
+    oligos, barcodes = planted_library(300, barcode_length, seed=barcode_length)
+    flags = scan_oligos(oligos, barcodes, sites=SITES, chunksize=64)
+
+    expected = [reference_flags(oligo, bc, barcodes) for oligo, bc in zip(oligos, barcodes)]
+    runs, low, high, sites, hits = map(list, zip(*expected))
+    assert flags['length'].tolist() == [len(oligo) for oligo in oligos]
+    assert flags['max_homopolymer'].tolist() == runs
+    np.testing.assert_allclose(flags['min_window_gc'], low)
+    np.testing.assert_allclose(flags['max_window_gc'], high)
+    assert flags['forbidden_sites'].tolist() == sites
+    assert flags['barcode_hits'].tolist() == hits
+
+    # Every kind of flag is exercised, and pass means no flag at all
+    labels = ';'.join(flags['flags'])
+    for check in ('homopolymer', 'site', 'barcode'):
+        assert check in labels
+    failed = ((np.array(runs) > MAX_HOMOPOLYMER) | (np.array(low) < GC_RANGE[0]) | (np.array(high) > GC_RANGE[1])
+              | (np.array(sites) != '') | (np.array(hits) > 0))
+    assert flags['pass'].tolist() == (~failed).tolist()
+
+
+def test_short_oligos_fall_back_to_whole_oligo_gc():
+    flags = scan_oligos(['GGCCAT', 'ATATATAT'], gc_window=50, sites={})
+    assert flags['min_window_gc'].tolist() == flags['max_window_gc'].tolist() == [4 / 6, 0.0]
+    assert flags['barcode_hits'].tolist() == [0, 0]
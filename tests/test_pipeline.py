@@ -0,0 +1,37 @@
+# tests/test_pipeline.py
+import contextlib
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.pipeline_benchmark import pipeline_steps, synthetic_barcodes, synthetic_genome, synthetic_libraries
+from scripts.pipeline import INTERMEDIATE_FILES, run_in_memory
+from scripts.table_io import intermediate_file, read_table
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    chroms = synthetic_genome(str(tmp_path / 'genome.fa'), n_chroms=2, chrom_length=100_000)
+    synthetic_libraries(str(tmp_path / 'Input_libraries'), chroms, 3000, n_libraries=3)
+    synthetic_barcodes(str(tmp_path / 'barcodes.txt'), 20_000)
+    return str(tmp_path)
+
+
+def test_in_memory_intermediates_match_the_file_pipeline(workdir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _, step in pipeline_steps(workdir):
+            step()
+        run_in_memory(os.path.join(workdir, 'in_memory.txt'), os.path.join(workdir, 'Input_libraries'),
+                      os.path.join(workdir, 'genome.fa'), os.path.join(workdir, 'barcodes.txt'), chunksize=700,
+                      write_intermediates=True, intermediate_dir=os.path.join(workdir, 'in_memory'),
+                      cache_dir=None, variant_select='first', prompt=False)
+
+    for name in INTERMEDIATE_FILES.values():
+        # Same file names (and so the same format) in both modes
+        by_step = intermediate_file(name, os.path.join(workdir, 'intermediate_files'))
+        in_memory = intermediate_file(name, os.path.join(workdir, 'in_memory'))
+        pd.testing.assert_frame_equal(read_table(in_memory, dtype=str), read_table(by_step, dtype=str))
+    assert sorted(os.listdir(os.path.join(workdir, 'in_memory'))) == sorted(
+        os.path.basename(intermediate_file(name)) for name in INTERMEDIATE_FILES.values())
@@ -0,0 +1,80 @@
+# tests/test_profiling.py
+import contextlib
+import io
+import json
+import os
+
+import pytest
+
+from scripts import profiling
+from scripts.profiling import phase, record_rows, stage, staged
+
+
+def test_hooks_are_no_ops_without_a_report():
+    assert profiling._report is None
+    with stage('combine') as record:
+        with phase('parse'):
+            record_rows(10, 5)
+    assert record is None
+    assert list(staged([[1], [2, 3]], 'combine')) == [[1], [2, 3]]
+
+
+def test_report_accumulates_stages_phases_and_rows(tmp_path):
+    path = tmp_path / 'report.json'
+    with contextlib.redirect_stdout(io.StringIO()):
+        with profiling.profiling(str(path)):
+            for chunk in staged([[1, 2], [3, 4, 5]], 'combine'):
+                with stage('clean'):
+                    with phase('strip'):
+                        sum(range(10_000))
+                    with phase('strip'):
+                        pass
+                    record_rows(len(chunk), len(chunk) - 1)
+            # Phases outside any stage and nested stages still land somewhere sensible
+            with phase('orphan'):
+                pass
+            with stage('fragments'):
+                with stage('barcodes'):
+                    record_rows(rows_out=7)
+    assert profiling._report is None
+
+    with open(path) as f:
+        report = json.load(f)
+    stages = report['stages']
+    assert set(stages) == {'combine', 'clean', 'fragments', 'barcodes'}
+    # staged() times each pull, including the last one that finds the end
+    assert stages['combine']['calls'] == 3
+    assert stages['combine']['rows_out'] == 5
+    assert (stages['clean']['calls'], stages['clean']['rows_in'], stages['clean']['rows_out']) == (2, 5, 3)
+    assert stages['clean']['phases']['strip']['calls'] == 4
+    assert stages['barcodes']['rows_out'] == 7 and stages['fragments']['rows_out'] == 0
+    assert stages['fragments']['wall_s'] >= stages['barcodes']['wall_s']
+    for record in stages.values():
+        assert record['wall_s'] >= 0 and record['cpu_s'] >= 0 and record['peak_rss_mb'] > 0
+    assert stages['clean']['rows_per_s'] > 0
+
+
+def test_report_is_written_when_a_stage_fails(tmp_path):
+    path = tmp_path / 'report.json'
+    with pytest.raises(RuntimeError):
+        with contextlib.redirect_stdout(io.StringIO()):
+            with profiling.profiling(str(path)):
+                with stage('generate_barcodes'):
+                    raise RuntimeError('saturated')
+    with open(path) as f:
+        assert json.load(f)['stages']['generate_barcodes']['calls'] == 1
+    assert profiling._report is None
+
+
+def test_cprofile_and_memory_tracing(tmp_path):
+    path = tmp_path / 'run' / 'report.json'
+    with contextlib.redirect_stdout(io.StringIO()):
+        with profiling.profiling(str(path), cprofile=True, trace_memory=True):
+            with stage('dedup'):
+                blocks = [bytearray(1 << 16) for _ in range(64)]
+                del blocks
+    with open(path) as f:
+        record = json.load(f)['stages']['dedup']
+    assert os.path.exists(tmp_path / 'run' / 'report_profiles' / 'dedup.prof')
+    assert record['traced_peak_mb'] >= 4
+    assert record['top_allocations']
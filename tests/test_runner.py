@@ -0,0 +1,98 @@
+# tests/test_runner.py
+import contextlib
+import io
+import os
+
+import pytest
+
+from scripts.runner import Step, file_digest, run_steps
+
+calls = []
+
+
+def upper_step(input_file, output_file, suffix=''):
+    calls.append('upper')
+    with open(input_file) as f, open(output_file, 'w') as out:
+        out.write(f.read().upper() + suffix)
+
+
+def count_step(input_file, output_file):
+    calls.append('count')
+    with open(input_file) as f, open(output_file, 'w') as out:
+        out.write(str(len(f.read())))
+
+
+def steps(tmp_path, suffix=''):
+    source, middle, result = (str(tmp_path / name) for name in ('in.txt', 'mid.txt', 'out.txt'))
+    return [
+        Step('upper', upper_step, [source], [middle], dict(input_file=source, output_file=middle, suffix=suffix)),
+        Step('count', count_step, [middle], [result], dict(input_file=middle, output_file=result)),
+    ]
+
+
+def run(tmp_path, suffix='', **kwargs):
+    calls.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = run_steps(steps(tmp_path, suffix), state_file=str(tmp_path / 'state.json'), **kwargs)
+    return [(name, action) for name, action, _ in plan]
+
+
+def test_steps_rerun_only_when_their_inputs_change(tmp_path):
+    (tmp_path / 'in.txt').write_text('acgt')
+    assert run(tmp_path) == [('upper', 'run'), ('count', 'run')]
+    assert run(tmp_path) == [('upper', 'skip'), ('count', 'skip')]
+    assert calls == []
+
+    # New input bytes, same output: the downstream step stays skipped
+    (tmp_path / 'in.txt').write_text('ACGT')
+    assert run(tmp_path) == [('upper', 'run'), ('count', 'skip')]
+
+    (tmp_path / 'in.txt').write_text('acgtacgt')
+    assert run(tmp_path) == [('upper', 'run'), ('count', 'run')]
+    assert (tmp_path / 'out.txt').read_text() == '8'
+
+    assert run(tmp_path, suffix='N') == [('upper', 'run'), ('count', 'run')]
+    assert run(tmp_path, suffix='N', force=('count',)) == [('upper', 'skip'), ('count', 'run')]
+
+    (tmp_path / 'out.txt').write_text('edited')
+    assert run(tmp_path, suffix='N') == [('upper', 'skip'), ('count', 'run')]
+    os.remove(tmp_path / 'mid.txt')
+    assert run(tmp_path, suffix='N') == [('upper', 'run'), ('count', 'skip')]
+
+
+def test_dry_run_reports_without_running(tmp_path):
+    (tmp_path / 'in.txt').write_text('acgt')
+    assert run(tmp_path, dry_run=True) == [('upper', 'would run'), ('count', 'would run')]
+    assert calls == [] and not (tmp_path / 'mid.txt').exists()
+
+    run(tmp_path)
+    (tmp_path / 'in.txt').write_text('acgtt')
+    calls.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = run_steps(steps(tmp_path), state_file=str(tmp_path / 'state.json'), dry_run=True)
+    assert plan == [('upper', 'would run', 'inputs, parameters or code changed'),
+                    ('count', 'would run', 'after upper')]
+    assert calls == [] and (tmp_path / 'out.txt').read_text() == '4'
+
+
+def test_missing_input_is_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError, match='upper: input not found'):
+        run(tmp_path)
+
+
+def test_file_digest_is_memoized_on_size_and_mtime(tmp_path):
+    path = str(tmp_path / 'genome.fa')
+    with open(path, 'w') as f:
+        f.write('ACGT')
+    memo = {}
+    digest = file_digest(path, memo)
+    stat = os.stat(path)
+
+    # Same size and mtime: the memo answers without reading the file
+    with open(path, 'w') as f:
+        f.write('TTTT')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert file_digest(path, memo) == digest
+
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert file_digest(path, memo) != digest
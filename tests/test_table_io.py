@@ -0,0 +1,37 @@
+# tests/test_table_io.py
+import numpy as np
+import pandas as pd
+
+from scripts.table_io import read_table, write_table
+
+
+def mixed_frame():
+    return pd.DataFrame({
+        'Frag_numb': ['A1', 'A2', 'B10'],
+        'mutation': ['G12D', 'G12D', 'V600E'],
+        'Location': [1000, 20_000_000, 7],
+        'Mismatches': pd.array([1, None, 3], dtype='Int64'),
+        'score': [0.5, 1.25, np.nan],
+        'fetched_sequence': ['ACGTacgt', 'TTTTGGGG', np.nan],
+    })
+
+
+def test_dtype_str_reads_both_formats_alike(tmp_path):
+    frames = {}
+    for suffix in ('.npz', '.txt'):
+        path = str(tmp_path / f'table{suffix}')
+        write_table(mixed_frame(), path)
+        frames[suffix] = read_table(path, dtype=str)
+
+    pd.testing.assert_frame_equal(frames['.npz'], frames['.txt'])
+    assert frames['.npz']['Location'].tolist() == ['1000', '20000000', '7']
+    assert frames['.npz']['Mismatches'].isna().tolist() == [False, True, False]
+
+
+def test_columnar_round_trip_keeps_types(tmp_path):
+    path = str(tmp_path / 'table.npz')
+    write_table(mixed_frame(), path)
+    df = read_table(path)
+    assert df['Location'].dtype == np.int64
+    assert isinstance(df['mutation'].dtype, pd.CategoricalDtype)
+    assert df['fetched_sequence'].tolist()[:2] == ['ACGTacgt', 'TTTTGGGG']
@@ -0,0 +1,47 @@
+# tests/test_variant_frag.py
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from scripts.table_io import read_table, write_table
+from scripts.variant_frag import print_single_mismatch
+
+DNA = 'ACGTACGTACGTACGTACGTACGTNGG'
+
+
+def deduplicated_library():
+    # Mutations appear out of alphabetical order, and one has two candidate sites;
+    # A0 matches perfectly, so every rule must pass over it
+    rows = [('A0', 'KRAS_G12D', 0, 0), ('A1', 'TP53_R175H', 1, 0), ('A2', 'KRAS_G12D', 2, 0), ('A3', 'BRAF_V600E', 1, 0),
+            ('A4', 'KRAS_G12D', 1, 0), ('A5', 'BRAF_V600E', 0, 1), ('A6', 'EGFR_L858R', 1, 0)]
+    records = []
+    for frag, mutation, mismatches, bulge in rows:
+        dna = DNA[:3] + 'A' + DNA[4:] if mismatches else DNA
+        records.append({'frag_numb': frag, 'mutation': mutation, 'Chromosome': 'chr1',
+                        'Location': 1000 + len(records), 'Direction': '+',
+                        'crrna': DNA[:-3] + 'NNN', 'dna': dna, 'mismatches': mismatches, 'bulge_size': bulge,
+                        'fetched_sequence': 'GGGGGGGGGG' + dna + 'CCCCCCC'})
+    return pd.DataFrame(records)
+
+
+@pytest.mark.parametrize('select', ['prompt', 'first', 'min_mismatches', 'lowest_frag_numb'])
+def test_npz_and_tsv_intermediates_pick_the_same_variants(tmp_path, monkeypatch, select):
+    monkeypatch.setattr('builtins.input', lambda prompt: '1')
+    library = deduplicated_library()
+    outputs = {}
+    for suffix in ('.npz', '.txt'):
+        input_file = str(tmp_path / f'4a{suffix}')
+        output_file = str(tmp_path / f'5a_{select}{suffix}')
+        write_table(library, input_file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            print_single_mismatch(input_file, output_file, select=select)
+        outputs[suffix] = read_table(output_file).astype(str)
+
+    pd.testing.assert_frame_equal(outputs['.npz'], outputs['.txt'])
+    variants = outputs['.txt'].iloc[:4]
+    assert variants['mutation'].tolist() == ['BRAF_V600E', 'EGFR_L858R', 'KRAS_G12D', 'TP53_R175H']
+    assert variants['frag_numb'].tolist()[0] == 'A-variant'
+    # A2 has too many mismatches, leaving A4 as KRAS's only site
+    assert variants.loc[variants['mutation'] == 'KRAS_G12D', 'Location'].tolist() == ['1004']